@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from .embedding_format import MODEL_VERSION, decode_embedding, encode_embedding
+import datetime
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./attendance.db"
 
@@ -92,4 +94,84 @@ def migrate_database_schema():
                     print(f"  ✗ Error adding photo_capture: {e}")
         else:
             print("[Migration v2.11.0] photo_capture column already exists")
+    
+    # Per-camera detection settings
+    if 'cameras' in inspector.get_table_names():
+        camera_columns = [col['name'] for col in inspector.get_columns('cameras')]
+        new_columns = {
+            'roi_detection': "INTEGER DEFAULT 0",
+            'motion_sensitivity': "INTEGER DEFAULT 50",
+        }
+        
+        for col, ddl in new_columns.items():
+            if col in camera_columns:
+                continue
+            print(f"[Migration] Adding {col} column to cameras...")
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text(f"ALTER TABLE cameras ADD COLUMN {col} {ddl}"))
+                    conn.commit()
+                    print(f"  ✓ Added {col} column")
+            except Exception as e:
+                if "duplicate column name" not in str(e).lower():
+                    print(f"  ✗ Error adding {col}: {e}")
+    
+    # Embeddings: Employee.embedding1-6 -> face_embeddings table (raw float32 format)
+    migrate_embedding_table()
 
+def migrate_embedding_table():
+    """
+    One-shot copy of the legacy Employee.embedding1-6 columns (pickled or raw)
+    into face_embeddings, slots 1-6, re-encoded in the raw embedding_format.
+    Employees that already have rows are skipped, so once copied this is a
+    single cheap query at startup. The legacy columns are left in place.
+    """
+    from .models import FaceEmbedding, SystemSettings  # models imports this module
+    FaceEmbedding.__table__.create(bind=engine, checkfirst=True)
+    SystemSettings.__table__.create(bind=engine, checkfirst=True)
+    
+    existing_columns = {col['name'] for col in inspect(engine).get_columns('employees')}
+    columns = [f"embedding{i}" for i in range(1, 7) if f"embedding{i}" in existing_columns]
+    if not columns:
+        return
+    
+    has_legacy = " OR ".join(f"e.{col} IS NOT NULL" for col in columns)
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            f"SELECT e.id, {', '.join('e.' + col for col in columns)} FROM employees e "
+            f"WHERE ({has_legacy}) AND NOT EXISTS "
+            f"(SELECT 1 FROM face_embeddings f WHERE f.employee_id = e.id)"
+        )).fetchall()
+        if not rows:
+            return
+        
+        print(f"[Migration] Copying embeddings of {len(rows)} employees to face_embeddings...")
+        now = datetime.datetime.now()
+        values = []
+        for row in rows:
+            for col, blob in zip(columns, row[1:]):
+                if not blob:
+                    continue
+                try:
+                    vector = encode_embedding(decode_embedding(blob))
+                except Exception as e:
+                    print(f"  ✗ Employee {row[0]} {col}: {e}")
+                    continue
+                values.append({
+                    "employee_id": row[0], "slot": int(col[len("embedding"):]),
+                    "model_version": MODEL_VERSION, "vector": vector, "updated_at": now
+                })
+        
+        if values:
+            conn.execute(text(
+                "INSERT INTO face_embeddings (employee_id, slot, model_version, vector, updated_at) "
+                "VALUES (:employee_id, :slot, :model_version, :vector, :updated_at)"
+            ), values)
+            conn.commit()
+            
+            # Invalidate the gallery snapshot
+            from .services import embedding_store
+            with SessionLocal() as db:
+                embedding_store.bump_generation(db)
+                db.commit()
+        print(f"  ✓ Copied {len(values)} embeddings")
@@ -0,0 +1,83 @@
+"""
+Storage format of face embeddings (face_embeddings.vector, legacy
+Employee.embedding1..6 BLOBs).
+
+Version 1: an 8-byte header (magic b"FE", format version, dtype code,
+uint32 dimension) followed by the little-endian float32 vector. Decoding is
+np.frombuffer (no unpickling, no NumPy-version dependence); a list of blobs is
+joined straight into one gallery matrix.
+
+Legacy blobs (pickle.dumps(ndarray)) are still read during the transition;
+database.migrate_embedding_table() re-encodes them into face_embeddings.
+"""
+import pickle
+import struct
+
+import numpy as np
+
+# Embedding space of the stored vectors (face_embeddings.model_version). The INT8 pack
+# is a quantization of the same recognizer, so its embeddings share this space.
+MODEL_VERSION = "buffalo_l"
+
+MAGIC = b"FE"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<2sBcI")  # magic, version, dtype code, dimension (8 bytes)
+DTYPES = {b"f": np.dtype("<f4")}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+
+def is_raw(blob):
+    """True for the versioned raw format, False for a legacy pickle"""
+    return blob[:len(MAGIC)] == MAGIC
+
+
+def encode_embedding(embedding):
+    """Versioned raw bytes of a 1-D float32 embedding"""
+    vector = np.ascontiguousarray(embedding, dtype=DTYPES[b"f"]).ravel()
+    return HEADER.pack(MAGIC, FORMAT_VERSION, DTYPE_CODES[vector.dtype], vector.size) + vector.tobytes()
+
+
+def decode_header(blob):
+    """(dtype, dimension) of a raw blob; ValueError if it is malformed"""
+    if len(blob) < HEADER.size:
+        raise ValueError("Embedding blob shorter than its header")
+    magic, version, code, dim = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != FORMAT_VERSION or code not in DTYPES:
+        raise ValueError(f"Unsupported embedding format (version {version}, dtype {code!r})")
+    dtype = DTYPES[code]
+    if len(blob) != HEADER.size + dim * dtype.itemsize:
+        raise ValueError(f"Embedding blob size does not match its dimension ({dim})")
+    return dtype, dim
+
+
+def decode_embedding(blob):
+    """
+    1-D float32 embedding from either format
+    Raw blobs are decoded as a read-only view of `blob` (no copy).
+    """
+    if not is_raw(blob):
+        return np.asarray(pickle.loads(blob), dtype=np.float32).ravel()
+    dtype, dim = decode_header(blob)
+    return np.frombuffer(blob, dtype=dtype, count=dim, offset=HEADER.size)
+
+
+def decode_embeddings(blobs):
+    """
+    (N, D) writable float32 matrix from a list of blobs
+    When every blob is raw with the same header, the payloads are joined in one
+    pass and viewed as the matrix (no per-vector array objects).
+    Returns an empty (0, 0) matrix for no blobs.
+    """
+    if len(blobs) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    first = blobs[0]
+    if is_raw(first):
+        decode_header(first)
+        header = first[:HEADER.size]
+        if all(blob[:HEADER.size] == header and len(blob) == len(first) for blob in blobs):
+            payload = bytearray().join(memoryview(blob)[HEADER.size:] for blob in blobs)
+            return np.frombuffer(payload, dtype=DTYPES[b"f"]).reshape(len(blobs), -1)
+
+    # Mixed or legacy blobs: decode one by one
+    return np.stack([decode_embedding(blob) for blob in blobs]).astype(np.float32, copy=False)
@@ -0,0 +1,415 @@
+"""
+Stateless InsightFace pipeline: model loading, detection, face filtering and
+batched embedding, plus the inference worker process loop.
+
+Kept outside app.services on purpose: importing that package creates the
+service singletons (models, gallery, cameras), which inference worker
+processes must not do.
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+import onnxruntime
+from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import face_align
+
+# Faces smaller than this (px, either side) are never recognized
+MIN_FACE_SIZE = 80
+
+# Detector input size (square, as passed to FaceAnalysis.prepare)
+DET_SIZE = 640
+
+# Centered-ROI detection: is_face_centered's acceptance zone (central 50%)
+# plus this margin (fraction of the frame) on each side
+ROI_MARGIN = 0.1
+
+# Best-shot scoring: faces this large (px, shorter side) score full marks on size
+QUALITY_FULL_SIZE = 2 * MIN_FACE_SIZE
+# Laplacian variance of the 64x64 grayscale face at which sharpness saturates
+QUALITY_SHARPNESS_REF = 150.0
+
+# Texture liveness: color on the aligned ArcFace crop, sharpness on the central
+# LIVENESS_CROP_SIZE pixels at frame scale (detail_crops)
+# Laplacian variance there: real faces 65-325, photos/screens 6-65 (the former
+# 100-500 / 10-100 bounds on whole bbox crops, x0.65 measured on the same faces)
+LIVENESS_CROP_SIZE = 112
+LIVENESS_SHARPNESS_LOW = 65.0
+LIVENESS_SHARPNESS_HIGH = 325.0
+LIVENESS_SATURATION_STD = 50.0
+
+# InsightFace model packs: FP32 originals and the INT8 variants built by quantize_models.py
+MODEL_ROOT = os.path.expanduser('~/.insightface')
+FP32_MODEL_PACK = 'buffalo_l'
+INT8_MODEL_PACK = 'buffalo_l_int8'
+
+
+def model_pack_dir(name, root=MODEL_ROOT):
+    return os.path.join(root, 'models', name)
+
+
+def resolve_model_pack(precision=None):
+    """
+    Model pack for FACE_MODEL_PRECISION (fp32 | int8)
+    int8 falls back to fp32 until the quantized pack has been generated.
+    """
+    precision = (precision or os.getenv("FACE_MODEL_PRECISION", "fp32")).lower()
+    if precision != 'int8':
+        return FP32_MODEL_PACK
+
+    int8_dir = model_pack_dir(INT8_MODEL_PACK)
+    if os.path.isdir(int8_dir) and any(f.endswith('.onnx') for f in os.listdir(int8_dir)):
+        return INT8_MODEL_PACK
+
+    print(f"INT8 models not found in {int8_dir}, using FP32. Run quantize_models.py to build them.")
+    return FP32_MODEL_PACK
+
+
+def create_face_analysis(intra_op_threads=0, det_size=(DET_SIZE, DET_SIZE), precision=None):
+    """
+    Load buffalo_l (detection + recognition), FP32 or INT8
+    intra_op_threads: ONNX Runtime threads per session (0 = runtime default, all cores)
+    """
+    sess_options = onnxruntime.SessionOptions()
+    if intra_op_threads > 0:
+        sess_options.intra_op_num_threads = intra_op_threads
+        sess_options.inter_op_num_threads = 1
+
+    app = FaceAnalysis(
+        name=resolve_model_pack(precision),
+        root=MODEL_ROOT,
+        providers=['CPUExecutionProvider'],
+        allowed_modules=['detection', 'recognition'],
+        sess_options=sess_options
+    )
+    app.prepare(ctx_id=0, det_size=det_size)
+    return app
+
+
+def is_face_centered(bbox, img_w, img_h):
+    """Check if face is in central zone (50% of frame)"""
+    x1, y1, x2, y2 = bbox
+    face_cx = (x1 + x2) / 2
+    face_cy = (y1 + y2) / 2
+
+    img_cx = img_w / 2
+    img_cy = img_h / 2
+
+    zone_w = img_w * 0.5
+    zone_h = img_h * 0.5
+
+    zone_x1 = img_cx - zone_w / 2
+    zone_y1 = img_cy - zone_h / 2
+    zone_x2 = img_cx + zone_w / 2
+    zone_y2 = img_cy + zone_h / 2
+
+    return (zone_x1 <= face_cx <= zone_x2 and zone_y1 <= face_cy <= zone_y2)
+
+
+def is_recognizable(face, img_w, img_h):
+    """Size and centering filters, applied to raw detections before embedding"""
+    bbox_w = face.bbox[2] - face.bbox[0]
+    bbox_h = face.bbox[3] - face.bbox[1]
+    if bbox_w < MIN_FACE_SIZE or bbox_h < MIN_FACE_SIZE:
+        return False
+    return is_face_centered(face.bbox, img_w, img_h)
+
+
+def face_quality(frame, face):
+    """
+    Cheap best-shot score in [0, 1]: size x sharpness x pose
+    Pose comes from the 5 detection keypoints (nose offset for yaw, eye line for roll).
+    """
+    x1, y1, x2, y2 = face.bbox
+    size = min(1.0, min(x2 - x1, y2 - y1) / QUALITY_FULL_SIZE)
+
+    ix1, iy1 = max(0, int(x1)), max(0, int(y1))
+    ix2, iy2 = min(frame.shape[1], int(x2)), min(frame.shape[0], int(y2))
+    if ix2 - ix1 < 2 or iy2 - iy1 < 2:
+        return 0.0
+    gray = cv2.cvtColor(cv2.resize(frame[iy1:iy2, ix1:ix2], (64, 64)), cv2.COLOR_BGR2GRAY)
+    sharpness = min(1.0, cv2.Laplacian(gray, cv2.CV_32F).var() / QUALITY_SHARPNESS_REF)
+
+    pose = 1.0
+    if face.kps is not None:
+        left_eye, right_eye, nose = face.kps[0], face.kps[1], face.kps[2]
+        eye_dx, eye_dy = right_eye - left_eye
+        eye_dist = max(float(np.hypot(eye_dx, eye_dy)), 1.0)
+        # Nose drifts toward one eye as the head turns; ~0.5 of the eye distance is near profile
+        yaw = abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_dist
+        # Alignment removes in-plane rotation, so only strong roll is penalized
+        roll = abs(np.degrees(np.arctan2(eye_dy, eye_dx)))
+        pose = max(0.0, 1 - yaw / 0.6) * max(0.0, 1 - max(0.0, roll - 15) / 30)
+
+    return float(size * sharpness * pose)
+
+
+def aligned_crops(frame, faces, size=LIVENESS_CROP_SIZE):
+    """ArcFace-aligned crops of `faces` as one (N, size, size, 3) uint8 stack"""
+    if not faces:
+        return np.empty((0, size, size, 3), dtype=np.uint8)
+    return np.stack([face_align.norm_crop(frame, landmark=face.kps, image_size=size) for face in faces])
+
+
+def detail_crops(frame, faces, size=LIVENESS_CROP_SIZE):
+    """
+    Aligned crops of `faces` never downscaled below the frame's pixel scale, as
+    one (N, size, size, 3) uint8 stack: faces larger than the ArcFace template
+    give their central size x size pixels instead of a shrunk whole face.
+    Sharpness has to be measured there: shrinking a close-up hides its blur.
+    """
+    if not faces:
+        return np.empty((0, size, size, 3), dtype=np.uint8)
+    center = face_align.arcface_dst.mean(axis=0) * (size / 112.0)
+    crops = []
+    for face in faces:
+        M = face_align.estimate_norm(face.kps, image_size=size)
+        scale = np.sqrt(abs(np.linalg.det(M[:, :2])))
+        if scale < 1.0:
+            # Same alignment, zoomed around the template center back to 1 frame px = 1 crop px
+            M = np.hstack([M[:, :2] / scale, ((M[:, 2] - center) / scale + center)[:, None]])
+        crops.append(cv2.warpAffine(frame, M, (size, size), borderValue=0.0))
+    return np.stack(crops)
+
+
+def sharpness_scores(crops):
+    """
+    Sharpness term of texture liveness for a stack of equally sized BGR (or
+    grayscale) crops: 4-neighbour Laplacian variance (same kernel as
+    cv2.Laplacian ksize=1, interior pixels) mapped to [0, 1]
+    """
+    if crops.ndim == 4:
+        b, g, r = (crops[..., c].astype(np.float32) for c in range(3))
+        gray = b * 0.114 + g * 0.587 + r * 0.299
+    else:
+        gray = crops.astype(np.float32)
+    n = len(crops)
+
+    lap = (gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] + gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:]
+           - 4 * gray[:, 1:-1, 1:-1])
+    lap_var = lap.reshape(n, -1).var(axis=1)
+    score = np.where(
+        lap_var > LIVENESS_SHARPNESS_LOW,
+        (lap_var - LIVENESS_SHARPNESS_LOW) / (LIVENESS_SHARPNESS_HIGH - LIVENESS_SHARPNESS_LOW),
+        lap_var / LIVENESS_SHARPNESS_LOW
+    )
+    return np.minimum(score, 1.0)
+
+
+def color_scores(crops):
+    """Color term of texture liveness: spread of the HSV saturation (OpenCV 8-bit scale), in [0, 1]"""
+    b, g, r = (crops[..., c].astype(np.float32) for c in range(3))
+    # Saturation without the full color conversion
+    v = np.maximum(np.maximum(b, g), r)
+    spread = v - np.minimum(np.minimum(b, g), r)
+    saturation = 255 * spread / np.maximum(v, 1)
+    return np.minimum(saturation.reshape(len(crops), -1).std(axis=1) / LIVENESS_SATURATION_STD, 1.0)
+
+
+def texture_liveness(crops, details=None):
+    """
+    Texture liveness for a stack of equally sized BGR crops, vectorized over faces
+    Sharpness (Laplacian variance) 70% + saturation spread 30%
+    details: crops at the frame's pixel scale (detail_crops) for the sharpness
+    term; defaults to `crops`
+    Returns: (N,) float32 scores in [0, 1]
+    """
+    if len(crops) == 0:
+        return np.empty(0, dtype=np.float32)
+
+    sharpness = sharpness_scores(crops if details is None else details)
+    score = sharpness * 0.7 + color_scores(crops) * 0.3
+    return np.clip(score, 0.0, 1.0).astype(np.float32)
+
+
+def liveness_scores(frame, faces):
+    """
+    Liveness of each face: color on its aligned crop, sharpness on its
+    frame-scale detail crop (fixed size: cost independent of face size)
+    """
+    return texture_liveness(aligned_crops(frame, faces), detail_crops(frame, faces))
+
+
+def centered_roi(img_w, img_h, margin=ROI_MARGIN):
+    """Acceptance zone of is_face_centered plus `margin`, as (x1, y1, x2, y2) pixels"""
+    return (
+        int(img_w * max(0.0, 0.25 - margin)), int(img_h * max(0.0, 0.25 - margin)),
+        int(np.ceil(img_w * min(1.0, 0.75 + margin))), int(np.ceil(img_h * min(1.0, 0.75 + margin)))
+    )
+
+
+def detect_faces(app, frame, roi=False):
+    """
+    Run the detection model of `app` only (no embedding)
+    roi: detect only inside the centered acceptance zone (+ margin), at the same
+    pixel scale as a full-frame pass but with a proportionally smaller input
+    Returns: list of Face objects with bbox, kps and det_score (frame coordinates)
+    """
+    if not roi:
+        bboxes, kpss = app.det_model.detect(frame, max_num=0, metric='default')
+    else:
+        img_h, img_w = frame.shape[:2]
+        x1, y1, x2, y2 = centered_roi(img_w, img_h)
+        # Full-frame scale is DET_SIZE / longest side; keep it and round up to the stride (32)
+        scale = DET_SIZE / max(img_w, img_h)
+        input_size = (
+            max(32, int(np.ceil((x2 - x1) * scale / 32)) * 32),
+            max(32, int(np.ceil((y2 - y1) * scale / 32)) * 32),
+        )
+        bboxes, kpss = app.det_model.detect(frame[y1:y2, x1:x2], input_size=input_size,
+                                            max_num=0, metric='default')
+        # Back to frame coordinates
+        bboxes = bboxes.copy()
+        bboxes[:, 0:4] += np.array([x1, y1, x1, y1], dtype=bboxes.dtype)
+        if kpss is not None:
+            kpss = kpss + np.array([x1, y1], dtype=kpss.dtype)
+
+    faces = []
+    for i in range(bboxes.shape[0]):
+        kps = kpss[i] if kpss is not None else None
+        faces.append(Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+    return faces
+
+
+def scale_face(face, sx, sy=None):
+    """
+    Copy of a detection in another resolution of the same frame
+    sx, sy: horizontal / vertical factors (sy defaults to sx); they differ when
+    the two resolutions have different aspect ratios
+    """
+    sy = sx if sy is None else sy
+    return Face(
+        bbox=face.bbox * np.array([sx, sy, sx, sy], dtype=np.float32),
+        kps=face.kps * np.array([sx, sy], dtype=np.float32) if face.kps is not None else None,
+        det_score=face.det_score
+    )
+
+
+def embed_faces(app, items):
+    """
+    Run the recognition model of `app` once for a batch of detected faces
+    items: list of (image, face) pairs; sets face.embedding in place
+    """
+    if not items:
+        return
+
+    rec_model = app.models['recognition']
+    crops = [
+        face_align.norm_crop(img, landmark=face.kps, image_size=rec_model.input_size[0])
+        for img, face in items
+    ]
+    feats = rec_model.get_feat(crops)
+    for (_, face), feat in zip(items, feats):
+        face.embedding = feat.flatten()
+
+
+def embed_aligned(app, crops):
+    """
+    Run the recognition model directly on already-aligned crops (no detection)
+    Returns: (N, 512) embeddings
+    """
+    if len(crops) == 0:
+        return np.empty((0, 512), dtype=np.float32)
+    return np.asarray(app.models['recognition'].get_feat(list(crops))).reshape(len(crops), -1)
+
+
+def detect_and_embed(app, frames):
+    """
+    Detect faces on each frame, then embed only the faces that will actually
+    be compared (too small / off-center faces never reach ArcFace)
+    Returns: one list of faces per frame
+    """
+    faces_per_frame = [detect_faces(app, frame) for frame in frames]
+    embed_faces(app, [
+        (frame, face)
+        for frame, faces in zip(frames, faces_per_frame)
+        for face in faces
+        if is_recognizable(face, frame.shape[1], frame.shape[0])
+    ])
+    return faces_per_frame
+
+
+# ==================== INFERENCE WORKER PROCESS ====================
+
+def face_to_dict(face):
+    """Plain-dict form of a Face, cheap to send back over a multiprocessing queue"""
+    return {
+        "bbox": face.bbox,
+        "kps": face.kps,
+        "det_score": face.det_score,
+        "embedding": face.embedding,
+    }
+
+
+def face_from_dict(data):
+    return Face(**{k: v for k, v in data.items() if v is not None})
+
+
+def run_task(app, op, frames, args=None):
+    """
+    Execute one worker operation
+    - "detect_and_embed": faces per frame, filtered faces embedded
+    - "detect": faces per frame, no embeddings; args = roi flag
+    - "embed": args = [(frame_index, kps), ...]; returns (n, 512) embeddings
+    - "embed_aligned": frames are aligned crops; returns (n, 512) embeddings
+    """
+    if op == "detect_and_embed":
+        return [[face_to_dict(f) for f in faces] for faces in detect_and_embed(app, frames)]
+    if op == "detect":
+        return [[face_to_dict(f) for f in detect_faces(app, frame, roi=bool(args))] for frame in frames]
+    if op == "embed":
+        faces = [Face(kps=kps) for _, kps in args]
+        embed_faces(app, [(frames[i], face) for (i, _), face in zip(args, faces)])
+        return np.array([face.embedding for face in faces])
+    if op == "embed_aligned":
+        return embed_aligned(app, frames)
+    raise ValueError(f"Unknown worker operation: {op}")
+
+
+def serve_tasks(app, slots, tasks, results):
+    """
+    Answer tasks until the None sentinel. Each task is
+    (request_id, op, [(slot_index, shape), ...], args, deadline) and is answered
+    on `results` with (request_id, output, error). Tasks past their deadline
+    (time.time()) are answered with an error without running: their caller has
+    already timed out, and running them would delay every task queued behind.
+    """
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        request_id, op, frame_slots, args, deadline = task
+        if deadline is not None and time.time() > deadline:
+            results.put((request_id, None, "Task expired before a worker picked it up"))
+            continue
+
+        frames = []
+        try:
+            # Zero-copy views on the slots; released before the next task
+            frames = [
+                np.ndarray(shape, dtype=np.uint8, buffer=slots[slot].buf)
+                for slot, shape in frame_slots
+            ]
+            results.put((request_id, run_task(app, op, frames, args), None))
+        except Exception as e:
+            results.put((request_id, None, str(e)))
+        finally:
+            del frames
+
+
+def worker_main(slot_names, tasks, results, intra_op_threads=0):
+    """Inference worker process: attach the shared-memory slots, load the models, serve_tasks()"""
+    from multiprocessing import shared_memory
+
+    # Slots are owned (and unlinked) by the parent process
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    app = create_face_analysis(intra_op_threads)
+
+    try:
+        serve_tasks(app, slots, tasks, results)
+    finally:
+        for shm in slots:
+            shm.close()
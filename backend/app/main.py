@@ -6,7 +6,6 @@ from .models import Camera
 from .services.face_service import face_service
 from .services.camera_service import camera_service
 # from .services.ensemble_service import ensemble_service
-from .models import Employee
 from .cron_cleanup import cleanup_old_logs
 from apscheduler.schedulers.background import BackgroundScheduler
 import logging
@@ -43,10 +42,17 @@ async def startup_event():
     # Create tables if they don't exist
     Base.metadata.create_all(bind=engine)
     
-    # Load embeddings
+    # Start out-of-process inference workers (INFERENCE_WORKERS > 0)
+    face_service.start_workers()
+    
+    # Load the in-process face models, unless all inference runs on the workers
+    # (the pool is otherwise built on first use)
+    if face_service.workers is None:
+        face_service.load_models()
+    
+    # Load the gallery (memory-mapped snapshot, refreshed in the background if stale)
+    face_service.open_gallery(SessionLocal)
     db = SessionLocal()
-    employees = db.query(Employee).all()
-    face_service.load_embeddings(employees)
     
     # Initialize Ensemble Service (DeepFace) - DISABLED
     # ensemble_service.initialize(db)
@@ -68,6 +74,8 @@ async def startup_event():
 def shutdown_event():
     scheduler.shutdown()
     logger.info("Scheduler shut down")
+    face_service.stop_workers()
+    face_service.close_gallery()
 
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -0,0 +1,132 @@
+"""
+INT8 static quantization of the buffalo_l detection and recognition models.
+The recognizer is calibrated on the stored employee photos (aligned 112x112
+crops), the detector on recorded camera frames when available (else on the
+photos placed on a synthetic canvas), each fed with the same preprocessing
+InsightFace applies at inference.
+"""
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+from .face_pipeline import FP32_MODEL_PACK, INT8_MODEL_PACK, MODEL_ROOT, model_pack_dir
+
+DET_MODEL_FILE = 'det_10g.onnx'
+REC_MODEL_FILE = 'w600k_r50.onnx'
+DET_INPUT_SIZE = 640
+
+
+def recognition_blob(img):
+    """ArcFace preprocessing (same as ArcFaceONNX.get_feat)"""
+    crop = cv2.resize(img, (112, 112)) if img.shape[:2] != (112, 112) else img
+    return cv2.dnn.blobFromImage(crop, 1.0 / 127.5, (112, 112), (127.5, 127.5, 127.5), swapRB=True)
+
+
+def detection_canvas(img, face_scale=0.5):
+    """640x640 frame with the photo taking `face_scale` of it (top-left, like SCRFD's letterbox)"""
+    canvas = np.zeros((DET_INPUT_SIZE, DET_INPUT_SIZE, 3), dtype=np.uint8)
+    side = int(DET_INPUT_SIZE * face_scale)
+    canvas[:side, :side] = cv2.resize(img, (side, side))
+    return canvas
+
+
+def letterbox(frame):
+    """Camera frame as SCRFD.detect feeds it: fitted into 640x640, top-left, zero padding"""
+    h, w = frame.shape[:2]
+    scale = DET_INPUT_SIZE / max(h, w)
+    canvas = np.zeros((DET_INPUT_SIZE, DET_INPUT_SIZE, 3), dtype=np.uint8)
+    new_w, new_h = min(DET_INPUT_SIZE, int(w * scale)), min(DET_INPUT_SIZE, int(h * scale))
+    canvas[:new_h, :new_w] = cv2.resize(frame, (new_w, new_h))
+    return canvas
+
+
+def _detector_blob(canvas):
+    return cv2.dnn.blobFromImage(canvas, 1.0 / 128, (DET_INPUT_SIZE, DET_INPUT_SIZE),
+                                 (127.5, 127.5, 127.5), swapRB=True)
+
+
+def detection_blob(img, face_scale=0.5):
+    """SCRFD preprocessing (same as SCRFD.detect at det_size=640) of a photo on a synthetic canvas"""
+    return _detector_blob(detection_canvas(img, face_scale))
+
+
+def frame_detection_blob(frame):
+    """SCRFD preprocessing of a recorded camera frame"""
+    return _detector_blob(letterbox(frame))
+
+
+def _quantize(model_in, model_out, blobs):
+    """Static QDQ quantization (INT8 weights per channel, UINT8 activations)"""
+    import onnxruntime
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static, quant_pre_process
+    )
+
+    input_name = onnxruntime.InferenceSession(
+        model_in, providers=['CPUExecutionProvider']
+    ).get_inputs()[0].name
+
+    class BlobReader(CalibrationDataReader):
+        def __init__(self):
+            self._blobs = iter(blobs)
+
+        def get_next(self):
+            blob = next(self._blobs, None)
+            return None if blob is None else {input_name: blob}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference / graph cleanup first (recommended before static quantization)
+        prepared = os.path.join(tmp, 'prepared.onnx')
+        try:
+            quant_pre_process(model_in, prepared)
+        except Exception as e:
+            print(f"  Pre-processing skipped ({e})")
+            prepared = model_in
+
+        quantize_static(
+            prepared, model_out, BlobReader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            weight_type=QuantType.QInt8,
+            activation_type=QuantType.QUInt8
+        )
+
+
+def quantize_buffalo_l(calibration_images, root=MODEL_ROOT, max_images=200, frames=None):
+    """
+    Build the INT8 model pack next to buffalo_l (cached; models/buffalo_l_int8)
+    calibration_images: BGR employee photos (aligned crops)
+    frames: recorded BGR camera frames for the detector. Without them the
+    detector is calibrated on the photos upscaled onto a black canvas, whose
+    activation ranges need not match real camera scenes.
+    Returns: path of the INT8 pack
+    """
+    if not calibration_images:
+        raise ValueError("No calibration images (no employee photos stored)")
+
+    images = calibration_images[:max_images]
+    src_dir = model_pack_dir(FP32_MODEL_PACK, root)
+    out_dir = model_pack_dir(INT8_MODEL_PACK, root)
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    print(f"[1/2] Quantizing recognition model ({len(images)} calibration crops)...")
+    _quantize(os.path.join(src_dir, REC_MODEL_FILE), os.path.join(tmp_dir, REC_MODEL_FILE),
+              [recognition_blob(img) for img in images])
+
+    if frames:
+        det_blobs = [frame_detection_blob(frame) for frame in frames[:max_images]]
+        print(f"[2/2] Quantizing detection model ({len(det_blobs)} recorded frames)...")
+    else:
+        det_blobs = [detection_blob(img, face_scale=(0.25, 0.5, 0.75)[i % 3]) for i, img in enumerate(images)]
+        print(f"[2/2] Quantizing detection model ({len(det_blobs)} synthetic canvases, no recorded frames)...")
+    _quantize(os.path.join(src_dir, DET_MODEL_FILE), os.path.join(tmp_dir, DET_MODEL_FILE), det_blobs)
+
+    # Swap in atomically so a half-written pack is never loaded
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(tmp_dir, out_dir)
+    return out_dir
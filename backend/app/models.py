@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, Float
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from .database import Base
 import datetime
@@ -9,23 +10,35 @@ class Employee(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     department = Column(String, nullable=True)
-    # Storing 6 embeddings as bytes (pickle or numpy tobytes) for better accuracy
-    embedding1 = Column(LargeBinary, nullable=True)
-    embedding2 = Column(LargeBinary, nullable=True)
-    embedding3 = Column(LargeBinary, nullable=True)
-    embedding4 = Column(LargeBinary, nullable=True) # v1.6.5
-    embedding5 = Column(LargeBinary, nullable=True) # v1.6.5
-    embedding6 = Column(LargeBinary, nullable=True) # v1.6.5
+    # BLOB columns are deferred: Employee queries load only the scalar columns, a
+    # BLOB is fetched on first access (a whole group at once for photos, embeddings)
+    # Legacy embedding storage, superseded by the face_embeddings table (kept for rollback)
+    embedding1 = deferred(Column(LargeBinary, nullable=True), group="embeddings")
+    embedding2 = deferred(Column(LargeBinary, nullable=True), group="embeddings")
+    embedding3 = deferred(Column(LargeBinary, nullable=True), group="embeddings")
+    embedding4 = deferred(Column(LargeBinary, nullable=True), group="embeddings") # v1.6.5
+    embedding5 = deferred(Column(LargeBinary, nullable=True), group="embeddings") # v1.6.5
+    embedding6 = deferred(Column(LargeBinary, nullable=True), group="embeddings") # v1.6.5
     # Store 6 actual images for display
-    photo1 = Column(LargeBinary, nullable=True)
-    photo2 = Column(LargeBinary, nullable=True)
-    photo3 = Column(LargeBinary, nullable=True)
-    photo4 = Column(LargeBinary, nullable=True) # v1.6.5: Additional angle (left rotation)
-    photo5 = Column(LargeBinary, nullable=True) # v1.6.5: Additional angle (right rotation)
-    photo6 = Column(LargeBinary, nullable=True) # v1.6.5: Additional angle (tilt)
+    photo1 = deferred(Column(LargeBinary, nullable=True), group="photos")
+    photo2 = deferred(Column(LargeBinary, nullable=True), group="photos")
+    photo3 = deferred(Column(LargeBinary, nullable=True), group="photos")
+    photo4 = deferred(Column(LargeBinary, nullable=True), group="photos") # v1.6.5: Additional angle (left rotation)
+    photo5 = deferred(Column(LargeBinary, nullable=True), group="photos") # v1.6.5: Additional angle (right rotation)
+    photo6 = deferred(Column(LargeBinary, nullable=True), group="photos") # v1.6.5: Additional angle (tilt)
     pin = Column(String, nullable=True) # 4-digit PIN
     created_at = Column(DateTime(timezone=False), default=datetime.datetime.now)
 
+class FaceEmbedding(Base):
+    """Reference face vectors, one row per (employee, slot, model); replaces Employee.embedding1-6"""
+    __tablename__ = "face_embeddings"
+
+    employee_id = Column(Integer, primary_key=True, index=True)
+    slot = Column(Integer, primary_key=True) # 1-6 = enrollment photos; more slots can be added
+    model_version = Column(String, primary_key=True) # Embedding space (embedding_format.MODEL_VERSION)
+    vector = Column(LargeBinary, nullable=False) # embedding_format raw float32 bytes
+    updated_at = Column(DateTime(timezone=False), default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
 class AttendanceLog(Base):
     __tablename__ = "attendance_logs"
 
@@ -36,7 +49,7 @@ class AttendanceLog(Base):
     confidence = Column(Float)
     type = Column(String, nullable=True) # 'ENTRY' or 'EXIT'
     worked_minutes = Column(Integer, nullable=True) # Minutes worked for the day
-    photo_capture = Column(LargeBinary, nullable=True) # v2.11.0: Photo captured during attendance (PIN or Face)
+    photo_capture = deferred(Column(LargeBinary, nullable=True)) # v2.11.0: Photo captured during attendance (PIN or Face)
     timestamp = Column(DateTime(timezone=False), default=datetime.datetime.now, index=True)
 
 class Camera(Base):
@@ -47,6 +60,8 @@ class Camera(Base):
     source = Column(String) # URL or Index
     is_active = Column(Integer, default=1) # 1 for active, 0 for inactive
     is_selected = Column(Integer, default=0) # 1 if this is the currently selected camera for LiveView
+    roi_detection = Column(Integer, default=0) # 1 to detect only in the centered acceptance zone (kiosk cameras)
+    motion_sensitivity = Column(Integer, default=50) # Motion gate: 1-100 (higher = more sensitive), 0 = always detect
 
 class SystemSettings(Base):
     __tablename__ = "system_settings"
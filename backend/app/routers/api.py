@@ -5,24 +5,45 @@ from ..database import get_db, SessionLocal
 from ..models import Employee, AttendanceLog, Camera, SystemSettings
 from ..services.face_service import face_service
 from ..services.camera_service import camera_service
+from ..services.face_tracker import FaceTracker
+from ..services.motion_gate import MotionGate
+from ..services.metrics import metrics
+from ..services import embedding_store
+from .. import embedding_format
 import cv2
 import numpy as np
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
 import io
+import os
+import csv
+import json
+import asyncio
+import zipfile
 import threading
 import time
 import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 router = APIRouter()
 
 # --- System Settings ---
+def check_editable_setting(key):
+    """Server-maintained settings (e.g. the gallery generation) are not exposed"""
+    if key in embedding_store.INTERNAL_SETTINGS:
+        raise HTTPException(status_code=403, detail="This setting is managed by the server")
+
 @router.get("/settings/")
 def get_settings(db: Session = Depends(get_db)):
-    return db.query(SystemSettings).all()
+    return db.query(SystemSettings).filter(
+        SystemSettings.key.notin_(embedding_store.INTERNAL_SETTINGS)
+    ).all()
 
 @router.get("/settings/{key}")
 def get_setting(key: str, db: Session = Depends(get_db)):
+    check_editable_setting(key)
     setting = db.query(SystemSettings).filter(SystemSettings.key == key).first()
     if not setting:
         # Return default for wan_domain if not set
@@ -33,6 +54,7 @@ def get_setting(key: str, db: Session = Depends(get_db)):
 
 @router.post("/settings/")
 def update_setting(key: str = Form(...), value: str = Form(...), description: str = Form(None), db: Session = Depends(get_db)):
+    check_editable_setting(key)
     setting = db.query(SystemSettings).filter(SystemSettings.key == key).first()
     if setting:
         setting.value = value
@@ -47,6 +69,7 @@ def update_setting(key: str = Form(...), value: str = Form(...), description: st
 
 @router.delete("/settings/{key}")
 def delete_setting(key: str, db: Session = Depends(get_db)):
+    check_editable_setting(key)
     setting = db.query(SystemSettings).filter(SystemSettings.key == key).first()
     if not setting:
         raise HTTPException(status_code=404, detail="Setting not found")
@@ -76,39 +99,31 @@ async def create_employee(
     db: Session = Depends(get_db)
 ):
     """Create employee with 6 photos for better recognition accuracy (v1.6.5: increased from 3)"""
+    # Read all 6 photos (photo2 will be grayscale)
+    files = [file1, file2, file3, file4, file5, file6]
+    contents = [await file.read() for file in files]
+    
+    # Single-pass enrollment (decode + detect once per photo, one batched embedding),
+    # off the event loop
+    enrolled = await run_in_threadpool(
+        face_service.enroll_photos,
+        [(content, i == 2) for i, content in enumerate(contents, 1)]
+    )
+    
     photos = []
     embeddings = []
-    
-    # Process all 6 photos (photo2 will be grayscale)
-    for i, file in enumerate([file1, file2, file3, file4, file5, file6], 1):
-        content = await file.read()
-        
-        # Check quality first
-        is_good, msg = face_service.check_face_quality(content)
-        if not is_good:
-            raise HTTPException(status_code=400, detail=f"Photo {i} quality check failed: {msg}")
-
-        # Mark photo2 (index 1) as grayscale
-        is_grayscale = (i == 2)
-        
-        # Use new preprocessing pipeline
-        processed_content, embedding_pickle = face_service.register_face(content, is_grayscale=is_grayscale)
-        
-        if processed_content is None or embedding_pickle is None:
+    for i, (processed_content, embedding_blob, issue) in enumerate(enrolled, 1):
+        if issue:
+            raise HTTPException(status_code=400, detail=f"Photo {i} quality check failed: {issue}")
+        if processed_content is None or embedding_blob is None:
             raise HTTPException(status_code=400, detail=f"No face detected in photo {i}")
         
         photos.append(processed_content)
-        embeddings.append(embedding_pickle)
+        embeddings.append(embedding_blob)
 
     new_emp = Employee(
         name=name, 
         department=department, 
-        embedding1=embeddings[0],
-        embedding2=embeddings[1],
-        embedding3=embeddings[2],
-        embedding4=embeddings[3],  # v1.6.5
-        embedding5=embeddings[4],  # v1.6.5
-        embedding6=embeddings[5],  # v1.6.5
         pin=pin, 
         photo1=photos[0],
         photo2=photos[1],
@@ -118,12 +133,16 @@ async def create_employee(
         photo6=photos[5]   # v1.6.5
     )
     db.add(new_emp)
+    db.flush()
+    embedding_store.save_embeddings(db, new_emp.id, dict(enumerate(embeddings, 1)))
     db.commit()
-    db.refresh(new_emp)
+    db.refresh(new_emp, ["id", "name"])
     
-    # Reload embeddings in service
-    all_emps = db.query(Employee).all()
-    face_service.load_embeddings(all_emps)
+    # Add the new employee to the in-memory gallery (may retrain the index: off the event loop)
+    await run_in_threadpool(
+        face_service.upsert_employee, new_emp.id, new_emp.name,
+        [embedding_format.decode_embedding(b) for b in embeddings]
+    )
     
     return {"id": new_emp.id, "name": new_emp.name}
 
@@ -152,41 +171,48 @@ async def update_employee(
     
     # Update photos if provided
     files = [file1, file2, file3, file4, file5, file6]
-    for i, file in enumerate(files, 1):
-        if file:
-            content = await file.read()
-            is_good, msg = face_service.check_face_quality(content)
-            if not is_good:
-                raise HTTPException(status_code=400, detail=f"Photo {i} quality check failed: {msg}")
-            
-            # Mark photo2 as grayscale
-            is_grayscale = (i == 2)
-            
-            # Use new preprocessing pipeline
-            processed_content, embedding_pickle = face_service.register_face(content, is_grayscale=is_grayscale)
-            if processed_content is None or embedding_pickle is None:
-                raise HTTPException(status_code=400, detail=f"No face detected in photo {i}")
-                
-            # Update specific photo and embedding
-            setattr(emp, f'embedding{i}', embedding_pickle)
-            setattr(emp, f'photo{i}', processed_content)
+    slots = [i for i, file in enumerate(files, 1) if file]
+    contents = [await files[i - 1].read() for i in slots]
     
-    # Reload embeddings if any photo was updated
-    if any(files):
-        all_emps = db.query(Employee).all()
-        face_service.load_embeddings(all_emps)
+    # Mark photo2 as grayscale
+    enrolled = await run_in_threadpool(
+        face_service.enroll_photos,
+        [(content, i == 2) for i, content in zip(slots, contents)]
+    )
+    
+    new_embeddings = {}
+    for i, (processed_content, embedding_blob, issue) in zip(slots, enrolled):
+        if issue:
+            raise HTTPException(status_code=400, detail=f"Photo {i} quality check failed: {issue}")
+        if processed_content is None or embedding_blob is None:
+            raise HTTPException(status_code=400, detail=f"No face detected in photo {i}")
+            
+        # Update specific photo and embedding
+        new_embeddings[i] = embedding_blob
+        setattr(emp, f'photo{i}', processed_content)
     
+    embedding_store.save_embeddings(db, emp.id, new_embeddings)
     db.commit()
+    
+    # Patch this employee's gallery rows (name and/or embeddings may have changed)
+    await run_in_threadpool(
+        face_service.upsert_employee, emp.id, emp.name,
+        list(embedding_store.employee_embeddings(db, emp.id).values())
+    )
     return {"status": "updated"}
 
 @router.get("/employees/{emp_id}/photo")
 def get_employee_photo(emp_id: int, photo_num: int = 1, db: Session = Depends(get_db)):
-    """Get employee photo - photo_num can be 1, 2, or 3"""
-    emp = db.query(Employee).filter(Employee.id == emp_id).first()
-    if not emp:
+    """Get employee photo - photo_num can be 1 to 6"""
+    if photo_num not in range(1, 7):
+        raise HTTPException(status_code=404, detail=f"Photo {photo_num} not found")
+    
+    # Only the requested photo column, not the employee's other five BLOBs
+    row = db.query(Employee.id, getattr(Employee, f'photo{photo_num}')).filter(Employee.id == emp_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    photo = getattr(emp, f'photo{photo_num}', None)
+    photo = row[1]
     if not photo:
         raise HTTPException(status_code=404, detail=f"Photo {photo_num} not found")
     
@@ -246,7 +272,7 @@ def get_log_photo(log_id: int, db: Session = Depends(get_db)):
 
 @router.get("/employees/")
 def read_employees(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    employees = db.query(Employee).offset(skip).limit(limit).all()
+    employees = db.query(Employee.id, Employee.name, Employee.department).offset(skip).limit(limit).all()
     return [{"id": e.id, "name": e.name, "department": e.department} for e in employees]
 
 @router.delete("/employees/{emp_id}")
@@ -255,48 +281,94 @@ def delete_employee(emp_id: int, db: Session = Depends(get_db)):
     if not emp:
         raise HTTPException(status_code=404, detail="Employee not found")
     db.delete(emp)
+    embedding_store.delete_embeddings(db, emp_id)
     db.commit()
     
-    # Reload embeddings
-    all_emps = db.query(Employee).all()
-    face_service.load_embeddings(all_emps)
+    # Drop the employee from the in-memory gallery
+    face_service.remove_employee(emp_id)
     return {"status": "deleted"}
 
+def decode_image(contents):
+    """Decode uploaded image bytes (BGR) or None"""
+    nparr = np.frombuffer(contents, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+def format_recognition(results):
+    """Shape recognize_faces output into the /recognize/ response"""
+    if not results:
+        return {"name": "Unknown", "confidence": 0.0, "employee_id": None, "liveness_score": 0.0}
+    
+    # Get the first (best) result
+    result = results[0]
+    
+    # Get server timestamp
+    server_time = datetime.datetime.now().strftime("%H:%M:%S")
+    
+    return {
+        "name": result["name"],
+        "confidence": float(result["confidence"]),
+        "liveness_score": float(result["liveness"]),
+        "employee_id": result["employee_id"],
+        "timestamp": server_time,
+        "landmarks_count": len(result["keypoints"]) if result["keypoints"] is not None else 0,
+        "landmarks": result["keypoints"] if result["keypoints"] is not None else []
+    }
+
 @router.post("/recognize/")
 async def recognize_face(file: UploadFile = File(...), db: Session = Depends(get_db)):
     """Recognize face from uploaded image with enhanced landmarks and liveness"""
     try:
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image")
-        
-        # Recognize faces with liveness detection
-        # Recognize faces (liveness is now built-in)
-        results = face_service.recognize_faces(img, db=db)
-        
-        if not results:
-            return {"name": "Unknown", "confidence": 0.0, "employee_id": None, "liveness_score": 0.0}
+        with metrics.timer("total"):
+            contents = await file.read()
+            with metrics.timer("decode"):
+                img = decode_image(contents)
+            
+            if img is None:
+                raise HTTPException(status_code=400, detail="Invalid image")
+            
+            # Recognize faces (liveness is now built-in), off the event loop:
+            # in worker mode this waits on the inference processes
+            results = await run_in_threadpool(face_service.recognize_faces, img, db=db)
+            
+            return format_recognition(results)
+    except Exception as e:
+        print(f"Recognition error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Max images per /recognize/batch request and pool used to decode them in parallel
+MAX_BATCH_IMAGES = 16
+decode_pool = ThreadPoolExecutor(max_workers=4)
+
+@router.post("/recognize/batch")
+async def recognize_face_batch(files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+    """
+    Recognize faces on N uploaded images in one request.
+    Images are decoded in parallel and all detected faces are embedded in one batch.
+    Returns one /recognize/ result per image, in upload order.
+    """
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Too many images ({len(files)}). Maximum {MAX_BATCH_IMAGES} per batch.")
+    
+    try:
+        contents = [await file.read() for file in files]
+        # Decoding and inference block: keep them off the event loop
+        images = await run_in_threadpool(lambda: list(decode_pool.map(decode_image, contents)))
         
-        # Get the first (best) result
-        result = results[0]
+        valid = [i for i, img in enumerate(images) if img is not None]
+        batch_results = await run_in_threadpool(
+            face_service.recognize_batch, [images[i] for i in valid], db=db
+        )
         
-        # Get server timestamp
-        server_time = datetime.datetime.now().strftime("%H:%M:%S")
+        responses = [None] * len(images)
+        for i, results in zip(valid, batch_results):
+            responses[i] = format_recognition(results)
+        for i, img in enumerate(images):
+            if img is None:
+                responses[i] = {**format_recognition([]), "error": "Invalid image"}
         
-        return {
-            "name": result["name"],
-            "confidence": float(result["confidence"]),
-            "liveness_score": float(result["liveness"]),
-            "employee_id": result["employee_id"],
-            "timestamp": server_time,
-            "landmarks_count": len(result["keypoints"]) if result["keypoints"] is not None else 0,
-            "landmarks": result["keypoints"] if result["keypoints"] is not None else []
-        }
+        return responses
     except Exception as e:
-        print(f"Recognition error: {e}")
+        print(f"Batch recognition error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- Cameras ---
@@ -358,14 +430,55 @@ def select_camera(cam_id: int, db: Session = Depends(get_db)):
     db.commit()
     return {"status": "selected", "camera": cam.name}
 
+@router.put("/cameras/{cam_id}/roi")
+def toggle_camera_roi(cam_id: int, db: Session = Depends(get_db)):
+    """Toggle centered-ROI detection (only the acceptance zone is scanned; kiosk cameras)"""
+    cam = db.query(Camera).filter(Camera.id == cam_id).first()
+    if not cam:
+        raise HTTPException(status_code=404, detail="Camera not found")
+    
+    cam.roi_detection = 0 if cam.roi_detection else 1
+    db.commit()
+    
+    # Apply to a running detection loop
+    if cam_id in processors:
+        processors[cam_id].roi_detection = bool(cam.roi_detection)
+    
+    return {"status": "updated", "roi_detection": cam.roi_detection}
+
+@router.put("/cameras/{cam_id}/motion")
+def set_camera_motion_sensitivity(cam_id: int, sensitivity: int, db: Session = Depends(get_db)):
+    """Motion gate sensitivity: 1-100 (higher = smaller changes trigger detection), 0 = always detect"""
+    if not 0 <= sensitivity <= 100:
+        raise HTTPException(status_code=400, detail="Sensitivity must be between 0 and 100")
+    
+    cam = db.query(Camera).filter(Camera.id == cam_id).first()
+    if not cam:
+        raise HTTPException(status_code=404, detail="Camera not found")
+    
+    cam.motion_sensitivity = sensitivity
+    db.commit()
+    
+    # Apply to a running detection loop
+    if cam_id in processors:
+        processors[cam_id].motion_gate.sensitivity = sensitivity
+    
+    return {"status": "updated", "motion_sensitivity": cam.motion_sensitivity}
+
 # --- Async Detection Helper ---
 class AsyncFrameProcessor:
     def __init__(self, camera_id):
         self.camera_id = camera_id
+        self.roi_detection = False
         self.latest_frame = None
         self.latest_results = []
+        self.last_frame_count = None  # Capture counter at the previous iteration (dropped frames)
         self.running = True
         self.lock = threading.Lock()
+        # Faces are tracked across frames; only new/unconfirmed/stale tracks are re-embedded
+        self.tracker = FaceTracker()
+        # Inference only runs on motion or while a face is tracked
+        self.motion_gate = MotionGate()
         self.thread = threading.Thread(target=self._detection_loop, daemon=True)
         self.thread.start()
 
@@ -384,16 +497,46 @@ class AsyncFrameProcessor:
     def _detection_loop(self):
         # Create a dedicated DB session for this thread
         db = SessionLocal()
+        # Stage timings of this thread are reported under pipeline="camera"
+        metrics.pipeline.set("camera")
         try:
+            # Per-camera detection settings
+            cam = db.query(Camera).filter(Camera.id == self.camera_id).first()
+            if cam:
+                self.roi_detection = bool(cam.roi_detection)
+                if cam.motion_sensitivity is not None:
+                    self.motion_gate.sensitivity = cam.motion_sensitivity
+            
             while self.running:
-                frame_to_process = None
-                with self.lock:
-                    if self.latest_frame is not None:
-                        frame_to_process = self.latest_frame.copy()
+                # Detect on the preview, embed from the full-res frame of the same capture
+                full_frame, frame_to_process = camera_service.get_frame_pair(self.camera_id)
+                frame_count = camera_service.get_frame_count(self.camera_id)
+                if frame_to_process is None:
+                    full_frame = None
+                    # Not a server-side camera: use the frames fed by the stream
+                    with self.lock:
+                        if self.latest_frame is not None:
+                            frame_to_process = self.latest_frame.copy()
                 
-                if frame_to_process is not None:
+                # Frames captured since the last iteration, minus the one picked up now
+                if frame_count is not None and self.last_frame_count is not None:
+                    metrics.count(self.camera_id, "dropped", frame_count - self.last_frame_count - 1)
+                self.last_frame_count = frame_count
+                
+                # Skip inference on a static, empty scene
+                if frame_to_process is not None and not self.motion_gate.should_run(
+                    frame_to_process, tracking=bool(self.tracker.tracks)
+                ):
+                    metrics.count(self.camera_id, "skipped")
+                elif frame_to_process is not None:
+                    metrics.count(self.camera_id, "processed")
+                    started = time.perf_counter()
+                    
                     # Run detection (heavy operation)
-                    results = face_service.recognize_faces(frame_to_process, db=db)
+                    results = face_service.recognize_tracked(
+                        frame_to_process, self.tracker, db=db, roi=self.roi_detection,
+                        full_frame=full_frame
+                    )
                     with self.lock:
                         self.latest_results = results
                     
@@ -401,7 +544,9 @@ class AsyncFrameProcessor:
                     if results:
                         for result in results:
                             # Vérifier si c'est une reconnaissance valide
+                            # (matchée sur cette image : une identité reprise du tracker n'est pas loggée)
                             if (result["employee_id"] is not None and 
+                                not result.get("cached") and 
                                 result["confidence"] > 0.85 and 
                                 result["liveness"] > 0.4):
                                 
@@ -515,7 +660,8 @@ class AsyncFrameProcessor:
                                                             res["block_reason"] = block_reason
                                                             res["block_subtext"] = block_subtext
                                                             break
-
+                    
+                    metrics.observe("total", time.perf_counter() - started)
                 
                 # Sleep to limit detection FPS (2.5 FPS for CPU optimization)
                 time.sleep(0.4) 
@@ -627,6 +773,13 @@ async def stream_camera_clean(camera_id: int):
 # Ancienne fonction generate_frames supprimée pour éviter les conflits avec AsyncFrameProcessor
 # L'endpoint /stream/{camera_id} est maintenant géré par stream_camera plus haut
 
+# --- Metrics ---
+
+@router.get("/metrics")
+def get_metrics():
+    """Per-stage latency histograms and per-camera frame counters (Prometheus text format)"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 # --- Attendance Logging ---
 
@@ -663,6 +816,7 @@ def check_time_constraints(log_type: str) -> tuple[bool, str]:
     
     return True, ""
 
+@metrics.timed("status_check")
 def check_attendance_status(employee_id: int, db: Session) -> tuple[str | None, str | None]:
     """Determine if next log should be ENTRY or EXIT
     
@@ -801,7 +955,10 @@ def read_attendance(
         end = end.replace(hour=23, minute=59, second=59, microsecond=999999)
         query = query.filter(AttendanceLog.timestamp <= end)
     
-    logs = query.order_by(AttendanceLog.timestamp.desc()).offset(skip).limit(limit).all()
+    # The photo itself stays in the database, only whether there is one is read
+    logs = query.add_columns(
+        AttendanceLog.photo_capture.isnot(None).label("has_photo")
+    ).order_by(AttendanceLog.timestamp.desc()).offset(skip).limit(limit).all()
     
     return [{
         "id": log.id,
@@ -812,8 +969,8 @@ def read_attendance(
         "type": log.type,
         "worked_minutes": log.worked_minutes,
         "timestamp": log.timestamp.isoformat(),
-        "photo_capture": log.photo_capture is not None  # v2.11.0: Flag to show View button
-    } for log in logs]
+        "photo_capture": bool(has_photo)  # v2.11.0: Flag to show View button
+    } for log, has_photo in logs]
 
 @router.delete("/attendance/{log_id}")
 def delete_attendance_log(log_id: int, db: Session = Depends(get_db)):
@@ -870,7 +1027,9 @@ def export_employees(format: str = "csv", db: Session = Depends(get_db)):
     Exporte la liste des employés en CSV ou Excel.
     Format: csv ou excel
     """
-    employees = db.query(Employee).all()
+    employees = db.query(
+        Employee.id, Employee.name, Employee.department, Employee.pin, Employee.created_at
+    ).all()
     
     # Préparer les données
     data = []
@@ -938,7 +1097,7 @@ async def import_employees(file: UploadFile = File(...), db: Session = Depends(g
         for index, row in df.iterrows():
             try:
                 # Vérifier si l'employé existe déjà (par nom)
-                existing = db.query(Employee).filter(Employee.name == row['name']).first()
+                existing = db.query(Employee.id).filter(Employee.name == row['name']).first()
                 if existing:
                     skipped_count += 1
                     continue
@@ -969,3 +1128,198 @@ async def import_employees(file: UploadFile = File(...), db: Session = Depends(g
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'import: {str(e)}")
+
+# ==================== BULK ENROLLMENT ====================
+
+BULK_ENROLL_WORKERS = int(os.getenv("BULK_ENROLL_WORKERS", "4"))
+BULK_COMMIT_SIZE = 25  # Employees per transaction
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+enroll_pool = ThreadPoolExecutor(max_workers=BULK_ENROLL_WORKERS)
+
+def read_enrollment_archive(content):
+    """
+    Index a bulk-enrollment zip: one folder of photos per employee (folder name =
+    employee name, up to 6 photos in file name order, subfolders included) and an
+    optional employees.csv with the import_employees columns (name, department, pin)
+    The employee folders are looked up under the archive root: the folder of
+    employees.csv when it contains all the photos, else the deepest folder common
+    to all of them (e.g. a "staff/" wrapper folder)
+    Returns: (zip_file, {name: [photo members]}, {name: csv row}, [ignored csv members])
+    """
+    zf = zipfile.ZipFile(io.BytesIO(content))
+    photos = []
+    csv_files = []
+    
+    for member in sorted(zf.namelist()):
+        parts = [p for p in member.split('/') if p]
+        if not parts or parts[0] == '__MACOSX' or member.endswith('/'):
+            continue
+        if parts[-1].lower() == 'employees.csv':
+            csv_files.append((member, parts[:-1]))
+        elif len(parts) >= 2 and parts[-1].lower().endswith(PHOTO_EXTENSIONS):
+            photos.append((member, parts))
+    
+    # Deepest common folder that still leaves one employee folder above every photo
+    root = []
+    if photos:
+        depth = min(len(parts) for _, parts in photos) - 2
+        for level in range(depth):
+            names = {parts[level] for _, parts in photos}
+            if len(names) != 1:
+                break
+            root.append(names.pop())
+    
+    # employees.csv containing all the photos (the deepest one) anchors the root
+    csv_member, csv_root = None, None
+    for member, folder in csv_files:
+        if all(parts[:len(folder)] == folder and len(parts) >= len(folder) + 2 for _, parts in photos):
+            if csv_member is None or len(folder) > len(csv_root):
+                csv_member, csv_root = member, folder
+    if csv_member is not None:
+        root = csv_root
+    ignored = [member for member, _ in csv_files if member != csv_member]
+    
+    folders = {}
+    for member, parts in photos:
+        folders.setdefault(parts[len(root)].strip(), []).append(member)
+    
+    metadata = {}
+    if csv_member is not None:
+        rows = csv.DictReader(io.StringIO(zf.read(csv_member).decode('utf-8-sig')))
+        metadata = {row['name'].strip(): row for row in rows if (row.get('name') or '').strip()}
+    
+    return zf, folders, metadata, ignored
+
+def enroll_archive_employee(zf, zf_lock, members):
+    """Worker job: read one employee's photos and run the enrollment pipeline"""
+    with zf_lock:  # ZipFile reads are not thread-safe
+        contents = [zf.read(member) for member in members[:6]]
+    return face_service.enroll_photos([(content, i == 2) for i, content in enumerate(contents, 1)])
+
+async def bulk_enroll_progress(zf, folders, metadata, ignored=()):
+    """NDJSON progress: one line per employee, then a summary line (+ ignored employees.csv files)"""
+    db = SessionLocal()  # Dedicated session: outlives the request dependency
+    zf_lock = threading.Lock()
+    counts = {"enrolled": 0, "skipped": 0, "failed": 0}
+    total = len(folders)
+    done = 0
+    
+    def line(name, status, **extra):
+        nonlocal done
+        done += 1
+        counts[status] += 1
+        return json.dumps({"name": name, "status": status, "done": done, "total": total, **extra}) + "\n"
+    
+    def submit(name):
+        return asyncio.wrap_future(enroll_pool.submit(enroll_archive_employee, zf, zf_lock, folders[name]))
+    
+    def commit_batch(batch):
+        """Write a batch of employees in one transaction, then add them to the gallery"""
+        names = [emp.name for emp, _ in batch]
+        try:
+            db.add_all([emp for emp, _ in batch])
+            db.flush()
+            ids = [emp.id for emp, _ in batch]
+            for emp_id, (_, embeddings) in zip(ids, batch):
+                embedding_store.save_embeddings(db, emp_id, dict(enumerate(embeddings, 1)))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            return [line(name, "failed", error=f"Database error: {str(e)}") for name in names]
+        
+        face_service.upsert_employees([
+            (emp_id, name, [embedding_format.decode_embedding(emb) for emb in embeddings])
+            for emp_id, name, (_, embeddings) in zip(ids, names, batch)
+        ])
+        return [
+            line(name, "enrolled", id=emp_id, photos=len(embeddings))
+            for emp_id, name, (_, embeddings) in zip(ids, names, batch)
+        ]
+    
+    try:
+        # Same rule as import_employees: existing names are skipped
+        existing = {name for (name,) in db.query(Employee.name).all()}
+        to_enroll = []
+        for name in folders:
+            if name in existing:
+                yield line(name, "skipped", error="Employee already exists")
+            else:
+                to_enroll.append(name)
+        
+        # Sliding window of enrollment jobs on the worker pool
+        window = 2 * BULK_ENROLL_WORKERS
+        in_flight = deque((name, submit(name)) for name in to_enroll[:window])
+        names = iter(to_enroll[window:])
+        batch = []
+        
+        while in_flight:
+            name, future = in_flight.popleft()
+            next_name = next(names, None)
+            if next_name is not None:
+                in_flight.append((next_name, submit(next_name)))
+            
+            try:
+                enrolled = await future
+            except Exception as e:
+                yield line(name, "failed", error=f"Enrollment error: {str(e)}")
+                continue
+            
+            error = None
+            for i, (processed_content, embedding_blob, issue) in enumerate(enrolled, 1):
+                if issue:
+                    error = f"Photo {i} quality check failed: {issue}"
+                elif processed_content is None or embedding_blob is None:
+                    error = f"No face detected in photo {i}"
+                if error:
+                    break
+            if error:
+                yield line(name, "failed", error=error)
+                continue
+            
+            row = metadata.get(name, {})
+            emp = Employee(
+                name=name,
+                department=(row.get('department') or '').strip() or None,
+                pin=(row.get('pin') or '').strip() or None
+            )
+            for i, (processed_content, _, _) in enumerate(enrolled, 1):
+                setattr(emp, f'photo{i}', processed_content)
+            batch.append((emp, [emb for _, emb, _ in enrolled]))
+            
+            if len(batch) >= BULK_COMMIT_SIZE:
+                for progress in await run_in_threadpool(commit_batch, batch):
+                    yield progress
+                batch = []
+        
+        if batch:
+            for progress in await run_in_threadpool(commit_batch, batch):
+                yield progress
+        
+        summary = {"status": "done", "total": total, **counts}
+        if ignored:
+            summary["ignored"] = list(ignored)
+        yield json.dumps(summary) + "\n"
+    finally:
+        db.close()
+        zf.close()
+
+@router.post("/employees/bulk-enroll")
+async def bulk_enroll_employees(file: UploadFile = File(...)):
+    """
+    Enroll many employees from a zip archive (one folder of photos per employee,
+    optional employees.csv for department/pin). Progress is streamed as NDJSON.
+    """
+    content = await file.read()
+    try:
+        zf, folders, metadata, ignored = await run_in_threadpool(read_enrollment_archive, content)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+    
+    if not folders:
+        zf.close()
+        raise HTTPException(status_code=400, detail="No employee photo folders found in the archive")
+    
+    return StreamingResponse(
+        bulk_enroll_progress(zf, folders, metadata, ignored),
+        media_type="application/x-ndjson"
+    )
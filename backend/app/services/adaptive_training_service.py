@@ -4,9 +4,11 @@ Permet au système d'apprendre les changements d'apparence (barbe, vieillissemen
 """
 import numpy as np
 import time
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from ..models import Employee
+from ..models import FaceEmbedding
+from .. import embedding_format
+from . import embedding_store
 import logging
 
 # Configuration du logging
@@ -32,7 +34,8 @@ class AdaptiveTrainingService:
     def process_recognition(self, db: Session, employee_id: int, 
                            current_embedding: np.ndarray, 
                            confidence: float, 
-                           liveness_score: float) -> bool:
+                           liveness_score: float,
+                           on_update: Optional[Callable] = None) -> bool:
         """
         Traite une reconnaissance réussie et décide si une mise à jour est nécessaire.
         
@@ -42,6 +45,8 @@ class AdaptiveTrainingService:
             current_embedding: Embedding du visage actuel
             confidence: Score de confiance de la reconnaissance
             liveness_score: Score de vivacité
+            on_update: Appelé après le commit avec (employee_id, ancien embedding,
+                nouvel embedding), pour mettre à jour la galerie en mémoire
             
         Returns:
             bool: True si une mise à jour a été effectuée, False sinon
@@ -82,7 +87,7 @@ class AdaptiveTrainingService:
         
         # 5. Si stabilité atteinte, effectuer la mise à jour
         if state['count'] >= self.STABILITY_COUNT:
-            success = self._update_employee_profile(db, employee_id, state['accumulated_embedding'])
+            success = self._update_employee_profile(db, employee_id, state['accumulated_embedding'], on_update)
             if success:
                 # Mettre à jour l'état
                 state['last_update'] = now
@@ -92,33 +97,31 @@ class AdaptiveTrainingService:
                 
         return False
     
-    def _update_employee_profile(self, db: Session, employee_id: int, new_face_embedding: np.ndarray) -> bool:
+    def _update_employee_profile(self, db: Session, employee_id: int, new_face_embedding: np.ndarray,
+                                 on_update: Optional[Callable] = None) -> bool:
         """
         Met à jour l'embedding en base de données avec une moyenne pondérée.
-        Choisit l'embedding le plus proche parmi les 6 disponibles.
+        Choisit l'embedding le plus proche parmi ceux de la table face_embeddings.
         """
         try:
-            employee = db.query(Employee).filter(Employee.id == employee_id).first()
-            if not employee:
-                return False
-                
-            import pickle
+            # Only the narrow face_embeddings rows, not the employee record
+            rows = db.query(FaceEmbedding).filter(
+                FaceEmbedding.employee_id == employee_id,
+                FaceEmbedding.model_version == embedding_format.MODEL_VERSION
+            ).all()
             
             # Find the closest embedding to update
-            best_idx = -1
+            best_row = None
             best_sim = -1.0
             best_embedding = None
             
             embeddings = []
-            # Load all 6 embeddings
-            for i in range(1, 7):
-                emb_field = getattr(employee, f'embedding{i}', None)
-                if emb_field:
-                    try:
-                        emb = pickle.loads(emb_field)
-                        embeddings.append((i, emb))
-                    except:
-                        pass
+            # Load every stored slot
+            for row in rows:
+                try:
+                    embeddings.append((row, embedding_format.decode_embedding(row.vector)))
+                except:
+                    pass
             
             if not embeddings:
                 return False
@@ -127,15 +130,15 @@ class AdaptiveTrainingService:
             new_emb_norm = new_face_embedding / (np.linalg.norm(new_face_embedding) + 1e-10)
             
             # Find closest
-            for idx, emb in embeddings:
+            for row, emb in embeddings:
                 emb_norm = emb / (np.linalg.norm(emb) + 1e-10)
                 sim = np.dot(emb_norm, new_emb_norm)
                 if sim > best_sim:
                     best_sim = sim
-                    best_idx = idx
+                    best_row = row
                     best_embedding = emb
             
-            if best_idx == -1:
+            if best_row is None:
                 return False
                 
             # Update the best matching embedding
@@ -146,10 +149,15 @@ class AdaptiveTrainingService:
             updated_embedding = updated_embedding / np.linalg.norm(updated_embedding)
             
             # Encoder et sauvegarder
-            setattr(employee, f'embedding{best_idx}', pickle.dumps(updated_embedding))
+            best_row.vector = embedding_format.encode_embedding(updated_embedding)
+            embedding_store.bump_generation(db)
             
             db.commit()
-            logger.info(f"✅ PROFILE UPDATED: Employee {employee_id} (Embedding {best_idx}) adapted to new appearance.")
+            logger.info(f"✅ PROFILE UPDATED: Employee {employee_id} (Embedding {best_row.slot}) adapted to new appearance.")
+            
+            # Write-through: the live gallery gets the same vector as the database
+            if on_update is not None:
+                on_update(employee_id, best_embedding, updated_embedding)
             return True
             
         except Exception as e:
@@ -0,0 +1,159 @@
+"""
+IVF approximate nearest-neighbour index for large face galleries (pure NumPy).
+The gallery is partitioned with spherical k-means; a query only scans the
+`nprobe` closest lists, whose candidates are then scored exactly against the
+full-precision float32 vectors.
+"""
+import numpy as np
+
+
+class IVFIndex:
+    """
+    Inverted-file index over an L2-normalized gallery matrix.
+    Rows are stored grouped by list so each probed list is a contiguous slice.
+    """
+
+    def __init__(self, matrix, nlist=None, nprobe=16, centroids=None, assignment=None,
+                 n_iter=10, seed=0):
+        """
+        Args:
+            matrix: (N, D) L2-normalized float32 gallery
+            nlist: number of inverted lists (default: 4 * sqrt(N))
+            nprobe: lists scanned per query
+            centroids: reuse already-trained centroids (skips k-means)
+            assignment: reuse per-row list ids (skips the N x nlist assignment)
+        """
+        n = len(matrix)
+        if centroids is None:
+            nlist = nlist or max(1, int(4 * np.sqrt(n)))
+            centroids = self.train_centroids(matrix, min(nlist, n), n_iter=n_iter, seed=seed)
+
+        self.trained_size = n  # Gallery size the centroids were built for
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nlist = len(self.centroids)
+        self.nprobe = min(nprobe, self.nlist)
+        self.size = n
+
+        # Group rows by list
+        if assignment is None:
+            assignment = self.assign(matrix, self.centroids)
+        self.assignment = assignment
+        self.order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=self.nlist)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.vectors = np.ascontiguousarray(matrix[self.order])
+
+    @staticmethod
+    def assign(matrix, centroids, chunk=8192):
+        """Closest centroid per row (chunked to bound the N x nlist buffer)"""
+        assignment = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), chunk):
+            block = matrix[start:start + chunk]
+            assignment[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+        return assignment
+
+    @classmethod
+    def train_centroids(cls, matrix, nlist, n_iter=10, seed=0, max_train_points=64):
+        """Spherical k-means on (a sample of) the gallery"""
+        rng = np.random.default_rng(seed)
+        n = len(matrix)
+
+        sample_size = min(n, nlist * max_train_points)
+        sample = matrix[rng.choice(n, sample_size, replace=False)] if sample_size < n else matrix
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assignment = cls.assign(sample, centroids)
+            counts = np.bincount(assignment, minlength=nlist)
+
+            # Per-list sums via one sort + reduceat (np.add.at is far slower)
+            order = np.argsort(assignment, kind='stable')
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+
+            # Re-seed empty lists with random sample points
+            empty = ~filled
+            if np.any(empty):
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+
+            centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-10)
+
+        return centroids.astype(np.float32)
+
+    def updated(self, matrix, keep, nprobe=None):
+        """
+        Index for a patched gallery: rows `keep` of the old gallery followed by
+        appended rows. Existing list ids are reused; only new rows are assigned.
+        """
+        n_new = len(matrix) - int(np.count_nonzero(keep))
+        assignment = np.concatenate([
+            self.assignment[keep],
+            self.assign(matrix[len(matrix) - n_new:], self.centroids)
+        ])
+        index = IVFIndex(matrix, nprobe=nprobe or self.nprobe,
+                         centroids=self.centroids, assignment=assignment)
+        index.trained_size = self.trained_size
+        return index
+
+    def replaced(self, matrix, row):
+        """Index for a gallery where only `row` changed (re-assigned to its closest list)"""
+        assignment = self.assignment.copy()
+        assignment[row] = self.assign(matrix[row:row + 1], self.centroids)[0]
+        index = IVFIndex(matrix, nprobe=self.nprobe, centroids=self.centroids, assignment=assignment)
+        index.trained_size = self.trained_size
+        return index
+
+    def reassigned(self, matrix, nprobe=None):
+        """Index over a whole new gallery with the same centroids (no k-means)"""
+        index = IVFIndex(matrix, nprobe=nprobe or self.nprobe, centroids=self.centroids)
+        index.trained_size = self.trained_size
+        return index
+
+    # Arrays that fully describe a built index (saved in the gallery snapshot)
+    STATE_ARRAYS = ("centroids", "assignment", "order", "offsets", "vectors")
+
+    def state(self):
+        """(arrays, scalars) to persist the index without rebuilding it on load"""
+        arrays = {name: getattr(self, name) for name in self.STATE_ARRAYS}
+        return arrays, {"nprobe": self.nprobe, "trained_size": self.trained_size}
+
+    @classmethod
+    def from_state(cls, arrays, scalars):
+        """Index from state() output; arrays may be read-only memory maps"""
+        index = cls.__new__(cls)
+        for name in cls.STATE_ARRAYS:
+            setattr(index, name, arrays[name])
+        index.nlist = len(index.centroids)
+        index.nprobe = min(scalars["nprobe"], index.nlist)
+        index.trained_size = scalars["trained_size"]
+        index.size = len(index.order)
+        return index
+
+    def search(self, query, k=1):
+        """
+        Approximate top-k cosine search
+        Returns: (row_indices, similarities) into the original gallery matrix, best first
+        """
+        probe = np.argpartition(-(self.centroids @ query), self.nprobe - 1)[:self.nprobe]
+
+        rows = []
+        sims = []
+        for lst in probe:
+            start, end = self.offsets[lst], self.offsets[lst + 1]
+            if start == end:
+                continue
+            rows.append(np.arange(start, end))
+            sims.append(self.vectors[start:end] @ query)
+
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        rows = np.concatenate(rows)
+        sims = np.concatenate(sims)
+
+        k = min(k, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return self.order[rows[top]], sims[top]
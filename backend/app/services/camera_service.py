@@ -3,12 +3,15 @@ import threading
 import time
 from ..models import Camera
 from ..database import SessionLocal
+from .metrics import metrics
 
 class CameraStream:
-    def __init__(self, source):
+    def __init__(self, source, camera_id=None):
         self.source = source
+        self.camera_id = camera_id
         self.frame = None
         self.preview_frame = None # Cached resized frame
+        self.frame_count = 0 # Frames captured since start (detects dropped frames)
         self.lock = threading.Lock()
         self.running = False
         self.thread = None
@@ -67,6 +70,8 @@ class CameraStream:
                     with self.lock:
                         self.frame = frame
                         self.preview_frame = preview
+                        self.frame_count += 1
+                    metrics.count(self.camera_id, "captured")
                 else:
                     # Try to reconnect
                     print(f"Stream lost for {self.source}, reconnecting...")
@@ -89,6 +94,15 @@ class CameraStream:
         with self.lock:
             return self.preview_frame.copy() if self.preview_frame is not None else None
 
+    def read_pair(self):
+        """
+        (full-res frame, preview) from the same capture, or (None, None)
+        Not copied: _update replaces both arrays on every capture and never writes
+        into them, so callers must treat them as read-only.
+        """
+        with self.lock:
+            return self.frame, self.preview_frame
+
 class CameraService:
     def __init__(self):
         self.cameras = {} # id -> CameraStream
@@ -99,7 +113,7 @@ class CameraService:
         if camera_id in self.cameras:
             return
 
-        stream = CameraStream(source)
+        stream = CameraStream(source, camera_id)
         stream.start()
         
         if stream.running:
@@ -128,6 +142,20 @@ class CameraService:
         # Use cached preview frame
         return self.cameras[camera_id].read_preview()
 
+    def get_frame_pair(self, camera_id):
+        """Frame-synchronized (full-res, preview) pair for detect-on-preview / embed-on-full-res"""
+        if camera_id not in self.cameras:
+            return None, None
+        
+        return self.cameras[camera_id].read_pair()
+
+    def get_frame_count(self, camera_id):
+        """Frames captured so far by a running camera, or None"""
+        if camera_id not in self.cameras:
+            return None
+        
+        return self.cameras[camera_id].frame_count
+
     def get_frame_jpeg(self, camera_id, quality=None, preview=True):
         if quality is None:
             quality = 90  # Increased default quality to 90%
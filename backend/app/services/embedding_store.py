@@ -0,0 +1,112 @@
+"""
+Access to the face_embeddings table: one row per (employee, slot, model
+version), vectors in the embedding_format raw layout. Queries only touch this
+narrow table, never the wide employees rows with their photo BLOBs.
+
+Every write also bumps the gallery generation (system_settings
+"gallery_generation", hidden from the settings API), which tells the on-disk
+gallery snapshot whether it is still current. gallery_fingerprint() backs it
+up with a check on the table contents.
+"""
+from sqlalchemy import Integer, String, cast, func
+from sqlalchemy.orm import Session
+
+from ..models import Employee, FaceEmbedding, SystemSettings
+from .. import embedding_format
+from ..embedding_format import MODEL_VERSION
+
+GENERATION_KEY = "gallery_generation"
+
+# system_settings rows maintained by the server itself (not listed, edited or
+# deleted through the /settings/ endpoints)
+INTERNAL_SETTINGS = frozenset({GENERATION_KEY})
+
+
+def gallery_rows(db: Session, model_version=MODEL_VERSION):
+    """(employee_id, vector blob) of every stored embedding, grouped by employee"""
+    return db.query(FaceEmbedding.employee_id, FaceEmbedding.vector).filter(
+        FaceEmbedding.model_version == model_version
+    ).order_by(FaceEmbedding.employee_id, FaceEmbedding.slot).all()
+
+
+def gallery_size(db: Session, model_version=MODEL_VERSION):
+    """Number of stored embeddings (gallery rows)"""
+    return db.query(FaceEmbedding).filter(FaceEmbedding.model_version == model_version).count()
+
+
+def gallery_fingerprint(db: Session, model_version=MODEL_VERSION):
+    """
+    Content check of the stored embeddings: row count + latest updated_at
+    Independent of the generation counter, so a snapshot is not taken as
+    current after the counter was reset.
+    """
+    count, last_update = db.query(func.count(), func.max(FaceEmbedding.updated_at)).filter(
+        FaceEmbedding.model_version == model_version
+    ).one()
+    return f"{count}/{last_update.isoformat() if last_update is not None else ''}"
+
+
+def employee_names(db: Session):
+    """{employee_id: name} (two columns, no BLOBs)"""
+    return dict(db.query(Employee.id, Employee.name).all())
+
+
+def gallery_generation(db: Session):
+    """Current gallery generation (0 if the gallery was never written)"""
+    value = db.query(SystemSettings.value).filter(SystemSettings.key == GENERATION_KEY).scalar()
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def bump_generation(db: Session):
+    """
+    Mark the gallery as changed (caller commits, in the same transaction as the change)
+    Also call it for name changes: names are part of the snapshot.
+    """
+    updated = db.query(SystemSettings).filter(SystemSettings.key == GENERATION_KEY).update(
+        {SystemSettings.value: cast(cast(SystemSettings.value, Integer) + 1, String)},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(SystemSettings(key=GENERATION_KEY, value="1",
+                              description="Face gallery version (gallery snapshot validation)"))
+        # Flushed right away: with autoflush off, a second bump in the same transaction
+        # would not see this row and insert a duplicate key
+        db.flush()
+
+
+def employee_embeddings(db: Session, employee_id: int, model_version=MODEL_VERSION):
+    """{slot: 1-D float32 embedding} of one employee"""
+    rows = db.query(FaceEmbedding.slot, FaceEmbedding.vector).filter(
+        FaceEmbedding.employee_id == employee_id,
+        FaceEmbedding.model_version == model_version
+    ).order_by(FaceEmbedding.slot).all()
+    return {slot: embedding_format.decode_embedding(vector) for slot, vector in rows}
+
+
+def save_embeddings(db: Session, employee_id: int, blobs_by_slot, model_version=MODEL_VERSION):
+    """
+    Insert or replace the given slots of one employee (caller commits)
+    blobs_by_slot: {slot: embedding_format blob}
+    """
+    existing = {
+        row.slot: row for row in db.query(FaceEmbedding).filter(
+            FaceEmbedding.employee_id == employee_id,
+            FaceEmbedding.model_version == model_version,
+            FaceEmbedding.slot.in_(list(blobs_by_slot))
+        )
+    }
+    for slot, blob in blobs_by_slot.items():
+        if slot in existing:
+            existing[slot].vector = blob
+        else:
+            db.add(FaceEmbedding(employee_id=employee_id, slot=slot, model_version=model_version, vector=blob))
+    bump_generation(db)
+
+
+def delete_embeddings(db: Session, employee_id: int):
+    """Drop every stored embedding of one employee, all model versions (caller commits)"""
+    db.query(FaceEmbedding).filter(FaceEmbedding.employee_id == employee_id).delete(synchronize_session=False)
+    bump_generation(db)
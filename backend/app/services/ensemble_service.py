@@ -6,7 +6,7 @@ import numpy as np
 import cv2
 import logging
 from typing import Dict, List, Tuple, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, undefer_group
 from ..models import Employee
 
 # Configuration du logging
@@ -46,7 +46,7 @@ class EnsembleService:
         logger.info("Initializing Ensemble Service (DeepFace ArcFace)...")
         try:
             # Charger les employés
-            employees = db.query(Employee).all()
+            employees = db.query(Employee).options(undefer_group("photos")).all()
             count = 0
             
             for emp in employees:
@@ -4,13 +4,24 @@ Removed MediaPipe dependency for 3-5x performance improvement
 """
 
 import insightface
-from insightface.app import FaceAnalysis
 import numpy as np
 import cv2
-import pickle
+import os
 from .adaptive_training_service import adaptive_training_service
+from .ann_index import IVFIndex
+from .model_pool import FaceAnalysisPool
+from .inference_workers import InferenceWorkerPool
+from .metrics import metrics
+from .. import face_pipeline
+from .. import embedding_format
+from . import embedding_store
+from . import gallery_snapshot
+from .gallery import Gallery
 import threading
 
+EMBEDDING_DIM = 512  # buffalo_l ArcFace (w600k_r50) output size
+MIN_ENROLL_IMAGE_SIZE = 200  # Enrollment photos: minimum width and height (px)
+
 class FaceService:
     # ArcFace 112x112 alignment template (standard)
     ARCFACE_TEMPLATE = np.array([
@@ -21,39 +32,324 @@ class FaceService:
         [70.7299, 92.2041]   # right mouth corner
     ], dtype=np.float32)
     
-    def __init__(self):
-        """Initialize InsightFace buffalo_l model"""
-        self.app = FaceAnalysis(
-            name='buffalo_l',
-            providers=['CPUExecutionProvider'],
-            allowed_modules=['detection', 'recognition']
-        )
-        self.app.prepare(ctx_id=0, det_size=(640, 640))
+    def __init__(self, pool=None):
+        """
+        Initialize InsightFace buffalo_l model pool
+        pool: pre-built FaceAnalysisPool (benchmarks / tests); loaded from env settings
+        on first use if None (load_models() at startup), so importing the module
+        never loads the ONNX models
+        """
+        # N independent model instances; each inference call checks one out
+        self._pool = pool
+        self._pool_lock = threading.Lock()
+        
+        # Gallery: L2-normalized float32 matrix (one row per reference embedding)
+        # + int32 employee id per row + names + IVF index, in one immutable object.
+        # Writers swap in a new Gallery (under gallery_lock); readers just take a reference.
+        self.gallery = Gallery.empty(EMBEDDING_DIM)
         
-        self.known_embeddings = []
-        self.known_names = []
-        self.known_ids = []
+        # Out-of-process inference (started by start_workers when INFERENCE_WORKERS > 0)
+        self.workers = None
+        
+        # IVF index, used instead of brute force once the gallery is large enough
+        self.ann_min_gallery_size = int(os.getenv("ANN_MIN_GALLERY_SIZE", "20000"))
+        self.ann_nprobe = int(os.getenv("ANN_NPROBE", "16"))
         
         self.adaptive_training_service = adaptive_training_service
-        self.lock = threading.Lock()  # Thread-safe operations
-    
-    def load_embeddings(self, db_employees):
-        """Load all 6 embeddings from database into memory"""
-        self.known_embeddings = []
-        self.known_names = []
-        self.known_ids = []
-        
-        for emp in db_employees:
-            for emb_field in [emp.embedding1, emp.embedding2, emp.embedding3,
-                            emp.embedding4, emp.embedding5, emp.embedding6]:
-                if emb_field:
-                    emb = pickle.loads(emb_field)
-                    self.known_embeddings.append(emb)
-                    self.known_names.append(emp.name)
-                    self.known_ids.append(emp.id)
-        
-        if self.known_embeddings:
-            self.known_embeddings = np.array(self.known_embeddings)
+        self.gallery_lock = threading.Lock()  # Serializes gallery writers (readers never lock)
+        
+        # On-disk gallery snapshot (enabled by open_gallery)
+        self.session_factory = None
+        self.snapshot_dir = None
+        self.snapshot_delay = float(os.getenv("GALLERY_SNAPSHOT_DELAY", "30"))  # Quiet period before re-saving
+        self.snapshot_lock = threading.Lock()  # One refresh at a time
+        self.snapshot_timer = None
+        self.timer_lock = threading.Lock()
+    
+    def start_workers(self):
+        """Start the inference worker processes if INFERENCE_WORKERS > 0"""
+        n_workers = int(os.getenv("INFERENCE_WORKERS", "0"))
+        if n_workers > 0 and self.workers is None:
+            self.workers = InferenceWorkerPool(
+                n_workers,
+                intra_op_threads=int(os.getenv("INFERENCE_WORKER_THREADS", "0"))
+            )
+    
+    def stop_workers(self):
+        if self.workers is not None:
+            self.workers.stop()
+            self.workers = None
+    
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = FaceAnalysisPool.create(
+                        size=int(os.getenv("FACE_SESSION_POOL_SIZE", "1")),
+                        intra_op_threads=int(os.getenv("FACE_SESSION_THREADS", "0")),
+                        det_size=(640, 640)
+                    )
+        return self._pool
+    
+    @pool.setter
+    def pool(self, value):
+        self._pool = value
+    
+    def load_models(self):
+        """Load the model pool now (startup) instead of on the first request"""
+        return self.pool
+    
+    @property
+    def app(self):
+        """Primary FaceAnalysis instance (first member of the pool)"""
+        return self.pool.instances[0]
+    
+    @app.setter
+    def app(self, value):
+        self.pool = FaceAnalysisPool([value])
+    
+    # Read-only views of the current gallery (a reader needing several of them
+    # should take `self.gallery` once instead)
+    @property
+    def gallery_matrix(self):
+        return self.gallery.matrix
+    
+    @property
+    def gallery_ids(self):
+        return self.gallery.ids
+    
+    @property
+    def employee_names(self):
+        return self.gallery.names
+    
+    @property
+    def ann_index(self):
+        return self.gallery.ann_index
+    
+    def open_gallery(self, session_factory, snapshot_dir=None):
+        """
+        Startup gallery load from the memory-mapped snapshot (GALLERY_SNAPSHOT_DIR)
+        - current snapshot: used as-is, nothing read from the embeddings table
+        - stale snapshot: served right away, reloaded from the database in the background
+        - no snapshot: loaded from the database, then saved
+        """
+        self.session_factory = session_factory
+        self.snapshot_dir = snapshot_dir or os.getenv("GALLERY_SNAPSHOT_DIR", "gallery_snapshot")
+        
+        snapshot = gallery_snapshot.load(self.snapshot_dir)
+        if snapshot is None:
+            self.refresh_gallery()
+            return
+        
+        with self.gallery_lock:
+            self.gallery = Gallery(snapshot["matrix"], snapshot["ids"], snapshot["names"], snapshot["ann_index"])
+        
+        db = session_factory()
+        try:
+            current = (snapshot["generation"] == embedding_store.gallery_generation(db)
+                       and snapshot["fingerprint"] == embedding_store.gallery_fingerprint(db))
+        finally:
+            db.close()
+        if not current:
+            print("Gallery snapshot is stale, reloading in the background")
+            threading.Thread(target=self.refresh_gallery, daemon=True).start()
+    
+    def refresh_gallery(self):
+        """
+        Reload the gallery from the database and save it as the new snapshot
+        The reload is only swapped in if the in-memory gallery did not change
+        meanwhile (it could be missing that change); another refresh is then scheduled.
+        """
+        with self.snapshot_lock:
+            start = self.gallery
+            db = self.session_factory()
+            try:
+                # Generation first: the snapshot may be newer than its label, never older
+                generation = embedding_store.gallery_generation(db)
+                fingerprint = embedding_store.gallery_fingerprint(db)
+                rows = embedding_store.gallery_rows(db)
+                names = embedding_store.employee_names(db)
+            finally:
+                db.close()
+            
+            matrix = self.build_gallery_matrix(embedding_format.decode_embeddings([blob for _, blob in rows]))
+            ids = np.asarray([emp_id for emp_id, _ in rows], dtype=np.int32)
+            ann_index = self.build_ann_index(matrix, reuse_centroids=True)
+            
+            with self.gallery_lock:
+                swapped = self.gallery is start
+                if swapped:
+                    self.gallery = Gallery(matrix, ids, names, ann_index)
+            
+            try:
+                gallery_snapshot.save(self.snapshot_dir, generation, matrix, ids, names, ann_index,
+                                      fingerprint=fingerprint)
+            except OSError as e:
+                print(f"Gallery snapshot save failed: {e}")
+        
+        if not swapped:
+            self.schedule_refresh()
+    
+    def schedule_refresh(self):
+        """Refresh the snapshot once the gallery has been quiet for snapshot_delay seconds"""
+        if self.snapshot_dir is None:
+            return
+        timer = threading.Timer(self.snapshot_delay, self.refresh_gallery)
+        timer.daemon = True
+        with self.timer_lock:
+            if self.snapshot_timer is not None:
+                self.snapshot_timer.cancel()
+            self.snapshot_timer = timer
+        timer.start()
+    
+    def close_gallery(self):
+        """Shutdown: run a pending snapshot refresh now so the next start finds it current"""
+        with self.timer_lock:
+            timer, self.snapshot_timer = self.snapshot_timer, None
+        if timer is not None and not timer.finished.is_set():
+            timer.cancel()
+            self.refresh_gallery()
+    
+    def load_embeddings(self, db):
+        """Load every stored embedding (face_embeddings table) into memory"""
+        self.load_gallery(embedding_store.gallery_rows(db), embedding_store.employee_names(db))
+    
+    def load_gallery(self, rows, names):
+        """
+        Build the in-memory gallery
+        rows: (employee_id, embedding blob) pairs, grouped by employee
+        names: {employee_id: name}
+        """
+        ids = [emp_id for emp_id, _ in rows]
+        
+        # Raw-format blobs are joined straight into the matrix
+        embeddings = embedding_format.decode_embeddings([blob for _, blob in rows])
+        
+        matrix = self.build_gallery_matrix(embeddings)
+        # Index trained before taking the lock (as in refresh_gallery): writers only wait for the swap
+        gallery = Gallery(matrix, np.asarray(ids, dtype=np.int32), names, self.build_ann_index(matrix))
+        with self.gallery_lock:
+            self.gallery = gallery
+    
+    def upsert_employee(self, emp_id, name, embeddings):
+        """
+        Replace the gallery rows of a single employee (add if new)
+        Only the affected rows are rebuilt; other employees are copied as-is.
+        """
+        self.upsert_employees([(emp_id, name, embeddings)])
+    
+    def upsert_employees(self, entries):
+        """
+        upsert_employee for several employees with a single gallery rebuild
+        entries: list of (emp_id, name, embeddings)
+        """
+        new_rows = [self.build_gallery_matrix(embeddings) for _, _, embeddings in entries]
+        new_ids = [np.full(len(rows), emp_id, dtype=np.int32) for (emp_id, _, _), rows in zip(entries, new_rows)]
+        
+        def update(current):
+            keep = ~np.isin(current.ids, [emp_id for emp_id, _, _ in entries])
+            matrix = np.ascontiguousarray(np.concatenate([current.matrix[keep]] + new_rows))
+            ids = np.concatenate([current.ids[keep]] + new_ids)
+            
+            names = dict(current.names)
+            for emp_id, name, _ in entries:
+                names[emp_id] = name
+            return matrix, ids, names, keep
+        
+        self.update_gallery(update)
+    
+    def replace_embedding(self, emp_id, old_embedding, new_embedding):
+        """
+        Swap one gallery row of an employee (the one closest to old_embedding) for
+        new_embedding, e.g. after an adaptive-training update
+        Readers keep the previous gallery; the new one is swapped in whole.
+        Returns False if the employee is not in the gallery.
+        """
+        old_row = self.build_gallery_matrix([old_embedding])[0]
+        new_row = self.build_gallery_matrix([new_embedding])[0]
+        
+        with self.gallery_lock:
+            current = self.gallery
+            rows = np.flatnonzero(current.ids == emp_id)
+            if len(rows) == 0:
+                return False
+            row = int(rows[np.argmax(current.matrix[rows] @ old_row)])
+            
+            matrix = np.array(current.matrix)  # Writable copy of the frozen matrix
+            matrix[row] = new_row
+            ann_index = current.ann_index.replaced(matrix, row) if current.ann_index is not None else None
+            self.gallery = Gallery(matrix, current.ids, current.names, ann_index)
+        self.schedule_refresh()
+        return True
+    
+    def remove_employee(self, emp_id):
+        """Drop all gallery rows of a single employee"""
+        def update(current):
+            keep = current.ids != emp_id
+            names = dict(current.names)
+            names.pop(emp_id, None)
+            return np.ascontiguousarray(current.matrix[keep]), current.ids[keep], names, keep
+        
+        self.update_gallery(update)
+    
+    def update_gallery(self, update):
+        """
+        Publish a gallery derived from the current one
+        update(gallery) -> (matrix, ids, names, keep), `keep` marking the rows of
+        `gallery` carried over (first) into `matrix`
+        The IVF index is built outside gallery_lock: crossing a retraining threshold
+        runs k-means, which must not stall the other writers. If one of them published
+        meanwhile, the update is re-applied to its gallery under the lock, assigned
+        to the centroids just built (no k-means under the lock).
+        """
+        start = self.gallery
+        matrix, ids, names, keep = update(start)
+        ann_index = self.build_ann_index(matrix, keep, base=start)
+        
+        with self.gallery_lock:
+            current = self.gallery
+            if current is not start:
+                matrix, ids, names, keep = update(current)
+                if ann_index is not None:
+                    ann_index = ann_index.reassigned(matrix)
+                else:
+                    ann_index = self.build_ann_index(matrix, keep, base=current)
+            self.gallery = Gallery(matrix, ids, names, ann_index)
+        self.schedule_refresh()
+    
+    def build_ann_index(self, matrix, keep=None, reuse_centroids=False, base=None):
+        """
+        IVF index for a gallery above ann_min_gallery_size, else None (brute force)
+        keep: rows of the current gallery carried over to `matrix` (then followed by
+        new rows); lets the current index be patched instead of retrained.
+        reuse_centroids: `matrix` is a full reload; assign it to the current centroids.
+        base: gallery `matrix` derives from (default: the published one)
+        """
+        if len(matrix) < max(1, self.ann_min_gallery_size):
+            return None
+        
+        current = (self.gallery if base is None else base).ann_index
+        if current is not None and len(matrix) <= 2 * current.trained_size:
+            if keep is not None:
+                return current.updated(matrix, keep, nprobe=self.ann_nprobe)
+            if reuse_centroids:
+                return current.reassigned(matrix, nprobe=self.ann_nprobe)
+        
+        return IVFIndex(matrix, nprobe=self.ann_nprobe)
+    
+    @staticmethod
+    def build_gallery_matrix(embeddings):
+        """
+        Stack embeddings into a contiguous, L2-normalized float32 matrix
+        Returns: (N, EMBEDDING_DIM) array, ready for a single matrix-vector product
+        """
+        if len(embeddings) == 0:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        matrix /= (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-10)
+        return np.ascontiguousarray(matrix)
     
     # ==================== ALIGNMENT ====================
     
@@ -118,44 +414,29 @@ class FaceService:
     
     def calculate_texture_liveness(self, face_crop):
         """
-        Lightweight texture-based liveness on cropped ROI
+        Lightweight texture-based liveness on a single crop, scored like
+        face_pipeline.liveness_scores: sharpness on the central pixels at their
+        own scale, color on the crop resized to the aligned crop size
         Returns: liveness_score (0.0 to 1.0)
         """
         if face_crop is None or face_crop.size == 0:
             return 0.0
         
         try:
-            # Convert to grayscale
-            if len(face_crop.shape) == 3:
-                gray = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
-            else:
-                gray = face_crop
-            
-            # Calculate Laplacian variance (sharpness)
-            laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-            
-            # Normalize to 0-1 range
-            # Real faces: 100-500, photos/screens: 10-100
-            if laplacian_var > 500:
-                score_sharpness = 1.0
-            elif laplacian_var > 100:
-                score_sharpness = (laplacian_var - 100) / 400
-            else:
-                score_sharpness = laplacian_var / 100
+            size = face_pipeline.LIVENESS_CROP_SIZE
+            h, w = face_crop.shape[:2]
+            y1, x1 = max(0, (h - size) // 2), max(0, (w - size) // 2)
+            detail = face_crop[y1:y1 + size, x1:x1 + size]
+            score_sharpness = float(face_pipeline.sharpness_scores(detail[None])[0])
             
             # Color variance (real faces have more color variation)
             if len(face_crop.shape) == 3:
-                hsv = cv2.cvtColor(face_crop, cv2.COLOR_BGR2HSV)
-                h, s, v = cv2.split(hsv)
-                color_var = np.std(s)
-                score_color = min(1.0, color_var / 50)
+                crop = cv2.resize(face_crop, (size, size))
+                score_color = float(face_pipeline.color_scores(crop[None])[0])
             else:
                 score_color = 0.5
             
-            # Weighted average
-            final_score = (score_sharpness * 0.7) + (score_color * 0.3)
-            
-            return float(min(1.0, max(0.0, final_score)))
+            return float(min(1.0, max(0.0, score_sharpness * 0.7 + score_color * 0.3)))
         
         except Exception as e:
             print(f"Liveness calculation error: {e}")
@@ -179,6 +460,37 @@ class FaceService:
     
     # ==================== FACE REGISTRATION ====================
     
+    def image_size_issue(self, img_w, img_h):
+        if img_w < MIN_ENROLL_IMAGE_SIZE or img_h < MIN_ENROLL_IMAGE_SIZE:
+            return f"Image too small ({img_w}x{img_h}). Minimum {MIN_ENROLL_IMAGE_SIZE}x{MIN_ENROLL_IMAGE_SIZE} required."
+        return None
+    
+    def face_quality_issue(self, faces, img_w, img_h, scale=1.0):
+        """
+        Enrollment quality rules on detected faces
+        scale: detection image size / original image size (checks use original pixels)
+        Returns: None if OK, else the reason
+        """
+        if not faces:
+            return "No face detected"
+            
+        if len(faces) > 1:
+            return f"Multiple faces detected ({len(faces)}). Please provide a photo with a single face."
+            
+        # Check face size
+        box = faces[0].bbox / scale
+        face_w = box[2] - box[0]
+        face_h = box[3] - box[1]
+        
+        if face_w < 80 or face_h < 80:
+            return "Face too small. Please move closer to camera."
+            
+        # Check centrality
+        if not self.is_face_centered(box, img_w, img_h):
+            return "Face not centered. Please look straight at the camera."
+        
+        return None
+    
     def check_face_quality(self, image_bytes):
         """
         Check if image has a valid face and good quality
@@ -193,29 +505,16 @@ class FaceService:
                 
             # Check resolution
             h, w = img.shape[:2]
-            if h < 200 or w < 200:
-                return False, f"Image too small ({w}x{h}). Minimum 200x200 required."
+            issue = self.image_size_issue(w, h)
+            if issue:
+                return False, issue
                 
             # Detect face
-            faces = self.app.get(img)
-            if not faces:
-                return False, "No face detected"
-                
-            if len(faces) > 1:
-                return False, f"Multiple faces detected ({len(faces)}). Please provide a photo with a single face."
-                
-            # Check face size
-            face = faces[0]
-            box = face.bbox
-            face_w = box[2] - box[0]
-            face_h = box[3] - box[1]
-            
-            if face_w < 80 or face_h < 80:
-                return False, "Face too small. Please move closer to camera."
-                
-            # Check centrality
-            if not self.is_face_centered(face.bbox, w, h):
-                 return False, "Face not centered. Please look straight at the camera."
+            with self.pool.checkout() as app:
+                faces = app.get(img)
+            issue = self.face_quality_issue(faces, w, h)
+            if issue:
+                return False, issue
 
             return True, "Quality OK"
             
@@ -225,7 +524,7 @@ class FaceService:
     def register_face(self, image_bytes, is_grayscale=False):
         """
         Register face from image bytes
-        Returns: (processed_bytes, embedding_pickle)
+        Returns: (processed_bytes, embedding_blob) (embedding_format raw bytes)
         """
         nparr = np.frombuffer(image_bytes, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
@@ -233,8 +532,8 @@ class FaceService:
         # Normalize
         img = self.normalize_image(img)
         
-        # Detect face
-        faces = self.app.get(img)
+        # Detect face (detection only; the embedding comes from the aligned crop)
+        faces = self.detect([img])[0]
         if not faces:
             return None, None
         
@@ -245,47 +544,144 @@ class FaceService:
         # Align face
         aligned = self.align_face_arcface(img, face.kps)
         if aligned is None:
-            # Fallback: use face embedding without alignment
-            return None, pickle.dumps(face.embedding)
+            # Fallback: embedding from InsightFace's own alignment, no crop stored
+            self.embed([(img, face)])
+            return None, embedding_format.encode_embedding(face.embedding)
         
         # Apply grayscale if requested
         if is_grayscale:
             aligned = cv2.cvtColor(aligned, cv2.COLOR_BGR2GRAY)
             aligned = cv2.cvtColor(aligned, cv2.COLOR_GRAY2BGR)
         
-        # Get embedding from aligned face
-        aligned_faces = self.app.get(aligned)
-        if aligned_faces:
-            embedding = aligned_faces[0].embedding
-        else:
-            embedding = face.embedding  # Fallback
+        # Embed the aligned crop directly with the recognition model
+        embedding = self.embed_aligned([aligned])[0]
         
         # Return aligned image bytes and embedding
         _, img_encoded = cv2.imencode('.jpg', aligned)
         processed_bytes = img_encoded.tobytes()
         
-        return processed_bytes, pickle.dumps(embedding)
+        return processed_bytes, embedding_format.encode_embedding(embedding)
+    
+    def enroll_photos(self, photos):
+        """
+        Single-pass enrollment: each photo is decoded once, one detection serves
+        both the quality checks and the alignment, and all aligned crops go
+        through the recognizer in one batch
+        photos: list of (image_bytes, is_grayscale)
+        Returns: one (processed_bytes, embedding_blob, quality_issue) per photo
+        - quality_issue: reason the photo was rejected (check_face_quality message)
+        - processed_bytes / embedding_blob are None if it could not be aligned
+        """
+        results = [(None, None, None)] * len(photos)
+        
+        # Decode once; detection runs on the normalized image
+        images = {}
+        for i, (image_bytes, _) in enumerate(photos):
+            img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            issue = "Invalid image format" if img is None else self.image_size_issue(img.shape[1], img.shape[0])
+            if issue:
+                results[i] = (None, None, issue)
+            else:
+                images[i] = (img.shape[1], img.shape[0], self.normalize_image(img))
+        
+        order = list(images)
+        try:
+            faces_per_image = self.detect([images[i][2] for i in order])
+        except Exception as e:
+            for i in order:
+                results[i] = (None, None, f"Quality check error: {str(e)}")
+            return results
+        
+        # Quality rules + alignment from the same detection
+        crops = {}
+        for i, faces in zip(order, faces_per_image):
+            orig_w, orig_h, img = images[i]
+            issue = self.face_quality_issue(faces, orig_w, orig_h, scale=img.shape[1] / orig_w)
+            if issue:
+                results[i] = (None, None, issue)
+                continue
+            
+            aligned = self.align_face_arcface(img, faces[0].kps)
+            if aligned is None:
+                continue
+            if photos[i][1]:
+                aligned = cv2.cvtColor(cv2.cvtColor(aligned, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+            crops[i] = aligned
+        
+        # One recognizer call for every aligned crop
+        embeddings = self.embed_aligned([crops[i] for i in crops])
+        for i, embedding in zip(crops, embeddings):
+            _, img_encoded = cv2.imencode('.jpg', crops[i])
+            results[i] = (img_encoded.tobytes(), embedding_format.encode_embedding(embedding), None)
+        
+        return results
     
     # ==================== FACE RECOGNITION ====================
     
     def is_face_centered(self, bbox, img_w, img_h):
         """Check if face is in central zone (50% of frame)"""
-        x1, y1, x2, y2 = bbox
-        face_cx = (x1 + x2) / 2
-        face_cy = (y1 + y2) / 2
-        
-        img_cx = img_w / 2
-        img_cy = img_h / 2
-        
-        zone_w = img_w * 0.5
-        zone_h = img_h * 0.5
+        return face_pipeline.is_face_centered(bbox, img_w, img_h)
+    
+    def detect_and_embed(self, frames):
+        """
+        Detect faces on each frame and embed the ones that pass the size/centering
+        filters, on the inference workers if running, else on a pooled model
+        Returns: one list of faces per frame
+        """
+        if self.workers is not None:
+            # One worker round trip: detection and embedding are timed together
+            with metrics.timer("detect_embed"):
+                return self.workers.detect_and_embed(frames)
+        
+        # face_pipeline.detect_and_embed, split so each stage is timed
+        with self.pool.checkout() as app:
+            with metrics.timer("detection"):
+                faces_per_frame = [face_pipeline.detect_faces(app, frame) for frame in frames]
+            items = [
+                (frame, face)
+                for frame, faces in zip(frames, faces_per_frame)
+                for face in faces
+                if face_pipeline.is_recognizable(face, frame.shape[1], frame.shape[0])
+            ]
+            if items:
+                with metrics.timer("embedding"):
+                    face_pipeline.embed_faces(app, items)
+        return faces_per_frame
+    
+    def detect(self, frames, roi=False):
+        """
+        Detection only (no embedding); one list of faces per frame
+        roi: centered-ROI mode (only the acceptance zone is scanned)
+        """
+        if self.workers is not None:
+            return self.workers.detect(frames, roi=roi)
         
-        zone_x1 = img_cx - zone_w / 2
-        zone_y1 = img_cy - zone_h / 2
-        zone_x2 = img_cx + zone_w / 2
-        zone_y2 = img_cy + zone_h / 2
+        with self.pool.checkout() as app:
+            return [face_pipeline.detect_faces(app, frame, roi=roi) for frame in frames]
+    
+    def embed(self, items):
+        """Embed (frame, face) pairs in one recognition pass; sets face.embedding"""
+        if not items:
+            return
+        if self.workers is not None:
+            self.workers.embed(items)
+            return
+        
+        with self.pool.checkout() as app:
+            face_pipeline.embed_faces(app, items)
+    
+    def embed_aligned(self, crops):
+        """
+        Embed already-aligned 112x112 crops with the recognition model only
+        Returns: (N, 512) embeddings
+        """
+        if len(crops) == 0:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        if self.workers is not None:
+            return self.workers.embed_aligned(crops)
         
-        return (zone_x1 <= face_cx <= zone_x2 and zone_y1 <= face_cy <= zone_y2)
+        with self.pool.checkout() as app:
+            return face_pipeline.embed_aligned(app, crops)
     
     def recognize_faces(self, frame, db=None):
         """
@@ -295,18 +691,131 @@ class FaceService:
         # Normalize frame
         frame = self.normalize_image(frame, max_dim=1280)
         
-        # Detect faces (thread-safe)
-        with self.lock:
-            try:
-                faces = self.app.get(frame)
-            except Exception as e:
-                print(f"Detection error: {e}")
-                return []
+        # Detect faces (on a pooled model instance)
+        try:
+            faces = self.detect_and_embed([frame])[0]
+        except Exception as e:
+            print(f"Detection error: {e}")
+            return []
+        
+        return self.match_faces(frame, faces, db=db)
+    
+    def recognize_batch(self, frames, db=None):
+        """
+        Recognize faces on several images with one batched embedding pass
+        Returns: one list of detection results per frame (same format as recognize_faces)
+        """
+        frames = [self.normalize_image(frame, max_dim=1280) for frame in frames]
+        
+        # Detect per frame, then embed the surviving faces in a single inference call
+        try:
+            faces_per_frame = self.detect_and_embed(frames)
+        except Exception as e:
+            print(f"Detection error: {e}")
+            return [[] for _ in frames]
         
+        return [
+            self.match_faces(frame, faces, db=db)
+            for frame, faces in zip(frames, faces_per_frame)
+        ]
+    
+    def recognize_tracked(self, frame, tracker, db=None, roi=False, full_frame=None):
+        """
+        recognize_faces for a continuous camera stream: detections are linked to
+        tracks and only new, unconfirmed or stale tracks are embedded and matched,
+        using the best-scoring frame of a short window; the other faces reuse
+        their track's cached identity (flagged "cached": True)
+        roi: centered-ROI detection (per-camera setting)
+        full_frame: full-resolution capture `frame` was downscaled from; detection
+        runs on `frame`, cropping/embedding/liveness on `full_frame`
+        Returns: list of detection results (with "track_id"), in `frame` coordinates
+        """
+        frame = self.normalize_image(frame, max_dim=1280)
+        detect_frame = frame
+        sx = sy = 1.0
+        if full_frame is not None:
+            # Separate factors: the preview is not always the capture's aspect ratio
+            frame = self.normalize_image(full_frame, max_dim=1280)
+            sx = frame.shape[1] / detect_frame.shape[1]
+            sy = frame.shape[0] / detect_frame.shape[0]
+        scaled = (sx, sy) != (1.0, 1.0)
+        img_h, img_w = frame.shape[:2]
+        
+        try:
+            with metrics.timer("detection"):
+                faces = self.detect([detect_frame], roi=roi)[0]
+            if scaled:
+                faces = [face_pipeline.scale_face(face, sx, sy) for face in faces]
+            
+            with metrics.timer("tracking"):
+                tracks = tracker.update(faces)
+                
+                # Score candidates cheaply; only a track's best shot reaches ArcFace
+                shots = {}  # id(face) -> (shot_frame, shot_face)
+                for face, track in zip(faces, tracks):
+                    if face_pipeline.is_recognizable(face, img_w, img_h) and tracker.needs_recognition(track):
+                        shot = tracker.offer(track, frame, face, face_pipeline.face_quality(frame, face))
+                        if shot is not None:
+                            shots[id(face)] = shot
+            
+            if shots:
+                with metrics.timer("embedding"):
+                    self.embed(list(shots.values()))
+        except Exception as e:
+            print(f"Detection error: {e}")
+            return []
+        
+        # Match shots grouped by source frame (one vectorized liveness pass per frame)
+        by_frame = {}
+        for face, track in zip(faces, tracks):
+            if id(face) in shots:
+                shot_frame, shot_face = shots[id(face)]
+                by_frame.setdefault(id(shot_frame), (shot_frame, []))[1].append((track, shot_face))
+        for shot_frame, group in by_frame.values():
+            matched = self.match_faces(shot_frame, [shot_face for _, shot_face in group], db=db)
+            for (track, _), result in zip(group, matched):
+                tracker.record(track, result)
+        
+        results = []
+        for face, track in zip(faces, tracks):
+            if id(face) in shots:
+                if track.result is not None:
+                    results.append(tracker.cached_result(track, face, cached=False))
+            elif face_pipeline.is_recognizable(face, img_w, img_h):
+                # Cached identity, or nothing yet while the best shot is being collected
+                if track.result is not None:
+                    results.append(tracker.cached_result(track, face))
+            else:
+                # Filtered faces get their "Positioning..." / skip outcome without embedding
+                for result in self.match_faces(frame, [face], db=db):
+                    result["track_id"] = track.track_id
+                    results.append(result)
+        
+        # Back to the coordinates of the frame the caller draws on
+        if scaled:
+            for result in results:
+                x1, y1, x2, y2 = result["bbox"][:4]
+                result["bbox"] = [x1 / sx, y1 / sy, x2 / sx, y2 / sy] + result["bbox"][4:]
+                result["keypoints"] = [[x / sx, y / sy] for x, y in result["keypoints"]]
+        
+        return results
+    
+    def match_faces(self, frame, faces, db=None):
+        """
+        Apply size/centering/liveness checks and match embedded faces against the gallery
+        Returns: list of detection results
+        """
         results = []
         
+        # One reference for the whole frame: a concurrent reload swaps in a new
+        # Gallery and never touches this one
+        gallery = self.gallery
+        gallery_matrix = gallery.matrix
+        gallery_ids = gallery.ids
+        ann_index = gallery.ann_index
+        
         # No known faces
-        if len(self.known_embeddings) == 0:
+        if len(gallery_ids) == 0:
             for face in faces:
                 results.append({
                     "name": "Unknown",
@@ -318,9 +827,19 @@ class FaceService:
                 })
             return results
         
-        # Normalize known embeddings
-        norm_known = np.linalg.norm(self.known_embeddings, axis=1, keepdims=True)
-        known_embeddings_norm = self.known_embeddings / (norm_known + 1e-10)
+        # Liveness for every face that will be compared, in one vectorized pass
+        img_h, img_w = frame.shape[:2]
+        compared = [face for face in faces if face_pipeline.is_recognizable(face, img_w, img_h)]
+        try:
+            if compared:
+                with metrics.timer("liveness"):
+                    liveness = face_pipeline.liveness_scores(frame, compared)
+            else:
+                liveness = np.empty(0, dtype=np.float32)
+        except Exception as e:
+            print(f"Liveness calculation error: {e}")
+            liveness = np.full(len(compared), 0.5, dtype=np.float32)  # Neutral score on error
+        liveness_by_face = {id(face): float(score) for face, score in zip(compared, liveness)}
         
         for face in faces:
             # Quality check: face size and detection confidence
@@ -343,23 +862,19 @@ class FaceService:
                 })
                 continue
             
-            # Calculate liveness on face ROI
-            x1, y1, x2, y2 = map(int, face.bbox)
-            x1, y1 = max(0, x1), max(0, y1)
-            x2, y2 = min(frame.shape[1], x2), min(frame.shape[0], y2)
-            face_roi = frame[y1:y2, x1:x2]
-            liveness_score = self.calculate_texture_liveness(face_roi)
+            liveness_score = liveness_by_face[id(face)]
             
             # Normalize embedding
             face_emb = face.embedding
-            face_emb_norm = face_emb / (np.linalg.norm(face_emb) + 1e-10)
+            face_emb_norm = (face_emb / (np.linalg.norm(face_emb) + 1e-10)).astype(np.float32)
             
-            # Compute similarity
-            sims = np.dot(known_embeddings_norm, face_emb_norm)
-            max_idx = np.argmax(sims)
-            max_sim = sims[max_idx]
+            # Compute similarity (gallery is pre-normalized)
+            with metrics.timer("matching"):
+                max_idx, max_sim = self.best_match(face_emb_norm, gallery_matrix, ann_index)
+            best_id = int(gallery_ids[max_idx])
+            best_name = gallery.names.get(best_id, "Unknown")
             
-            print(f"Face detected: {self.known_names[max_idx]} ({max_sim:.3f}), Liveness: {liveness_score:.2f}")
+            print(f"Face detected: {best_name} ({max_sim:.3f}), Liveness: {liveness_score:.2f}")
             
             # Adaptive threshold based on liveness
             if liveness_score > 0.7:
@@ -371,8 +886,8 @@ class FaceService:
             
             # Match
             if max_sim > threshold:
-                name = self.known_names[max_idx]
-                emp_id = self.known_ids[max_idx]
+                name = best_name
+                emp_id = best_id
                 
                 results.append({
                     "name": name,
@@ -385,9 +900,11 @@ class FaceService:
                 
                 # Adaptive training
                 if db:
-                    self.adaptive_training_service.process_recognition(
-                        db, emp_id, face_emb, float(max_sim), liveness_score
-                    )
+                    with metrics.timer("adaptive_training"):
+                        self.adaptive_training_service.process_recognition(
+                            db, emp_id, face_emb, float(max_sim), liveness_score,
+                            on_update=self.replace_embedding
+                        )
             else:
                 results.append({
                     "name": "Unknown",
@@ -400,6 +917,20 @@ class FaceService:
         
         return results
     
+    @staticmethod
+    def best_match(face_emb_norm, gallery_matrix, ann_index=None):
+        """
+        Closest gallery row to a normalized embedding (IVF index if given, else brute force)
+        Returns: (row_index, cosine_similarity)
+        """
+        candidates = ann_index.search(face_emb_norm) if ann_index is not None else None
+        if candidates is not None and len(candidates[0]) > 0:
+            return int(candidates[0][0]), float(candidates[1][0])
+        
+        sims = gallery_matrix @ face_emb_norm
+        max_idx = int(np.argmax(sims))
+        return max_idx, float(sims[max_idx])
+    
     # ==================== DRAWING ====================
     
     def draw_results(self, frame, results):
@@ -0,0 +1,165 @@
+"""
+Lightweight per-camera face tracker (IoU + keypoint association).
+Detections are linked to tracks from frame to frame so that a person standing
+in front of a camera is embedded and matched once, not on every frame; the
+cached identity is reused until the track is lost or needs a refresh.
+"""
+import os
+import time
+
+import numpy as np
+
+
+class Track:
+    __slots__ = ("track_id", "bbox", "kps", "last_seen", "result", "last_recognized",
+                 "best_shot", "shot_frames")
+
+    def __init__(self, track_id, bbox, kps, now):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.kps = kps
+        self.last_seen = now
+        self.result = None          # Last recognition result for this person
+        self.last_recognized = 0.0
+        self.best_shot = None       # (quality, frame, face) while waiting for recognition
+        self.shot_frames = 0
+
+    @property
+    def confirmed(self):
+        return self.result is not None and self.result.get("employee_id") is not None
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU of (N, 4) and (M, 4) x1,y1,x2,y2 boxes"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)[:, None, :]
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)[None, :, :]
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / (area_a + area_b - inter + 1e-6)
+
+
+def keypoint_distance_matrix(tracks, faces):
+    """Mean 5-point keypoint distance, relative to the track's face width"""
+    dist = np.full((len(tracks), len(faces)), np.inf, dtype=np.float32)
+    for i, track in enumerate(tracks):
+        if track.kps is None:
+            continue
+        width = max(float(track.bbox[2] - track.bbox[0]), 1.0)
+        for j, face in enumerate(faces):
+            if face.kps is not None:
+                dist[i, j] = np.linalg.norm(face.kps - track.kps, axis=1).mean() / width
+    return dist
+
+
+class FaceTracker:
+    """
+    Greedy IoU association with a keypoint fallback for fast movement.
+    Not thread-safe: one tracker per camera detection loop.
+    """
+
+    def __init__(self, iou_threshold=0.3, kps_threshold=0.35, max_age=None, refresh_interval=None,
+                 best_shot_frames=None, good_quality=0.8):
+        self.iou_threshold = iou_threshold
+        self.kps_threshold = kps_threshold
+        # Tracks unseen for longer than this are dropped (a new person may be in front of the camera)
+        self.max_age = max_age if max_age is not None else float(os.getenv("TRACK_MAX_AGE_SECONDS", "1.0"))
+        # Confirmed identities are re-verified at this interval
+        self.refresh_interval = (refresh_interval if refresh_interval is not None
+                                 else float(os.getenv("TRACK_REFRESH_SECONDS", "3.0")))
+        # Best shot: a track waiting for recognition collects up to this many frames and
+        # sends the best one to ArcFace (immediately if one scores >= good_quality)
+        self.best_shot_frames = (best_shot_frames if best_shot_frames is not None
+                                 else int(os.getenv("BEST_SHOT_FRAMES", "3")))
+        self.good_quality = good_quality
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, faces, now=None):
+        """
+        Associate this frame's detections with existing tracks
+        Returns: one Track per face (new tracks for unmatched detections)
+        """
+        now = time.time() if now is None else now
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+
+        assigned = [None] * len(faces)
+        if self.tracks and faces:
+            free_tracks = set(range(len(self.tracks)))
+            free_faces = set(range(len(faces)))
+
+            # Pass 1: box overlap, best pairs first
+            ious = iou_matrix([t.bbox for t in self.tracks], [f.bbox for f in faces])
+            for ti, fi in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+                if ious[ti, fi] < self.iou_threshold:
+                    break
+                if ti in free_tracks and fi in free_faces:
+                    assigned[fi] = self.tracks[ti]
+                    free_tracks.discard(ti)
+                    free_faces.discard(fi)
+
+            # Pass 2: keypoints, for faces that moved too far for the boxes to overlap
+            if free_tracks and free_faces:
+                dist = keypoint_distance_matrix(self.tracks, faces)
+                for ti, fi in zip(*np.unravel_index(np.argsort(dist, axis=None), dist.shape)):
+                    if dist[ti, fi] > self.kps_threshold:
+                        break
+                    if ti in free_tracks and fi in free_faces:
+                        assigned[fi] = self.tracks[ti]
+                        free_tracks.discard(ti)
+                        free_faces.discard(fi)
+
+        for fi, face in enumerate(faces):
+            track = assigned[fi]
+            if track is None:
+                track = Track(self._next_id, face.bbox, face.kps, now)
+                self._next_id += 1
+                self.tracks.append(track)
+                assigned[fi] = track
+            else:
+                track.bbox, track.kps, track.last_seen = face.bbox, face.kps, now
+
+        return assigned
+
+    def needs_recognition(self, track, now=None):
+        """New, unconfirmed (Unknown) or stale tracks go through embedding + matching"""
+        now = time.time() if now is None else now
+        return not track.confirmed or now - track.last_recognized >= self.refresh_interval
+
+    def offer(self, track, frame, face, quality):
+        """
+        Candidate frame for a track waiting for recognition
+        Returns: the (frame, face) to embed now, or None to keep collecting
+        """
+        if track.best_shot is None or quality > track.best_shot[0]:
+            track.best_shot = (quality, frame, face)
+        track.shot_frames += 1
+
+        if quality >= self.good_quality or track.shot_frames >= self.best_shot_frames:
+            _, best_frame, best_face = track.best_shot
+            track.best_shot = None
+            track.shot_frames = 0
+            return best_frame, best_face
+        return None
+
+    def record(self, track, result, now=None):
+        track.result = dict(result)
+        track.last_recognized = time.time() if now is None else now
+
+    def cached_result(self, track, face, cached=True):
+        """
+        Track's identity at the face's current position
+        cached: the identity was not matched on this frame (carried over by the
+        association only, so it must not be trusted for attendance)
+        """
+        result = dict(track.result)
+        result["bbox"] = face.bbox.tolist()
+        result["keypoints"] = face.kps.tolist()
+        result["track_id"] = track.track_id
+        result["cached"] = cached
+        return result
+
+    def reset(self):
+        self.tracks = []
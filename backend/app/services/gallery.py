@@ -0,0 +1,44 @@
+"""
+Immutable face gallery: normalized embedding matrix, employee id per row,
+names and the optional IVF index, always consistent with each other.
+
+FaceService publishes the current Gallery through a single attribute and
+replaces it whole (read-copy-update): recognition threads take one reference
+per frame without locking, writers build a new Gallery under the writer lock
+and swap it in with one assignment. A reload therefore never blocks readers,
+and a reader never sees a matrix from one version and ids from another.
+"""
+from types import MappingProxyType
+
+import numpy as np
+
+
+class Gallery:
+    __slots__ = ("matrix", "ids", "names", "ann_index")
+
+    def __init__(self, matrix, ids, names, ann_index=None):
+        """
+        Args:
+            matrix: (N, D) L2-normalized float32 embeddings (frozen read-only)
+            ids: (N,) int32 employee id per row (frozen read-only)
+            names: {employee_id: name} (copied into a read-only mapping)
+            ann_index: IVFIndex over `matrix`, or None for brute force
+        """
+        if len(matrix) != len(ids):
+            raise ValueError(f"Gallery has {len(matrix)} embeddings but {len(ids)} ids")
+        matrix.setflags(write=False)
+        ids.setflags(write=False)
+        object.__setattr__(self, "matrix", matrix)
+        object.__setattr__(self, "ids", ids)
+        object.__setattr__(self, "names", MappingProxyType(dict(names)))
+        object.__setattr__(self, "ann_index", ann_index)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Gallery is immutable; build a new one")
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def empty(cls, dim):
+        return cls(np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.int32), {})
@@ -0,0 +1,116 @@
+"""
+On-disk snapshot of the face gallery (normalized matrix, employee ids, names
+and the IVF index arrays), opened with np.load(mmap_mode='r') at startup so
+the server can recognize without reading every embedding from the database.
+
+Layout of the snapshot directory:
+    gallery.json                     metadata + file names (replaced atomically)
+    gallery-<generation>-<n>.*.npy   one .npy per array
+
+A snapshot is current when its generation and content fingerprint match the
+database (embedding_store.gallery_generation / gallery_fingerprint). Array
+files are never overwritten: each save writes new files, then switches
+gallery.json to them.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from ..embedding_format import MODEL_VERSION
+from .ann_index import IVFIndex
+
+SNAPSHOT_FORMAT = 1
+META_FILE = "gallery.json"
+
+
+def save(directory, generation, matrix, ids, names, ann_index=None, fingerprint=None):
+    """Write a snapshot of the given gallery; superseded files are removed"""
+    os.makedirs(directory, exist_ok=True)
+    prefix = f"gallery-{generation}-{time.time_ns()}"
+
+    arrays = {"matrix": matrix, "ids": ids}
+    ann = None
+    if ann_index is not None:
+        ann_arrays, ann = ann_index.state()
+        arrays.update({f"ann_{name}": array for name, array in ann_arrays.items()})
+
+    files = {}
+    for key, array in arrays.items():
+        files[key] = f"{prefix}.{key}.npy"
+        np.save(os.path.join(directory, files[key]), np.ascontiguousarray(array))
+
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "model_version": MODEL_VERSION,
+        "generation": generation,
+        "fingerprint": fingerprint,
+        "count": int(len(ids)),
+        "dim": int(matrix.shape[1]),
+        "files": files,
+        "ann": ann,
+        "names": {str(emp_id): name for emp_id, name in names.items()},
+    }
+    meta_path = os.path.join(directory, META_FILE)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    # Previous snapshots (still mapped files cannot be removed on Windows: retried next save)
+    for name in os.listdir(directory):
+        if name.startswith("gallery-") and name not in files.values():
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def load(directory):
+    """
+    Memory-map the snapshot in `directory`
+    Returns: dict (generation, fingerprint, count, matrix, ids, names, ann_index), or None if
+    there is no usable snapshot (missing, other format or model, damaged files).
+    """
+    meta_path = os.path.join(directory, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != SNAPSHOT_FORMAT or meta.get("model_version") != MODEL_VERSION:
+            return None
+
+        count, dim = meta["count"], meta["dim"]
+        if count == 0:
+            # Zero-length files cannot be mapped
+            arrays = {"matrix": np.zeros((0, dim), dtype=np.float32), "ids": np.zeros(0, dtype=np.int32)}
+        else:
+            arrays = {
+                key: np.load(os.path.join(directory, name), mmap_mode="r")
+                for key, name in meta["files"].items()
+            }
+        matrix, ids = arrays["matrix"], arrays["ids"]
+        if matrix.shape != (count, dim) or ids.shape != (count,):
+            return None
+
+        ann_index = None
+        if meta.get("ann") is not None:
+            ann_index = IVFIndex.from_state(
+                {name: arrays[f"ann_{name}"] for name in IVFIndex.STATE_ARRAYS}, meta["ann"]
+            )
+            if ann_index.size != count:
+                return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Gallery snapshot not usable: {e}")
+        return None
+
+    return {
+        "generation": meta["generation"],
+        "fingerprint": meta.get("fingerprint"),
+        "count": count,
+        "matrix": matrix,
+        "ids": ids,
+        "names": {int(emp_id): name for emp_id, name in meta["names"].items()},
+        "ann_index": ann_index,
+    }
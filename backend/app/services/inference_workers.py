@@ -0,0 +1,232 @@
+"""
+Out-of-process inference: a pool of worker processes, each owning its own
+buffalo_l models. Frames are handed over through a ring of shared-memory
+slots (one memcpy, no pickling of pixel data); faces come back on a result
+queue and are matched against the gallery in the API process.
+"""
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .. import face_pipeline
+
+# Frames are normalized to max_dim=1280 before inference
+DEFAULT_SLOT_BYTES = 1280 * 1280 * 3
+# A crashed worker is restarted at most this often (seconds): a worker that cannot
+# load its models must not turn into a respawn loop
+WORKER_RESTART_DELAY = 5.0
+
+
+class InferenceWorkerPool:
+    """
+    Spawned inference processes + shared-memory frame ring.
+    detect_and_embed(), detect(), embed() and embed_aligned() have the same
+    contracts as their face_pipeline counterparts.
+    """
+
+    def __init__(self, n_workers, intra_op_threads=0, n_slots=None,
+                 slot_bytes=DEFAULT_SLOT_BYTES, timeout=10.0):
+        self._ctx = multiprocessing.get_context('spawn')  # Same behaviour on Linux and Windows
+        self.timeout = timeout
+        self.intra_op_threads = intra_op_threads
+        self.slot_bytes = slot_bytes
+
+        # Frame ring: at least one full /recognize/batch worth of slots
+        n_slots = n_slots or max(4 * n_workers, 16)
+        self.slots = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(n_slots)]
+        self._free_slots = queue.Queue()
+        for i in range(n_slots):
+            self._free_slots.put(i)
+        self._slot_lock = threading.Lock()  # A request grabs all its slots at once
+
+        self.tasks = self._ctx.Queue()
+        self.results = self._ctx.Queue()
+        # request_id -> (Future, slot ids held until the worker answers, expiry time)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+
+        self._started = [0.0] * n_workers  # Last start time of each worker
+        self.processes = [self._start_worker(i) for i in range(n_workers)]
+
+        self.running = True
+        self._collector = threading.Thread(target=self._collect_results, daemon=True)
+        self._collector.start()
+        print(f"Inference workers started: {n_workers} processes, {n_slots} frame slots")
+
+    def _start_worker(self, index):
+        process = self._ctx.Process(
+            target=face_pipeline.worker_main,
+            args=([shm.name for shm in self.slots], self.tasks, self.results, self.intra_op_threads),
+            name=f"InferenceWorker-{index}",
+            daemon=True
+        )
+        process.start()
+        self._started[index] = time.time()
+        return process
+
+    def _check_workers(self):
+        """Replace worker processes that died (OOM, crash); their in-flight task expires"""
+        now = time.time()
+        for i, process in enumerate(self.processes):
+            if (self.running and not process.is_alive()
+                    and now - self._started[i] >= WORKER_RESTART_DELAY):
+                print(f"Inference worker {process.name} died (exit code {process.exitcode}), restarting")
+                self.processes[i] = self._start_worker(i)
+
+    def _expire_pending(self, now=None):
+        """
+        Drop requests no worker answered in time (their worker died or hung) and
+        free their slots. The expiry leaves a full timeout after the task's own
+        deadline, so a live worker has long finished reading the slots.
+        """
+        now = time.time() if now is None else now
+        with self._pending_lock:
+            expired = [rid for rid, (_, _, expires) in self._pending.items() if now > expires]
+            entries = [self._pending.pop(rid) for rid in expired]
+        for future, slot_ids, _ in entries:
+            self._release_slots(slot_ids)
+            if not future.done():
+                future.set_exception(TimeoutError("No inference worker answered"))
+
+    def _collect_results(self):
+        """
+        Resolve pending futures as workers answer, and free their frame slots
+        (only now: a worker may still be reading them after the caller timed out).
+        Between results: restart dead workers and expire requests they will never answer.
+        """
+        while self.running:
+            self._check_workers()
+            self._expire_pending()
+            try:
+                request_id, output, error = self.results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._pending_lock:
+                entry = self._pending.pop(request_id, None)
+            if entry is None:
+                continue  # Already expired
+            future, slot_ids, _ = entry
+            self._release_slots(slot_ids)
+            if future.done():
+                continue
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(output)
+
+    def _acquire_slots(self, count):
+        """Take `count` free slots, waiting at most `timeout` (TimeoutError: slots still held)"""
+        deadline = time.time() + self.timeout
+        if not self._slot_lock.acquire(timeout=self.timeout):
+            raise TimeoutError("No free inference worker slot")
+        slot_ids = []
+        try:
+            while len(slot_ids) < count:
+                slot_ids.append(self._free_slots.get(timeout=max(0.0, deadline - time.time())))
+        except queue.Empty:
+            self._release_slots(slot_ids)
+            raise TimeoutError("No free inference worker slot")
+        finally:
+            self._slot_lock.release()
+        return slot_ids
+
+    def _release_slots(self, slot_ids):
+        for slot in slot_ids:
+            self._free_slots.put(slot)
+
+    def _submit(self, op, frames, args=None):
+        """Copy frames into free slots, run `op` on a worker and wait for its output"""
+        for frame in frames:
+            if frame.dtype != np.uint8 or frame.nbytes > self.slot_bytes:
+                raise ValueError(f"Frame {frame.shape} {frame.dtype} does not fit a worker slot")
+        if len(frames) > len(self.slots):
+            raise ValueError(f"{len(frames)} frames for {len(self.slots)} worker slots")
+
+        slot_ids = self._acquire_slots(len(frames))
+        request_id = next(self._ids)
+        future = Future()
+        try:
+            frame_slots = []
+            for slot, frame in zip(slot_ids, frames):
+                view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.slots[slot].buf)
+                view[...] = frame
+                del view
+                frame_slots.append((slot, frame.shape))
+        except Exception:
+            self._release_slots(slot_ids)
+            raise
+
+        # From here the slots belong to the task until a worker answers it.
+        # Past its deadline a worker skips the task instead of running it for nobody.
+        deadline = time.time() + self.timeout
+        with self._pending_lock:
+            self._pending[request_id] = (future, slot_ids, deadline + self.timeout)
+        self.tasks.put((request_id, op, frame_slots, args, deadline))
+
+        try:
+            return future.result(timeout=self.timeout)
+        finally:
+            future.cancel()  # No-op once resolved; marks a timed-out request as abandoned
+
+    def _faces_per_frame(self, op, frames, args=None):
+        out = []
+        n_slots = len(self.slots)
+        for start in range(0, len(frames), n_slots):
+            for faces in self._submit(op, frames[start:start + n_slots], args):
+                out.append([face_pipeline.face_from_dict(f) for f in faces])
+        return out
+
+    def detect_and_embed(self, frames):
+        """
+        Run detection + filtered embedding on the workers
+        Returns: one list of Face objects per frame
+        """
+        return self._faces_per_frame("detect_and_embed", frames)
+
+    def detect(self, frames, roi=False):
+        """Detection only; returns one list of Face objects (no embedding) per frame"""
+        return self._faces_per_frame("detect", frames, roi)
+
+    def embed(self, items):
+        """Embed (frame, face) pairs on a worker; sets face.embedding in place"""
+        if not items:
+            return
+        frames, index, args = [], {}, []
+        for frame, face in items:
+            if id(frame) not in index:
+                index[id(frame)] = len(frames)
+                frames.append(frame)
+            args.append((index[id(frame)], face.kps))
+
+        embeddings = self._submit("embed", frames, args)
+        for (_, face), emb in zip(items, embeddings):
+            face.embedding = emb
+
+    def embed_aligned(self, crops):
+        """Embed already-aligned crops on a worker; returns (N, 512) embeddings"""
+        return self._submit("embed_aligned", list(crops))
+
+    def stop(self):
+        """Stop workers and release the shared-memory ring"""
+        self.running = False
+        self._collector.join(timeout=1)  # No worker restarts past this point
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()
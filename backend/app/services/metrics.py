@@ -0,0 +1,156 @@
+"""
+In-process latency histograms and per-camera frame counters, rendered in the
+Prometheus text exposition format by GET /api/metrics.
+Recording is a bisect and a few increments under an uncontended lock; all
+formatting (and the quantile sort) happens at scrape time.
+"""
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Stage latency buckets (seconds): sub-ms matching up to multi-second CPU detection
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+CAMERA_COUNTERS = {
+    "captured": "Frames read by the camera capture thread",
+    "dropped": "Frames replaced by a newer one before the detection loop picked them up",
+    "skipped": "Frames the motion gate kept away from inference",
+    "processed": "Frames that went through detection",
+}
+
+# Which pipeline the current thread/request belongs to ("api" or "camera")
+pipeline = contextvars.ContextVar("metrics_pipeline", default="api")
+
+
+class StageHistogram:
+    """Cumulative bucket counts plus a rolling window of the most recent samples"""
+    __slots__ = ("counts", "total", "count", "recent")
+
+    def __init__(self, window):
+        self.counts = [0] * (len(STAGE_BUCKETS) + 1)  # Last slot: +Inf
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(STAGE_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+
+class StageTimer:
+    __slots__ = ("registry", "stage", "start")
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Thread-safe store for stage timings and camera frame counters"""
+
+    def __init__(self, window=None):
+        # Samples kept per (pipeline, stage) for the rolling quantiles
+        self.window = window or int(os.getenv("METRICS_WINDOW_SIZE", "1024"))
+        self.lock = threading.Lock()
+        self.histograms = {}  # (pipeline, stage) -> StageHistogram
+        self.camera_counts = {}  # camera_id -> {counter: n}
+
+    def observe(self, stage, seconds):
+        key = (pipeline.get(), stage)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = StageHistogram(self.window)
+            histogram.observe(seconds)
+
+    def timer(self, stage):
+        """with metrics.timer("detection"): ..."""
+        return StageTimer(self, stage)
+
+    def timed(self, stage):
+        """Decorator form of timer()"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with StageTimer(self, stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, camera_id, counter, n=1):
+        if n <= 0:
+            return
+        with self.lock:
+            counts = self.camera_counts.get(camera_id)
+            if counts is None:
+                counts = self.camera_counts[camera_id] = dict.fromkeys(CAMERA_COUNTERS, 0)
+            counts[counter] += n
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.camera_counts = {}
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self.lock:
+            snapshot = [
+                (key, list(h.counts), h.total, h.count, np.array(h.recent))
+                for key, h in sorted(self.histograms.items())
+            ]
+            cameras = {cam: dict(counts) for cam, counts in self.camera_counts.items()}
+
+        lines = [
+            "# HELP face_stage_duration_seconds Recognition pipeline stage latency",
+            "# TYPE face_stage_duration_seconds histogram",
+        ]
+        for (pipe, stage), counts, total, count, _ in snapshot:
+            labels = f'pipeline="{pipe}",stage="{stage}"'
+            cumulative = 0
+            for bound, n in zip(STAGE_BUCKETS + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f'face_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"face_stage_duration_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"face_stage_duration_seconds_count{{{labels}}} {count}")
+
+        lines += [
+            f"# HELP face_stage_recent_seconds Stage latency over the last {self.window} samples",
+            "# TYPE face_stage_recent_seconds summary",
+        ]
+        for (pipe, stage), _, _, _, recent in snapshot:
+            labels = f'pipeline="{pipe}",stage="{stage}"'
+            values = np.quantile(recent, QUANTILES) if len(recent) else [float("nan")] * len(QUANTILES)
+            for q, value in zip(QUANTILES, values):
+                lines.append(f'face_stage_recent_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f"face_stage_recent_seconds_sum{{{labels}}} {float(recent.sum()):.6f}")
+            lines.append(f"face_stage_recent_seconds_count{{{labels}}} {len(recent)}")
+
+        for counter, help_text in CAMERA_COUNTERS.items():
+            lines += [
+                f"# HELP camera_frames_{counter}_total {help_text}",
+                f"# TYPE camera_frames_{counter}_total counter",
+            ]
+            for cam in sorted(cameras, key=str):
+                lines.append(f'camera_frames_{counter}_total{{camera="{cam}"}} {cameras[cam][counter]}')
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
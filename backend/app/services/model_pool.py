@@ -0,0 +1,47 @@
+"""
+Pool of InsightFace model instances for concurrent inference.
+Each instance owns its own ONNX Runtime sessions with a bounded intra-op
+thread budget, so cameras and kiosks run detection/recognition in parallel
+instead of queueing on a single model behind one lock.
+"""
+import os
+import queue
+from contextlib import contextmanager
+
+from ..face_pipeline import create_face_analysis
+
+
+class FaceAnalysisPool:
+    """
+    Fixed set of FaceAnalysis instances; callers check one out for the
+    duration of a detection/recognition call and block while all are busy.
+    """
+
+    def __init__(self, instances):
+        self.instances = list(instances)
+        self._free = queue.Queue()
+        for app in self.instances:
+            self._free.put(app)
+
+    @classmethod
+    def create(cls, size=1, intra_op_threads=0, det_size=(640, 640)):
+        """
+        Build `size` instances. With intra_op_threads=0 and several instances,
+        the cores are split evenly between them.
+        """
+        size = max(1, size)
+        if intra_op_threads <= 0 and size > 1:
+            intra_op_threads = max(1, (os.cpu_count() or 1) // size)
+        return cls(create_face_analysis(intra_op_threads, det_size) for _ in range(size))
+
+    def __len__(self):
+        return len(self.instances)
+
+    @contextmanager
+    def checkout(self):
+        """Borrow a free instance (blocks until one is available)"""
+        app = self._free.get()
+        try:
+            yield app
+        finally:
+            self._free.put(app)
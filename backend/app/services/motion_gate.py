@@ -0,0 +1,61 @@
+"""
+Cheap motion / scene-change gate for camera detection loops.
+Frames are compared on a tiny blurred grayscale thumbnail; inference only
+runs when enough of it changed (or a face is being tracked).
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+# Thumbnail the comparison runs on (~0.05 ms per frame)
+GATE_SIZE = (64, 36)
+# Per-pixel change (0-255) that counts as motion, above sensor noise
+PIXEL_THRESHOLD = 25
+# Changed-pixel fraction needed at sensitivity 0 (scaled down to 0 at sensitivity 100)
+MAX_CHANGED_FRACTION = 0.05
+
+
+class MotionGate:
+    """
+    Per-camera frame-difference gate
+    sensitivity: 1-100 (higher = smaller changes trigger inference), 0 = gate disabled
+    """
+
+    def __init__(self, sensitivity=50, idle_refresh=None):
+        self.sensitivity = sensitivity
+        # Even a static scene is re-checked this often (someone standing perfectly still)
+        self.idle_refresh = (idle_refresh if idle_refresh is not None
+                             else float(os.getenv("MOTION_IDLE_REFRESH_SECONDS", "10.0")))
+        self.reference = None
+        self.last_open = 0.0
+
+    @property
+    def min_changed_fraction(self):
+        return MAX_CHANGED_FRACTION * (100 - min(100, max(1, self.sensitivity))) / 100
+
+    def changed(self, frame):
+        """Fraction-of-pixels test against the previous sampled frame"""
+        small = cv2.resize(frame, GATE_SIZE, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (3, 3), 0)
+
+        reference, self.reference = self.reference, small
+        if reference is None or reference.shape != small.shape:
+            return True
+
+        changed = np.count_nonzero(cv2.absdiff(small, reference) > PIXEL_THRESHOLD)
+        return changed > self.min_changed_fraction * small.size
+
+    def should_run(self, frame, tracking=False, now=None):
+        """True if inference should run on this frame"""
+        now = time.time() if now is None else now
+        # Always sample, so the reference follows the scene
+        moved = self.changed(frame)
+
+        if self.sensitivity <= 0 or moved or tracking or now - self.last_open >= self.idle_refresh:
+            self.last_open = now
+            return True
+        return False
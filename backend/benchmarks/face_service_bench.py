@@ -0,0 +1,294 @@
+"""
+Micro-benchmarks for the FaceService hot paths, with JSON output for
+tracking regressions between releases.
+
+Usage (from backend/):
+    python -m benchmarks.face_service_bench --output bench.json
+    python -m benchmarks.face_service_bench --compare bench_prev.json
+    python -m benchmarks.face_service_bench --models buffalo_l --frames recorded/
+
+Benchmarks: load_embeddings (face_embeddings query + gallery build, on an
+in-memory SQLite), gallery matching (100 to 100k vectors),
+recognize_faces with 0/1/5 faces, calculate_texture_liveness,
+align_face_arcface and draw_results.
+
+--models synthetic (default) replaces the ONNX models with a scripted
+detector/recognizer so recognize_faces measures the Python pipeline
+(normalization, filtering, alignment, liveness, matching) in isolation.
+--models buffalo_l uses the real models; recognize_faces then runs on the
+recorded frames in --frames, since synthetic frames contain no faces.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.embedding_format import MODEL_VERSION, encode_embedding
+from app.models import Employee, FaceEmbedding
+from app.services.face_service import EMBEDDING_DIM, FaceService
+from app.services.model_pool import FaceAnalysisPool
+
+FRAME_SIZE = (1280, 720)
+PREVIEW_SIZE = (640, 360)
+EMBEDDINGS_PER_EMPLOYEE = 6
+
+
+# ==================== SYNTHETIC DATA ====================
+
+def synthetic_frame(width, height, seed=0):
+    """Textured BGR frame (smoothed noise), so sharpness/liveness code does real work"""
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (height // 4, width // 4, 3), dtype=np.uint8)
+    return cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def face_layout(n_faces, width, height, size=100):
+    """n faces side by side inside the centered acceptance zone: (bboxes, kpss)"""
+    boxes, kpss = [], []
+    cx, cy = width / 2, height / 2
+    for i in range(n_faces):
+        x1 = cx + (i - (n_faces - 1) / 2) * size * 1.1 - size / 2
+        y1 = cy - size / 2
+        boxes.append([x1, y1, x1 + size, y1 + size, 0.9])
+        kpss.append([
+            [x1 + 0.3 * size, y1 + 0.4 * size], [x1 + 0.7 * size, y1 + 0.4 * size],
+            [x1 + 0.5 * size, y1 + 0.6 * size],
+            [x1 + 0.35 * size, y1 + 0.8 * size], [x1 + 0.65 * size, y1 + 0.8 * size],
+        ])
+    return (np.array(boxes, dtype=np.float32).reshape(-1, 5),
+            np.array(kpss, dtype=np.float32).reshape(-1, 5, 2))
+
+
+class SyntheticDetector:
+    input_size = (640, 640)
+
+    def __init__(self):
+        self.n_faces = 1
+
+    def detect(self, img, input_size=None, max_num=0, metric='default'):
+        return face_layout(self.n_faces, img.shape[1], img.shape[0])
+
+
+class SyntheticRecognizer:
+    input_size = (112, 112)
+
+    def get_feat(self, crops):
+        # Embedding derived from the crop content: deterministic, and the crops are really read
+        means = np.array([crop.mean() for crop in crops], dtype=np.float32)
+        rng = np.random.default_rng(int(means.sum()))
+        return rng.normal(size=(len(crops), EMBEDDING_DIM)).astype(np.float32)
+
+
+class SyntheticFaceModel:
+    """Stand-in for FaceAnalysis (det_model + models['recognition'])"""
+
+    def __init__(self):
+        self.det_model = SyntheticDetector()
+        self.models = {'recognition': SyntheticRecognizer()}
+
+
+def synthetic_gallery_db(n_vectors, seed=0):
+    """In-memory SQLite session holding n_vectors face_embeddings rows (6 per employee)"""
+    rng = np.random.default_rng(seed)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine, tables=[Employee.__table__, FaceEmbedding.__table__])
+    db = sessionmaker(bind=engine)()
+
+    n_employees = -(-n_vectors // EMBEDDINGS_PER_EMPLOYEE)
+    db.execute(insert(Employee), [{"id": i, "name": f"Employee {i}"} for i in range(1, n_employees + 1)])
+    db.execute(insert(FaceEmbedding), [
+        {"employee_id": i // EMBEDDINGS_PER_EMPLOYEE + 1, "slot": i % EMBEDDINGS_PER_EMPLOYEE + 1,
+         "model_version": MODEL_VERSION, "vector": encode_embedding(emb)}
+        for i, emb in enumerate(rng.normal(size=(n_vectors, EMBEDDING_DIM)).astype(np.float32))
+    ])
+    db.commit()
+    return db
+
+
+def synthetic_results(n_faces):
+    bboxes, kpss = face_layout(n_faces, *PREVIEW_SIZE, size=60)
+    return [{
+        "name": f"Employee {i}", "bbox": bboxes[i, :4].tolist(), "confidence": 0.9,
+        "employee_id": i, "keypoints": kpss[i].tolist(), "liveness": 0.8
+    } for i in range(n_faces)]
+
+
+# ==================== TIMING ====================
+
+def measure(name, fn, params=None, repeat=50, warmup=3):
+    """Per-call latency stats (ms) of fn()"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples)
+    row = {
+        "bench": name,
+        "params": params or {},
+        "n": repeat,
+        "mean_ms": round(float(samples.mean()), 4),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples, 95)), 4),
+        "min_ms": round(float(samples.min()), 4),
+    }
+    print(json.dumps(row))
+    return row
+
+
+def bench_key(row):
+    return row["bench"] + json.dumps(row["params"], sort_keys=True)
+
+
+# ==================== BENCHMARKS ====================
+
+def bench_gallery(service, sizes, repeat):
+    rows = []
+    rng = np.random.default_rng(1)
+    for size in sizes:
+        db = synthetic_gallery_db(size)
+        # Large galleries train the IVF index on every load (seconds per call): time fewer runs
+        large = size > 10000
+        rows.append(measure("load_embeddings", lambda: service.load_embeddings(db),
+                            {"vectors": size}, repeat=1 if large else max(3, repeat // 10),
+                            warmup=0 if large else 1))
+
+        queries = rng.normal(size=(256, EMBEDDING_DIM)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        it = iter(np.resize(np.arange(len(queries)), 10 ** 6))
+        matrix, index = service.gallery_matrix, service.ann_index
+        rows.append(measure("match", lambda: service.best_match(queries[next(it)], matrix, index),
+                            {"vectors": size, "ann": index is not None}, repeat=repeat * 4))
+    return rows
+
+
+def bench_recognize_synthetic(service, repeat):
+    rows = []
+    frame = synthetic_frame(*FRAME_SIZE)
+    model = service.pool.instances[0]
+    for n_faces in (0, 1, 5):
+        model.det_model.n_faces = n_faces
+        rows.append(measure("recognize_faces", lambda: service.recognize_faces(frame),
+                            {"faces": n_faces, "models": "synthetic"}, repeat=repeat))
+    return rows
+
+
+def bench_recognize_recorded(service, frames_dir, repeat):
+    rows = []
+    paths = sorted(p for ext in ('*.jpg', '*.jpeg', '*.png') for p in glob.glob(os.path.join(frames_dir, ext)))
+    if not paths:
+        print(f"No frames found in {frames_dir}, recognize_faces skipped")
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        n_faces = len(service.detect([service.normalize_image(frame)])[0])
+        rows.append(measure("recognize_faces", lambda: service.recognize_faces(frame),
+                            {"frame": os.path.basename(path), "faces": n_faces, "models": "buffalo_l"},
+                            repeat=repeat))
+    return rows
+
+
+def bench_image_ops(service, repeat):
+    rows = []
+    for size in (80, 200, 400):
+        crop = synthetic_frame(size, size, seed=size)
+        rows.append(measure("calculate_texture_liveness", lambda: service.calculate_texture_liveness(crop),
+                            {"crop_px": size}, repeat=repeat * 4))
+
+    frame = synthetic_frame(*FRAME_SIZE)
+    _, kpss = face_layout(1, *FRAME_SIZE, size=200)
+    rows.append(measure("align_face_arcface", lambda: service.align_face_arcface(frame, kpss[0]),
+                        {"face_px": 200}, repeat=repeat * 4))
+
+    preview = synthetic_frame(*PREVIEW_SIZE)
+    for n_faces in (1, 5):
+        results = synthetic_results(n_faces)
+        rows.append(measure("draw_results", lambda: service.draw_results(preview.copy(), results),
+                            {"faces": n_faces}, repeat=repeat * 4))
+    return rows
+
+
+def compare(rows, baseline_path, tolerance):
+    """Print the ratio to a previous run; returns the regressed benchmarks"""
+    with open(baseline_path) as f:
+        baseline = {bench_key(row): row for row in json.load(f)["results"]}
+
+    regressions = []
+    for row in rows:
+        previous = baseline.get(bench_key(row))
+        if previous is None or previous["p50_ms"] <= 0:
+            continue
+        ratio = row["p50_ms"] / previous["p50_ms"]
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{row['bench']:<28} {json.dumps(row['params']):<48} {ratio:6.2f}x {flag}")
+        if flag:
+            regressions.append(bench_key(row))
+    return regressions
+
+
+def run(args):
+    if args.models == "synthetic":
+        service = FaceService(pool=FaceAnalysisPool([SyntheticFaceModel()]))
+    else:
+        service = FaceService()
+
+    rows = bench_gallery(service, args.sizes, args.repeat)
+
+    # recognize_faces against a realistic 1k-vector gallery
+    service.load_embeddings(synthetic_gallery_db(1000))
+    if args.models == "synthetic":
+        rows += bench_recognize_synthetic(service, args.repeat)
+    elif args.frames:
+        rows += bench_recognize_recorded(service, args.frames, args.repeat)
+    else:
+        print("--models buffalo_l needs --frames for recognize_faces (synthetic frames contain no faces)")
+
+    rows += bench_image_ops(service, args.repeat)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "models": args.models,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+        },
+        "results": rows,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(rows, args.compare, args.tolerance)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--models", choices=["synthetic", "buffalo_l"], default="synthetic")
+    parser.add_argument("--frames", help="Directory of recorded frames (jpg/png) for --models buffalo_l")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Previous JSON report to compare against (p50)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before failing")
+    run(parser.parse_args())
@@ -0,0 +1,206 @@
+"""
+INT8 model builder + FP32/INT8 accuracy and latency report
+Builds ~/.insightface/models/buffalo_l_int8 (recognizer calibrated on the stored
+employee photos, detector on recorded camera frames), then compares both
+precisions on those photos and frames.
+
+Usage (from backend/):
+    python quantize_models.py --frames recorded/                # build (if missing) + report
+    python quantize_models.py --frames recorded/ --rebuild      # force re-quantization
+    python quantize_models.py --frames recorded/ --report-only  # compare with an existing INT8 pack
+
+--frames: directory of recorded camera frames (jpg/png, as for the benchmark).
+Without it the detector is calibrated and evaluated on the photos pasted onto
+a black canvas only, which says little about real camera scenes.
+
+Enable with FACE_MODEL_PRECISION=int8 once the report is acceptable.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from app.database import SessionLocal
+from app.models import Employee
+from app import face_pipeline
+from app.model_quantization import quantize_buffalo_l, detection_canvas
+
+def load_employee_photos():
+    """(employee_id, BGR image) for every stored photo (aligned 112x112 crops)"""
+    db = SessionLocal()
+    try:
+        photo_columns = [getattr(Employee, f'photo{i}') for i in range(1, 7)]
+        rows = db.query(Employee.id, *photo_columns).all()
+    finally:
+        db.close()
+    
+    photos = []
+    for emp_id, *blobs in rows:
+        for blob in blobs:
+            if blob:
+                img = cv2.imdecode(np.frombuffer(blob, np.uint8), cv2.IMREAD_COLOR)
+                if img is not None:
+                    photos.append((emp_id, img))
+    return photos
+
+def load_frames(directory):
+    """Recorded camera frames (BGR) from a directory of jpg/png files"""
+    paths = sorted(p for ext in ('*.jpg', '*.jpeg', '*.png') for p in glob.glob(os.path.join(directory, ext)))
+    frames = [cv2.imread(path) for path in paths]
+    return [frame for frame in frames if frame is not None]
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, (time.perf_counter() - start) * 1000
+
+def normalize(x):
+    return x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-10)
+
+def rank1_accuracy(query, gallery, owners):
+    """Leave-one-out rank-1: nearest other photo belongs to the same employee"""
+    sims = query @ gallery.T
+    np.fill_diagonal(sims, -np.inf)
+    return float(np.mean(owners[np.argmax(sims, axis=1)] == owners))
+
+def run_models(app, photos):
+    rec_model = app.models['recognition']
+    embeddings, rec_ms, det_ms, det_scores = [], [], [], []
+    for _, img in photos:
+        crop = cv2.resize(img, (112, 112))
+        emb, ms = timed(rec_model.get_feat, [crop])
+        embeddings.append(emb[0])
+        rec_ms.append(ms)
+        
+        # Detector default input size (set by prepare()), all faces
+        (bboxes, _), ms = timed(app.det_model.detect, detection_canvas(img))
+        det_ms.append(ms)
+        det_scores.append(float(bboxes[:, 4].max()) if len(bboxes) else 0.0)
+    return normalize(np.array(embeddings)), np.array(rec_ms), np.array(det_ms), np.array(det_scores)
+
+def box_iou(a, b):
+    """Pairwise IoU of (N, 4+) and (M, 4+) x1,y1,x2,y2 boxes"""
+    a, b = a[:, None, :4], b[None, :, :4]
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / (area_a + area_b - inter + 1e-6)
+
+def run_detector(app, frames):
+    """Detections (N, 5) per recorded frame at the detector's default input size, and ms per frame"""
+    detections, det_ms = [], []
+    for frame in frames:
+        (bboxes, _), ms = timed(app.det_model.detect, frame)
+        detections.append(bboxes)
+        det_ms.append(ms)
+    return detections, np.array(det_ms)
+
+def compare_detections(reference, candidate, iou_threshold=0.5):
+    """
+    Faces found by `reference` (FP32) and by `candidate` (INT8), matched greedily by IoU
+    Returns: dict with recall/precision of the candidate and the drift of matched faces
+    """
+    matched_ious, score_diffs = [], []
+    n_ref = n_cand = 0
+    for ref, cand in zip(reference, candidate):
+        n_ref += len(ref)
+        n_cand += len(cand)
+        if len(ref) == 0 or len(cand) == 0:
+            continue
+        ious = box_iou(ref, cand)
+        used = set()
+        for i in range(len(ref)):
+            for j in np.argsort(-ious[i]):
+                if ious[i, j] < iou_threshold:
+                    break
+                if j not in used:
+                    used.add(j)
+                    matched_ious.append(float(ious[i, j]))
+                    score_diffs.append(abs(float(ref[i, 4]) - float(cand[j, 4])))
+                    break
+    matched = len(matched_ious)
+    return {
+        "faces": {"fp32": n_ref, "int8": n_cand, "matched": matched},
+        "recall": round(matched / n_ref, 4) if n_ref else None,
+        "precision": round(matched / n_cand, 4) if n_cand else None,
+        "matched_iou_mean": round(float(np.mean(matched_ious)), 4) if matched else None,
+        "matched_score_abs_diff_mean": round(float(np.mean(score_diffs)), 4) if matched else None,
+    }
+
+def report(photos, threads, frames=None):
+    fp32 = face_pipeline.create_face_analysis(threads, precision='fp32')
+    int8 = face_pipeline.create_face_analysis(threads, precision='int8')
+    
+    # Warm-up (first ONNX Runtime runs allocate)
+    for app in (fp32, int8):
+        run_models(app, photos[:3])
+    
+    emb32, rec32, det32, score32 = run_models(fp32, photos)
+    emb8, rec8, det8, score8 = run_models(int8, photos)
+    owners = np.array([emp_id for emp_id, _ in photos])
+    drift = np.sum(emb32 * emb8, axis=1)
+    
+    result = {
+        "photos": len(photos),
+        "employees": int(len(set(owners.tolist()))),
+        "recognition_ms": {"fp32": round(float(np.median(rec32)), 2), "int8": round(float(np.median(rec8)), 2),
+                           "speedup": round(float(np.median(rec32) / np.median(rec8)), 2)},
+        "detection_ms": {"fp32": round(float(np.median(det32)), 2), "int8": round(float(np.median(det8)), 2),
+                         "speedup": round(float(np.median(det32) / np.median(det8)), 2)},
+        "embedding_cosine_fp32_vs_int8": {"mean": round(float(drift.mean()), 4), "p5": round(float(np.percentile(drift, 5)), 4),
+                                          "min": round(float(drift.min()), 4)},
+        "det_score_abs_diff_mean": round(float(np.mean(np.abs(score32 - score8))), 4),
+        "rank1_leave_one_out": {"fp32": round(rank1_accuracy(emb32, emb32, owners), 4),
+                                "int8_vs_fp32_gallery": round(rank1_accuracy(emb8, emb32, owners), 4)},
+    }
+    
+    # Detector on real camera scenes (the photo canvases above are only a smoke check)
+    if frames:
+        dets32, ms32 = run_detector(fp32, frames)
+        dets8, ms8 = run_detector(int8, frames)
+        result["recorded_frames"] = {
+            "frames": len(frames),
+            "detection_ms": {"fp32": round(float(np.median(ms32)), 2), "int8": round(float(np.median(ms8)), 2),
+                             "speedup": round(float(np.median(ms32) / np.median(ms8)), 2)},
+            **compare_detections(dets32, dets8),
+        }
+    else:
+        print("No recorded frames (--frames): detector drift measured on photo canvases only")
+    print(json.dumps(result, indent=2))
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build INT8 buffalo_l models and compare them with FP32")
+    parser.add_argument("--rebuild", action="store_true", help="Re-quantize even if the INT8 pack exists")
+    parser.add_argument("--report-only", action="store_true", help="Skip quantization")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = all cores)")
+    parser.add_argument("--frames", help="Directory of recorded camera frames (jpg/png) to calibrate and evaluate the detector")
+    args = parser.parse_args()
+    
+    print("=== INT8 Model Quantization ===")
+    photos = load_employee_photos()
+    print(f"Loaded {len(photos)} employee photos")
+    if not photos:
+        raise SystemExit("No employee photos in the database; enroll employees first.")
+    frames = load_frames(args.frames) if args.frames else []
+    if args.frames and not frames:
+        raise SystemExit(f"No frames found in {args.frames}")
+    print(f"Loaded {len(frames)} recorded frames")
+    
+    # Make sure the FP32 pack is downloaded
+    face_pipeline.create_face_analysis(args.threads, precision='fp32')
+    
+    int8_dir = face_pipeline.model_pack_dir(face_pipeline.INT8_MODEL_PACK)
+    if not args.report_only and (args.rebuild or not os.path.isdir(int8_dir)):
+        out = quantize_buffalo_l([img for _, img in photos], frames=frames)
+        print(f"✓ INT8 models written to {out}\n")
+    elif not os.path.isdir(int8_dir):
+        raise SystemExit(f"No INT8 pack in {int8_dir}; run without --report-only first.")
+    
+    report(photos, args.threads, frames)
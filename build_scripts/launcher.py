@@ -4,6 +4,7 @@ Main entry point for the Windows executable
 """
 import sys
 import os
+import multiprocessing
 import threading
 import time
 import webbrowser
@@ -150,6 +151,8 @@ def main():
         input("\nPress Enter to exit...")
 
 if __name__ == '__main__':
+    # Required in the frozen exe: the spawned inference workers re-run it
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
@@ -2,7 +2,6 @@
 import unittest
 from unittest.mock import MagicMock
 import numpy as np
-import pickle
 import sys
 import os
 
@@ -10,46 +9,43 @@ import os
 sys.path.append(os.path.abspath("backend"))
 
 from app.services.adaptive_training_service import AdaptiveTrainingService
+from app import embedding_format
 
 class TestAdaptiveFix(unittest.TestCase):
     def test_update_profile(self):
         service = AdaptiveTrainingService()
         db = MagicMock()
         
-        # Mock Employee
-        employee = MagicMock()
-        employee.id = 1
-        
         # Create a dummy embedding (512 dim for insightface)
         emb = np.random.rand(512).astype(np.float32)
         emb = emb / np.linalg.norm(emb)
-        emb_bytes = pickle.dumps(emb)
-        
-        # Set embeddings on employee
-        employee.embedding1 = emb_bytes
-        employee.embedding2 = None
-        employee.embedding3 = None
-        employee.embedding4 = None
-        employee.embedding5 = None
-        employee.embedding6 = None
         
-        db.query.return_value.filter.return_value.first.return_value = employee
+        # Stored face_embeddings rows: a raw-format slot 1 and an unrelated slot 2
+        row1 = MagicMock(slot=1, vector=embedding_format.encode_embedding(emb))
+        row2 = MagicMock(slot=2, vector=embedding_format.encode_embedding(-emb))
+        db.query.return_value.filter.return_value.all.return_value = [row1, row2]
         
         # New embedding (close to original)
         new_emb = emb + np.random.normal(0, 0.01, 512).astype(np.float32)
         new_emb = new_emb / np.linalg.norm(new_emb)
         
         # Run update
-        # We need to ensure the service can access the attributes
-        # Since we are mocking, getattr(employee, 'embedding1') works if we set it.
-        
-        result = service._update_employee_profile(db, 1, new_emb)
+        on_update = MagicMock()
+        result = service._update_employee_profile(db, 1, new_emb, on_update)
         
         if not result:
             print("Update returned False")
             
         self.assertTrue(result)
         self.assertTrue(db.commit.called)
+        # The closest slot was blended, the other one left untouched
+        self.assertGreater(np.dot(embedding_format.decode_embedding(row1.vector), new_emb), np.dot(emb, new_emb))
+        self.assertEqual(row2.vector, embedding_format.encode_embedding(-emb))
+        # The live gallery is handed the replaced vector and the one now in the database
+        emp_id, old, updated = on_update.call_args.args
+        self.assertEqual(emp_id, 1)
+        np.testing.assert_array_equal(old, emb)
+        np.testing.assert_array_equal(updated, embedding_format.decode_embedding(row1.vector))
         
         print("Test passed: Embedding updated successfully")
 
@@ -0,0 +1,201 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import io
+import json
+import zipfile
+import sys
+import os
+
+# Add backend to path
+sys.path.append(os.path.abspath("backend"))
+
+# We need to mock insightface before importing face_service because it initializes FaceAnalysis in __init__
+with patch('insightface.app.FaceAnalysis'):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.database import Base
+    from app.models import Employee, FaceEmbedding, SystemSettings
+    from app.routers import api
+    from app.services import embedding_store
+    from app import embedding_format
+
+def make_archive(folders, csv_text=None):
+    """Bulk-enrollment zip: {employee name: number of photos}; photo bytes are '<name>-<i>'"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, count in folders.items():
+            for i in range(1, count + 1):
+                zf.writestr(f"{name}/{i}.jpg", f"{name}-{i}".encode())
+        if csv_text is not None:
+            zf.writestr("employees.csv", csv_text)
+    return buffer.getvalue()
+
+def stub_enroll_photos(photos):
+    """enroll_photos stand-in: one embedding per photo, Carol's photos have no face"""
+    enrolled = []
+    for content, _ in photos:
+        if content.startswith(b"Carol"):
+            enrolled.append((None, None, None))
+            continue
+        seed = sum(content)
+        embedding = np.random.default_rng(seed).normal(size=512).astype(np.float32)
+        enrolled.append((b"jpeg:" + content, embedding_format.encode_embedding(embedding), None))
+    return enrolled
+
+class TestBulkEnroll(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=self.engine, tables=[
+            Employee.__table__, FaceEmbedding.__table__, SystemSettings.__table__
+        ])
+        # Same session settings as SessionLocal
+        self.Session = sessionmaker(bind=self.engine, autocommit=False, autoflush=False)
+
+        app = FastAPI()
+        app.include_router(api.router, prefix="/api")
+        self.client = TestClient(app)
+
+        # The endpoint updates the shared face_service gallery: restored afterwards
+        gallery = api.face_service.gallery
+        self.addCleanup(setattr, api.face_service, 'gallery', gallery)
+
+    def test_bulk_enroll_streams_progress_and_commits(self):
+        archive = make_archive(
+            {"Alice": 3, "Bob": 2, "Carol": 2},
+            csv_text="name,department,pin\nAlice,R&D,1234\n"
+        )
+        with patch.object(api, 'SessionLocal', self.Session), \
+             patch.object(api.face_service, 'enroll_photos', side_effect=stub_enroll_photos):
+            response = self.client.post(
+                "/api/employees/bulk-enroll",
+                files={"file": ("employees.zip", archive, "application/zip")}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        progress = {line["name"]: line for line in lines[:-1]}
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(progress["Alice"]["status"], "enrolled")
+        self.assertEqual(progress["Alice"]["photos"], 3)
+        self.assertEqual(progress["Bob"]["status"], "enrolled")
+        self.assertEqual(progress["Carol"]["status"], "failed")
+        self.assertIn("No face detected", progress["Carol"]["error"])
+        self.assertEqual(sorted(line["done"] for line in lines[:-1]), [1, 2, 3])
+        self.assertTrue(all(line["total"] == 3 for line in lines))
+        self.assertEqual(lines[-1], {"status": "done", "total": 3, "enrolled": 2, "skipped": 0, "failed": 1})
+
+        # Committed: visible from a new session
+        db = self.Session()
+        try:
+            employees = {emp.name: emp for emp in db.query(Employee).all()}
+            self.assertEqual(set(employees), {"Alice", "Bob"})
+            alice, bob = employees["Alice"], employees["Bob"]
+            self.assertEqual(alice.department, "R&D")
+            self.assertEqual(alice.pin, "1234")
+            self.assertEqual(alice.photo1, b"jpeg:Alice-1")
+            self.assertEqual(progress["Alice"]["id"], alice.id)
+            self.assertEqual(len(embedding_store.employee_embeddings(db, alice.id)), 3)
+            self.assertEqual(len(embedding_store.employee_embeddings(db, bob.id)), 2)
+            self.assertEqual(embedding_store.gallery_size(db), 5)
+        finally:
+            db.close()
+
+        # Gallery updated in memory
+        ids = api.face_service.gallery_ids.tolist()
+        self.assertEqual(ids.count(alice.id), 3)
+        self.assertEqual(ids.count(bob.id), 2)
+        self.assertEqual(api.face_service.employee_names[alice.id], "Alice")
+        self.assertEqual(api.face_service.employee_names[bob.id], "Bob")
+
+    def test_archive_with_wrapper_folder_and_nested_photos(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            zf.writestr("staff/employees.csv", "name,department,pin\nAlice,R&D,1234\n")
+            zf.writestr("staff/Alice/front/1.jpg", b"Alice-1")
+            zf.writestr("staff/Alice/side/2.jpg", b"Alice-2")
+            zf.writestr("staff/Bob/1.jpg", b"Bob-1")
+            zf.writestr("staff/Bob/employees.csv", "name,department,pin\nBob,Sales,9999\n")
+            zf.writestr("__MACOSX/staff/._employees.csv", b"")
+
+        zf, folders, metadata, ignored = api.read_enrollment_archive(buffer.getvalue())
+        zf.close()
+        self.assertEqual(folders, {
+            "Alice": ["staff/Alice/front/1.jpg", "staff/Alice/side/2.jpg"],
+            "Bob": ["staff/Bob/1.jpg"],
+        })
+        self.assertEqual(metadata["Alice"]["department"], "R&D")
+        self.assertNotIn("Bob", metadata)
+        self.assertEqual(ignored, ["staff/Bob/employees.csv"])
+
+        # A single employee folder is not mistaken for the archive root
+        single = make_archive({"Alice": 2})
+        zf, folders, _, ignored = api.read_enrollment_archive(single)
+        zf.close()
+        self.assertEqual(list(folders), ["Alice"])
+        self.assertEqual(ignored, [])
+
+    def test_ignored_csv_is_reported(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            zf.writestr("Alice/1.jpg", b"Alice-1")
+            zf.writestr("Bob/1.jpg", b"Bob-1")
+            zf.writestr("Bob/employees.csv", "name,department,pin\nBob,Sales,9999\n")
+        with patch.object(api, 'SessionLocal', self.Session), \
+             patch.object(api.face_service, 'enroll_photos', side_effect=stub_enroll_photos):
+            response = self.client.post(
+                "/api/employees/bulk-enroll",
+                files={"file": ("employees.zip", buffer.getvalue(), "application/zip")}
+            )
+
+        summary = json.loads(response.text.splitlines()[-1])
+        self.assertEqual(summary["enrolled"], 2)
+        self.assertEqual(summary["ignored"], ["Bob/employees.csv"])
+
+class TestSettings(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=self.engine, tables=[SystemSettings.__table__])
+        self.Session = sessionmaker(bind=self.engine, autocommit=False, autoflush=False)
+        with self.Session() as db:
+            db.add(SystemSettings(key="auto_log_cooldown", value="60"))
+            embedding_store.bump_generation(db)
+            db.commit()
+
+        app = FastAPI()
+        app.include_router(api.router, prefix="/api")
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        app.dependency_overrides[api.get_db] = get_db
+        self.client = TestClient(app)
+
+    def test_gallery_generation_is_not_exposed(self):
+        key = embedding_store.GENERATION_KEY
+        keys = [s["key"] for s in self.client.get("/api/settings/").json()]
+        self.assertEqual(keys, ["auto_log_cooldown"])
+        self.assertEqual(self.client.get(f"/api/settings/{key}").status_code, 403)
+        self.assertEqual(self.client.delete(f"/api/settings/{key}").status_code, 403)
+        response = self.client.post("/api/settings/", data={"key": key, "value": "1"})
+        self.assertEqual(response.status_code, 403)
+
+        with self.Session() as db:
+            self.assertEqual(embedding_store.gallery_generation(db), 1)
+        # Regular settings are unaffected
+        self.assertEqual(self.client.get("/api/settings/auto_log_cooldown").json()["value"], "60")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,498 @@
+
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+import pickle
+import sys
+import os
+
+# Add backend to path
+sys.path.append(os.path.abspath("backend"))
+
+# We need to mock insightface before importing face_service because it initializes FaceAnalysis in __init__
+with patch('insightface.app.FaceAnalysis'):
+    from app.services.face_service import FaceService
+    from app import embedding_format
+
+def make_employee(emp_id, name, embeddings, encode=pickle.dumps):
+    emp = MagicMock()
+    emp.id = emp_id
+    emp.name = name
+    for i in range(1, 7):
+        emb = embeddings[i - 1] if i <= len(embeddings) else None
+        setattr(emp, f'embedding{i}', encode(emb) if emb is not None else None)
+    return emp
+
+def load_employees(service, emps):
+    """load_embeddings without a database: employees -> (employee_id, blob) rows"""
+    rows = [(emp.id, getattr(emp, f'embedding{i}')) for emp in emps for i in range(1, 7)
+            if getattr(emp, f'embedding{i}') is not None]
+    service.load_gallery(rows, {emp.id: emp.name for emp in emps})
+
+class TestGallery(unittest.TestCase):
+    def setUp(self):
+        with patch('insightface.app.FaceAnalysis'):
+            self.service = FaceService()
+            self.service.app = MagicMock()
+        self.rng = np.random.default_rng(0)
+
+    def random_embeddings(self, n):
+        return [self.rng.normal(size=512).astype(np.float32) * 7 for _ in range(n)]
+
+    def test_load_builds_normalized_matrix(self):
+        emps = [
+            make_employee(1, "Alice", self.random_embeddings(6)),
+            make_employee(2, "Bob", self.random_embeddings(3)),
+        ]
+        load_employees(self.service, emps)
+
+        matrix = self.service.gallery_matrix
+        self.assertEqual(matrix.shape, (9, 512))
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertTrue(matrix.flags['C_CONTIGUOUS'])
+        np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-5)
+        self.assertEqual(self.service.gallery_ids.dtype, np.int32)
+        self.assertEqual(self.service.gallery_ids.tolist(), [1] * 6 + [2] * 3)
+        self.assertEqual(self.service.employee_names, {1: "Alice", 2: "Bob"})
+
+    def test_recognize_matches_gallery(self):
+        alice = self.random_embeddings(6)
+        load_employees(self.service, [
+            make_employee(1, "Alice", alice),
+            make_employee(2, "Bob", self.random_embeddings(6)),
+        ])
+
+        bboxes = np.array([[220, 220, 420, 420, 0.9]], dtype=np.float32)
+        kpss = np.array([[[280, 300], [360, 300], [320, 340], [290, 380], [350, 380]]], dtype=np.float32)
+        self.service.app.det_model.detect.return_value = (bboxes, kpss)
+        rec_model = MagicMock()
+        rec_model.input_size = (112, 112)
+        rec_model.get_feat.return_value = (alice[2] * 3)[None, :]
+        self.service.app.models = {'recognition': rec_model}
+
+        frame = np.zeros((640, 640, 3), dtype=np.uint8)
+        results = self.service.recognize_faces(frame)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["employee_id"], 1)
+        self.assertEqual(results[0]["name"], "Alice")
+        self.assertAlmostEqual(results[0]["confidence"], 1.0, places=4)
+
+    def test_upsert_and_remove_employee(self):
+        load_employees(self.service, [
+            make_employee(1, "Alice", self.random_embeddings(6)),
+            make_employee(2, "Bob", self.random_embeddings(6)),
+        ])
+        bob_rows = self.service.gallery_matrix[self.service.gallery_ids == 2].copy()
+
+        # Replace Alice with 2 new embeddings and a new name
+        alice = self.random_embeddings(2)
+        self.service.upsert_employee(1, "Alice B.", alice)
+        ids = self.service.gallery_ids
+        self.assertEqual(sorted(ids.tolist()), [1, 1] + [2] * 6)
+        self.assertEqual(self.service.employee_names[1], "Alice B.")
+        np.testing.assert_array_equal(self.service.gallery_matrix[ids == 2], bob_rows)
+        expected = alice[0] / np.linalg.norm(alice[0])
+        np.testing.assert_allclose(self.service.gallery_matrix[ids == 1][0], expected, rtol=1e-5)
+
+        # Add a new employee
+        self.service.upsert_employee(3, "Carol", self.random_embeddings(1))
+        self.assertEqual(len(self.service.gallery_ids), 9)
+
+        # Remove Bob
+        self.service.remove_employee(2)
+        self.assertNotIn(2, self.service.gallery_ids.tolist())
+        self.assertNotIn(2, self.service.employee_names)
+        self.assertEqual(self.service.gallery_matrix.shape, (3, 512))
+
+    def test_upsert_employees_batch(self):
+        load_employees(self.service, [make_employee(1, "Alice", self.random_embeddings(6))])
+
+        self.service.upsert_employees([
+            (1, "Alice", self.random_embeddings(2)),
+            (2, "Bob", self.random_embeddings(3)),
+            (3, "Carol", self.random_embeddings(1)),
+        ])
+
+        self.assertEqual(self.service.gallery_ids.tolist(), [1, 1, 2, 2, 2, 3])
+        self.assertEqual(self.service.employee_names, {1: "Alice", 2: "Bob", 3: "Carol"})
+        np.testing.assert_allclose(np.linalg.norm(self.service.gallery_matrix, axis=1), 1.0, rtol=1e-5)
+
+    def test_ann_index_above_threshold(self):
+        self.service.ann_min_gallery_size = 100
+        emps = [make_employee(i, f"Emp {i}", self.random_embeddings(6)) for i in range(1, 21)]
+        load_employees(self.service, emps[:10])
+        self.assertIsNone(self.service.ann_index)
+
+        load_employees(self.service, emps)
+        index = self.service.ann_index
+        self.assertIsNotNone(index)
+        self.assertEqual(index.size, 120)
+
+        # Every stored row finds itself
+        matrix = self.service.gallery_matrix
+        for row in range(0, 120, 7):
+            idxs, sims = index.search(matrix[row])
+            self.assertEqual(idxs[0], row)
+            self.assertAlmostEqual(float(sims[0]), 1.0, places=4)
+
+        # Patching the gallery reuses centroids and keeps ids consistent
+        new = self.random_embeddings(6)
+        self.service.upsert_employee(99, "New", new)
+        self.assertIs(self.service.ann_index.centroids, index.centroids)
+        query = new[3] / np.linalg.norm(new[3])
+        idxs, _ = self.service.ann_index.search(query.astype(np.float32))
+        self.assertEqual(self.service.gallery_ids[idxs[0]], 99)
+
+        self.service.remove_employee(99)
+        self.service.ann_min_gallery_size = 1000
+        self.service.remove_employee(1)
+        self.assertIsNone(self.service.ann_index)
+
+    def test_replace_embedding_updates_one_row(self):
+        alice, bob = self.random_embeddings(6), self.random_embeddings(6)
+        self.service.ann_min_gallery_size = 1
+        load_employees(self.service, [make_employee(1, "Alice", alice), make_employee(2, "Bob", bob)])
+        before = self.service.gallery_matrix
+        before_copy = before.copy()
+
+        new = self.random_embeddings(1)[0]
+        self.assertTrue(self.service.replace_embedding(1, alice[2], new))
+
+        after = self.service.gallery_matrix
+        self.assertIsNot(after, before)
+        np.testing.assert_array_equal(before, before_copy)  # Readers of the old matrix are unaffected
+        changed = np.flatnonzero(np.any(after != before, axis=1))
+        self.assertEqual(changed.tolist(), [2])
+        np.testing.assert_allclose(after[2], new / np.linalg.norm(new), rtol=1e-5)
+
+        # The IVF index finds the new vector and no longer holds the old one
+        self.service.ann_index.nprobe = self.service.ann_index.nlist
+        rows, sims = self.service.ann_index.search(after[2], k=1)
+        self.assertEqual(rows[0], 2)
+        rows, sims = self.service.ann_index.search(before[2], k=1)
+        self.assertLess(sims[0], 0.99)
+
+        self.assertFalse(self.service.replace_embedding(99, new, new))
+
+    def test_index_training_does_not_hold_gallery_lock(self):
+        import threading
+        from app.services.ann_index import IVFIndex
+        self.service.ann_min_gallery_size = 10
+        alice = self.random_embeddings(6)
+        load_employees(self.service, [make_employee(1, "Alice", alice)])
+
+        training, release = threading.Event(), threading.Event()
+        train_centroids = IVFIndex.train_centroids.__func__
+
+        def slow_training(cls, *args, **kwargs):
+            training.set()
+            release.wait(5)
+            return train_centroids(cls, *args, **kwargs)
+
+        with patch.object(IVFIndex, 'train_centroids', classmethod(slow_training)):
+            # Crosses ANN_MIN_GALLERY_SIZE: k-means on the new gallery
+            writer = threading.Thread(target=self.service.upsert_employee, args=(2, "Bob", self.random_embeddings(6)))
+            writer.start()
+            self.assertTrue(training.wait(5))
+
+            # Other writers are not blocked meanwhile
+            self.assertTrue(self.service.gallery_lock.acquire(timeout=1))
+            self.service.gallery_lock.release()
+            new = self.random_embeddings(1)[0]
+            self.assertTrue(self.service.replace_embedding(1, alice[0], new))
+            release.set()
+            writer.join(5)
+
+        # Both updates made it, and the index covers the final gallery
+        gallery = self.service.gallery
+        self.assertEqual(sorted(gallery.ids.tolist()), [1] * 6 + [2] * 6)
+        self.assertEqual(dict(gallery.names), {1: "Alice", 2: "Bob"})
+        new_row = new / np.linalg.norm(new)
+        self.assertTrue(np.any(np.all(np.isclose(gallery.matrix, new_row, atol=1e-6), axis=1)))
+        self.assertEqual(gallery.ann_index.size, 12)
+        gallery.ann_index.nprobe = gallery.ann_index.nlist
+        for row in range(12):
+            self.assertEqual(gallery.ann_index.search(gallery.matrix[row])[0][0], row)
+
+    def test_gallery_is_immutable(self):
+        load_employees(self.service, [make_employee(1, "Alice", self.random_embeddings(2))])
+        gallery = self.service.gallery
+        with self.assertRaises(AttributeError):
+            gallery.ids = np.zeros(0, dtype=np.int32)
+        with self.assertRaises(ValueError):
+            gallery.matrix[0, 0] = 1.0
+        with self.assertRaises(TypeError):
+            gallery.names[2] = "Bob"
+
+        # Writers publish a new Gallery; the one a reader holds stays as it was
+        self.service.upsert_employee(2, "Bob", self.random_embeddings(3))
+        self.assertIsNot(self.service.gallery, gallery)
+        self.assertEqual(len(gallery), 2)
+        self.assertEqual(dict(gallery.names), {1: "Alice"})
+        self.assertEqual(len(self.service.gallery), 5)
+
+    def test_readers_see_consistent_gallery_during_reloads(self):
+        import threading
+        galleries = [[make_employee(i, f"Emp {i}", self.random_embeddings(i % 4 + 1)) for i in range(1, n)]
+                     for n in (3, 8, 15)]
+        stop = threading.Event()
+
+        def reload():
+            i = 0
+            while not stop.is_set():
+                load_employees(self.service, galleries[i % len(galleries)])
+                i += 1
+
+        writer = threading.Thread(target=reload)
+        writer.start()
+        try:
+            for _ in range(2000):
+                gallery = self.service.gallery
+                self.assertEqual(gallery.matrix.shape[0], len(gallery.ids))
+                self.assertTrue(set(gallery.ids.tolist()) <= set(gallery.names))
+        finally:
+            stop.set()
+            writer.join()
+
+    def test_raw_and_legacy_blobs_load_identically(self):
+        embeddings = self.random_embeddings(6)
+        raw = make_employee(1, "Alice", embeddings, encode=embedding_format.encode_embedding)
+        load_employees(self.service, [raw])
+        from_raw = self.service.gallery_matrix.copy()
+
+        load_employees(self.service, [make_employee(1, "Alice", embeddings)])
+        np.testing.assert_array_equal(self.service.gallery_matrix, from_raw)
+
+        # Mixed rows during the transition
+        load_employees(self.service, [raw, make_employee(2, "Bob", self.random_embeddings(2))])
+        self.assertEqual(self.service.gallery_matrix.shape, (8, 512))
+        np.testing.assert_array_equal(self.service.gallery_matrix[:6], from_raw)
+
+    def test_embedding_format_roundtrip(self):
+        emb = self.random_embeddings(1)[0]
+        blob = embedding_format.encode_embedding(emb)
+
+        self.assertEqual(len(blob), embedding_format.HEADER.size + 512 * 4)
+        self.assertTrue(embedding_format.is_raw(blob))
+        self.assertFalse(embedding_format.is_raw(pickle.dumps(emb)))
+        np.testing.assert_array_equal(embedding_format.decode_embedding(blob), emb)
+        with self.assertRaises(ValueError):
+            embedding_format.decode_embedding(blob[:-4])
+
+    def test_load_from_embedding_table(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.database import Base
+        from app.models import Employee, FaceEmbedding, SystemSettings
+        from app.services import embedding_store
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine, tables=[
+            Employee.__table__, FaceEmbedding.__table__, SystemSettings.__table__
+        ])
+        db = sessionmaker(bind=engine)()
+        db.add_all([Employee(id=1, name="Alice"), Employee(id=2, name="Bob")])
+        alice, bob = self.random_embeddings(3), self.random_embeddings(2)
+        embedding_store.save_embeddings(db, 1, {slot: embedding_format.encode_embedding(e) for slot, e in enumerate(alice, 1)})
+        embedding_store.save_embeddings(db, 2, {4: embedding_format.encode_embedding(bob[0])})
+        db.commit()
+
+        # Replacing a slot keeps one row per (employee, slot)
+        embedding_store.save_embeddings(db, 2, {4: embedding_format.encode_embedding(bob[1])})
+        db.commit()
+        self.assertEqual(list(embedding_store.employee_embeddings(db, 2)), [4])
+        self.assertEqual(embedding_store.gallery_generation(db), 3)
+
+        self.service.load_embeddings(db)
+        self.assertEqual(self.service.gallery_ids.tolist(), [1, 1, 1, 2])
+        self.assertEqual(self.service.employee_names, {1: "Alice", 2: "Bob"})
+        np.testing.assert_allclose(self.service.gallery_matrix[3], bob[1] / np.linalg.norm(bob[1]), rtol=1e-5)
+
+        embedding_store.delete_embeddings(db, 1)
+        db.commit()
+        self.service.load_embeddings(db)
+        self.assertEqual(self.service.gallery_ids.tolist(), [2])
+        db.close()
+
+    def test_generation_bumps_in_one_transaction(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.database import Base
+        from app.models import Employee, FaceEmbedding, SystemSettings
+        from app.services import embedding_store
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine, tables=[
+            Employee.__table__, FaceEmbedding.__table__, SystemSettings.__table__
+        ])
+        # Same session settings as SessionLocal (no autoflush)
+        db = sessionmaker(bind=engine, autoflush=False)()
+        blob = embedding_format.encode_embedding(self.random_embeddings(1)[0])
+        embedding_store.save_embeddings(db, 1, {1: blob})
+        embedding_store.save_embeddings(db, 2, {1: blob})
+        db.commit()
+
+        self.assertEqual(embedding_store.gallery_generation(db), 2)
+        self.assertEqual(db.query(SystemSettings).count(), 1)
+        db.close()
+
+    def test_employee_blobs_are_deferred(self):
+        from sqlalchemy import create_engine, event
+        from sqlalchemy.orm import sessionmaker
+        from app.database import Base
+        from app.models import Employee
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine, tables=[Employee.__table__])
+        db = sessionmaker(bind=engine)()
+        db.add(Employee(name="Alice", photo1=b"jpeg", embedding1=b"blob"))
+        db.commit()
+        db.expunge_all()
+
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+        emp = db.query(Employee).first()
+        self.assertEqual(emp.name, "Alice")
+        self.assertNotIn("photo", statements[-1])
+        self.assertNotIn("embedding", statements[-1])
+
+        # First access loads the photo group only
+        self.assertEqual(emp.photo1, b"jpeg")
+        self.assertIn("photo6", statements[-1])
+        self.assertNotIn("embedding", statements[-1])
+        db.close()
+
+    def test_empty_gallery(self):
+        load_employees(self.service, [])
+        self.assertEqual(self.service.gallery_matrix.shape, (0, 512))
+        self.assertEqual(len(self.service.gallery_ids), 0)
+
+class TestGallerySnapshot(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.database import Base
+        from app.models import Employee, FaceEmbedding, SystemSettings
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.snapshot_dir = os.path.join(self.tmp.name, "snapshot")
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}")
+        Base.metadata.create_all(bind=self.engine, tables=[
+            Employee.__table__, FaceEmbedding.__table__, SystemSettings.__table__
+        ])
+        self.Session = sessionmaker(bind=self.engine)
+        self.rng = np.random.default_rng(0)
+        with self.Session() as db:
+            for emp_id in (1, 2, 3):
+                self.add_employee(db, emp_id, f"Emp {emp_id}")
+            db.commit()
+
+    def tearDown(self):
+        import gc
+        gc.collect()  # Release the memory maps before the files are removed
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def add_employee(self, db, emp_id, name):
+        from app.models import Employee
+        from app.services import embedding_store
+        db.add(Employee(id=emp_id, name=name))
+        embeddings = self.rng.normal(size=(3, 512)).astype(np.float32)
+        embedding_store.save_embeddings(db, emp_id, {
+            slot: embedding_format.encode_embedding(e) for slot, e in enumerate(embeddings, 1)
+        })
+
+    def make_service(self):
+        with patch('insightface.app.FaceAnalysis'):
+            service = FaceService(pool=MagicMock())
+        service.ann_min_gallery_size = 5
+        return service
+
+    def test_first_start_saves_snapshot(self):
+        from app.services import gallery_snapshot
+        service = self.make_service()
+        service.open_gallery(self.Session, self.snapshot_dir)
+        self.assertEqual(len(service.gallery_ids), 9)
+
+        snapshot = gallery_snapshot.load(self.snapshot_dir)
+        self.assertIsInstance(snapshot["matrix"], np.memmap)
+        np.testing.assert_array_equal(snapshot["matrix"], service.gallery_matrix)
+        np.testing.assert_array_equal(snapshot["ids"], service.gallery_ids)
+        self.assertEqual(snapshot["names"], {1: "Emp 1", 2: "Emp 2", 3: "Emp 3"})
+
+        # The mapped IVF index answers like the one it was saved from
+        query = service.gallery_matrix[4]
+        np.testing.assert_array_equal(snapshot["ann_index"].search(query, k=3)[0],
+                                      service.ann_index.search(query, k=3)[0])
+
+    def test_current_snapshot_skips_database(self):
+        self.make_service().open_gallery(self.Session, self.snapshot_dir)
+
+        service = self.make_service()
+        with patch.object(service, 'refresh_gallery') as refresh:
+            service.open_gallery(self.Session, self.snapshot_dir)
+        refresh.assert_not_called()
+        self.assertIsInstance(service.gallery_matrix, np.memmap)
+        self.assertEqual(len(service.gallery_ids), 9)
+
+    def test_stale_snapshot_is_served_then_refreshed(self):
+        from app.services import embedding_store
+        self.make_service().open_gallery(self.Session, self.snapshot_dir)
+        with self.Session() as db:
+            self.add_employee(db, 4, "Emp 4")
+            embedding_store.delete_embeddings(db, 1)
+            db.commit()
+
+        service = self.make_service()
+        with patch('threading.Thread') as thread:
+            service.open_gallery(self.Session, self.snapshot_dir)
+        # Old gallery served until the background reload has run
+        self.assertEqual(sorted(set(service.gallery_ids.tolist())), [1, 2, 3])
+        self.assertEqual(thread.call_args.kwargs["target"], service.refresh_gallery)
+
+        service.refresh_gallery()
+        self.assertEqual(sorted(set(service.gallery_ids.tolist())), [2, 3, 4])
+        restarted = self.make_service()
+        with patch.object(restarted, 'refresh_gallery') as refresh:
+            restarted.open_gallery(self.Session, self.snapshot_dir)
+        refresh.assert_not_called()
+        self.assertEqual(restarted.employee_names[4], "Emp 4")
+
+    def test_reset_generation_does_not_validate_old_snapshot(self):
+        from app.models import SystemSettings
+        from app.services import embedding_store, gallery_snapshot
+        self.make_service().open_gallery(self.Session, self.snapshot_dir)
+        generation = gallery_snapshot.load(self.snapshot_dir)["generation"]
+
+        # Same row count and, after the counter was reset, the same generation
+        with self.Session() as db:
+            db.query(SystemSettings).filter(
+                SystemSettings.key == embedding_store.GENERATION_KEY
+            ).delete()
+            embedding_store.delete_embeddings(db, 1)
+            self.add_employee(db, 4, "Emp 4")
+            db.query(SystemSettings).filter(
+                SystemSettings.key == embedding_store.GENERATION_KEY
+            ).update({"value": str(generation)})
+            db.commit()
+            self.assertEqual(embedding_store.gallery_generation(db), generation)
+            self.assertEqual(embedding_store.gallery_size(db), 9)
+
+        service = self.make_service()
+        with patch('threading.Thread') as thread:
+            service.open_gallery(self.Session, self.snapshot_dir)
+        self.assertEqual(thread.call_args.kwargs["target"], service.refresh_gallery)
+
+    def test_live_change_schedules_refresh(self):
+        service = self.make_service()
+        service.open_gallery(self.Session, self.snapshot_dir)
+        with patch.object(service, 'refresh_gallery') as refresh:
+            service.snapshot_delay = 0
+            service.remove_employee(1)
+            service.close_gallery()
+        self.assertTrue(refresh.called)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import sys
+import os
+
+# Add backend to path
+sys.path.append(os.path.abspath("backend"))
+
+import quantize_models
+from app import model_quantization
+
+
+class StubDetector:
+    """Same detect() signature as insightface's RetinaFace"""
+    def detect(self, img, input_size=None, max_num=0, metric='default'):
+        assert input_size is None or len(input_size) == 2
+        h, w = img.shape[:2]
+        bboxes = np.array([[w * 0.25, h * 0.25, w * 0.75, h * 0.75, 0.9]], dtype=np.float32)
+        return bboxes, np.zeros((1, 5, 2), dtype=np.float32)
+
+
+class StubRecognizer:
+    input_size = (112, 112)
+
+    def __init__(self, noise):
+        self.noise = noise
+
+    def get_feat(self, crops):
+        # Embedding from the crop content, plus a precision-dependent perturbation
+        feats = np.stack([np.resize(crop.astype(np.float32).ravel(), 512) for crop in crops])
+        return feats + self.noise
+
+
+class StubFaceAnalysis:
+    def __init__(self, noise=0.0):
+        self.det_model = StubDetector()
+        self.models = {'recognition': StubRecognizer(noise)}
+
+
+class TestQuantizationReport(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.photos = [
+            (emp_id, rng.integers(0, 256, (112, 112, 3), dtype=np.uint8))
+            for emp_id in (1, 1, 2, 2)
+        ]
+
+    def test_run_models(self):
+        embeddings, rec_ms, det_ms, det_scores = quantize_models.run_models(StubFaceAnalysis(), self.photos)
+
+        self.assertEqual(embeddings.shape, (4, 512))
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-5)
+        self.assertEqual(len(rec_ms), 4)
+        self.assertEqual(len(det_ms), 4)
+        np.testing.assert_allclose(det_scores, 0.9, rtol=1e-6)
+
+    def test_report(self):
+        models = {'fp32': StubFaceAnalysis(), 'int8': StubFaceAnalysis(noise=1.0)}
+        with patch.object(quantize_models.face_pipeline, 'create_face_analysis',
+                          side_effect=lambda threads, precision: models[precision]):
+            result = quantize_models.report(self.photos, threads=1)
+
+        self.assertEqual(result["photos"], 4)
+        self.assertEqual(result["employees"], 2)
+        self.assertGreater(result["embedding_cosine_fp32_vs_int8"]["min"], 0.99)
+        self.assertEqual(result["det_score_abs_diff_mean"], 0.0)
+        self.assertNotIn("recorded_frames", result)
+
+    def test_report_on_recorded_frames(self):
+        frames = [np.full((480, 640, 3), v, dtype=np.uint8) for v in (40, 90, 160)]
+        models = {'fp32': StubFaceAnalysis(), 'int8': StubFaceAnalysis(noise=1.0)}
+        with patch.object(quantize_models.face_pipeline, 'create_face_analysis',
+                          side_effect=lambda threads, precision: models[precision]):
+            result = quantize_models.report(self.photos, threads=1, frames=frames)
+
+        recorded = result["recorded_frames"]
+        self.assertEqual(recorded["frames"], 3)
+        self.assertEqual(recorded["faces"], {"fp32": 3, "int8": 3, "matched": 3})
+        self.assertEqual(recorded["recall"], 1.0)
+        self.assertAlmostEqual(recorded["matched_iou_mean"], 1.0, places=4)
+
+    def test_compare_detections(self):
+        reference = [np.array([[0, 0, 100, 100, 0.9], [200, 200, 300, 300, 0.8]], dtype=np.float32)]
+        # First face found slightly shifted, second missed, one spurious box
+        candidate = [np.array([[5, 0, 105, 100, 0.7], [400, 400, 450, 450, 0.6]], dtype=np.float32)]
+
+        result = quantize_models.compare_detections(reference, candidate)
+
+        self.assertEqual(result["faces"], {"fp32": 2, "int8": 2, "matched": 1})
+        self.assertEqual(result["recall"], 0.5)
+        self.assertEqual(result["precision"], 0.5)
+        self.assertAlmostEqual(result["matched_score_abs_diff_mean"], 0.2, places=4)
+
+class TestCalibration(unittest.TestCase):
+    def test_detector_calibrated_on_recorded_frames(self):
+        import tempfile
+        photos = [np.zeros((112, 112, 3), dtype=np.uint8)] * 4
+        frames = [np.full((480, 640, 3), 200, dtype=np.uint8)] * 2
+        calls = []
+        with tempfile.TemporaryDirectory() as root, \
+             patch.object(model_quantization, '_quantize', side_effect=lambda src, dst, blobs: calls.append(blobs)):
+            model_quantization.quantize_buffalo_l(photos, root=root, frames=frames)
+
+        rec_blobs, det_blobs = calls
+        self.assertEqual(len(rec_blobs), 4)
+        self.assertEqual(len(det_blobs), 2)
+        # Letterboxed like SCRFD.detect: the 640x480 frame fills the top 480 rows
+        blob = det_blobs[0][0]
+        self.assertEqual(blob.shape, (3, 640, 640))
+        self.assertAlmostEqual(float(blob[:, 479].mean()), (200 - 127.5) / 128, places=4)
+        self.assertAlmostEqual(float(blob[:, 480].mean()), -127.5 / 128, places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
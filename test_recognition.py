@@ -0,0 +1,554 @@
+
+import unittest
+from unittest.mock import MagicMock, patch
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import threading
+import time
+import numpy as np
+import sys
+import os
+
+# Add backend to path
+sys.path.append(os.path.abspath("backend"))
+
+# We need to mock insightface before importing face_service because it initializes FaceAnalysis in __init__
+with patch('insightface.app.FaceAnalysis'):
+    from app.services.face_service import FaceService
+    from app.services.model_pool import FaceAnalysisPool
+    from app.services.face_tracker import FaceTracker
+    from app.services.motion_gate import MotionGate
+    from app.services.metrics import MetricsRegistry
+    from app.services.inference_workers import InferenceWorkerPool
+    from app import face_pipeline
+    from insightface.utils import face_align
+    from app import embedding_format
+
+# 5 keypoints for a face box (x1, y1, x2, y2): eyes, nose, mouth corners
+def make_kps(x1, y1, x2, y2):
+    w, h = x2 - x1, y2 - y1
+    return np.array([
+        [x1 + 0.3 * w, y1 + 0.4 * h],
+        [x1 + 0.7 * w, y1 + 0.4 * h],
+        [x1 + 0.5 * w, y1 + 0.6 * h],
+        [x1 + 0.35 * w, y1 + 0.8 * h],
+        [x1 + 0.65 * w, y1 + 0.8 * h],
+    ], dtype=np.float32)
+
+def make_detections(boxes):
+    bboxes = np.array([list(b) + [0.9] for b in boxes], dtype=np.float32).reshape(-1, 5)
+    kpss = np.array([make_kps(*b) for b in boxes], dtype=np.float32).reshape(-1, 5, 2)
+    return bboxes, kpss
+
+class TestRecognitionPipeline(unittest.TestCase):
+    def setUp(self):
+        with patch('insightface.app.FaceAnalysis'):
+            self.service = FaceService()
+            self.service.app = MagicMock()
+
+        self.rec_model = MagicMock()
+        self.rec_model.input_size = (112, 112)
+        self.rec_model.get_feat.side_effect = lambda crops: np.ones((len(crops), 512), dtype=np.float32)
+        self.service.app.models = {'recognition': self.rec_model}
+
+        emb = np.ones(512, dtype=np.float32)
+        self.service.upsert_employee(7, "Alice", [emb])
+
+    def test_recognize_batch_embeds_once(self):
+        frame = np.full((640, 640, 3), 128, dtype=np.uint8)
+        detections = [
+            make_detections([(220, 220, 420, 420)]),
+            make_detections([]),
+            make_detections([(220, 220, 420, 420), (200, 240, 400, 440)]),
+        ]
+        self.service.app.det_model.detect.side_effect = detections
+
+        results = self.service.recognize_batch([frame, frame, frame])
+
+        self.assertEqual(self.rec_model.get_feat.call_count, 1)
+        self.assertEqual(len(self.rec_model.get_feat.call_args[0][0]), 3)
+        self.assertEqual([len(r) for r in results], [1, 0, 2])
+        self.assertEqual(results[0][0]["employee_id"], 7)
+        self.assertEqual(results[2][1]["name"], "Alice")
+
+    def test_filtered_faces_are_not_embedded(self):
+        frame = np.full((640, 640, 3), 128, dtype=np.uint8)
+        self.service.app.det_model.detect.return_value = make_detections([
+            (220, 220, 420, 420),  # centered, large enough
+            (10, 10, 60, 60),      # too small
+            (500, 20, 630, 150),   # off-center
+        ])
+
+        results = self.service.recognize_faces(frame)
+
+        self.assertEqual(self.rec_model.get_feat.call_count, 1)
+        self.assertEqual(len(self.rec_model.get_feat.call_args[0][0]), 1)
+        self.assertEqual([r["name"] for r in results], ["Alice", "Positioning..."])
+
+    def test_register_embeds_aligned_crop_directly(self):
+        import cv2
+        frame = np.random.RandomState(2).randint(0, 256, (640, 640, 3)).astype(np.uint8)
+        _, encoded = cv2.imencode('.jpg', frame)
+        self.service.app.det_model.detect.return_value = make_detections([(220, 220, 420, 420)])
+        self.rec_model.get_feat.side_effect = lambda crops: np.full((len(crops), 512), 0.5, dtype=np.float32)
+
+        processed, emb_blob = self.service.register_face(encoded.tobytes())
+
+        self.service.app.get.assert_not_called()
+        self.assertEqual(self.service.app.det_model.detect.call_count, 1)
+        crops = self.rec_model.get_feat.call_args[0][0]
+        self.assertEqual([c.shape for c in crops], [(112, 112, 3)])
+        np.testing.assert_array_equal(embedding_format.decode_embedding(emb_blob), np.full(512, 0.5, dtype=np.float32))
+        self.assertIsNotNone(processed)
+
+    def test_enroll_photos_single_pass(self):
+        import cv2
+        frame = np.random.RandomState(3).randint(0, 256, (640, 640, 3)).astype(np.uint8)
+        content = cv2.imencode('.jpg', frame)[1].tobytes()
+        detections = [make_detections([(220, 220, 420, 420)])] * 5 + [
+            make_detections([(220, 220, 420, 420), (100, 100, 200, 200)])
+        ]
+        self.service.app.det_model.detect.side_effect = detections
+
+        enrolled = self.service.enroll_photos([(content, i == 2) for i in range(1, 7)])
+
+        self.assertEqual(self.service.app.det_model.detect.call_count, 6)
+        self.assertEqual(self.rec_model.get_feat.call_count, 1)
+        self.assertEqual(len(self.rec_model.get_feat.call_args[0][0]), 5)
+        self.assertTrue(all(p is not None and e is not None and q is None for p, e, q in enrolled[:5]))
+        self.assertEqual(enrolled[5][:2], (None, None))
+        self.assertIn("Multiple faces", enrolled[5][2])
+
+    def test_enroll_rejects_invalid_and_small_images(self):
+        import cv2
+        small = cv2.imencode('.jpg', np.zeros((100, 100, 3), dtype=np.uint8))[1].tobytes()
+
+        enrolled = self.service.enroll_photos([(b"not an image", False), (small, False)])
+
+        self.assertEqual(enrolled[0][2], "Invalid image format")
+        self.assertTrue(enrolled[1][2].startswith("Image too small"))
+        self.service.app.det_model.detect.assert_not_called()
+
+    def test_roi_detection_maps_back_to_frame(self):
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        # Detector sees the ROI crop; a face at (100, 50) in crop coordinates
+        self.service.app.det_model.detect.return_value = make_detections([(100, 50, 300, 250)])
+
+        faces = self.service.detect([frame], roi=True)[0]
+
+        crop = self.service.app.det_model.detect.call_args[0][0]
+        x1, y1, x2, y2 = face_pipeline.centered_roi(1280, 720)
+        self.assertEqual(crop.shape[:2], (y2 - y1, x2 - x1))
+        # Same scale as the full frame at 640 (0.5), rounded up to the stride
+        self.assertEqual(self.service.app.det_model.detect.call_args[1]["input_size"], (448, 256))
+        np.testing.assert_allclose(faces[0].bbox, [100 + x1, 50 + y1, 300 + x1, 250 + y1])
+        np.testing.assert_allclose(faces[0].kps, make_kps(100, 50, 300, 250) + [x1, y1])
+
+class TestFaceTracking(unittest.TestCase):
+    def setUp(self):
+        with patch('insightface.app.FaceAnalysis'):
+            self.service = FaceService()
+            self.service.app = MagicMock()
+
+        self.rec_model = MagicMock()
+        self.rec_model.input_size = (112, 112)
+        self.rec_model.get_feat.side_effect = lambda crops: np.ones((len(crops), 512), dtype=np.float32)
+        self.service.app.models = {'recognition': self.rec_model}
+        self.service.upsert_employee(7, "Alice", [np.ones(512, dtype=np.float32)])
+        # Textured frame: sharp enough to be a best shot straight away
+        self.frame = np.random.RandomState(0).randint(0, 256, (640, 640, 3)).astype(np.uint8)
+        self.blurry = np.full((640, 640, 3), 128, dtype=np.uint8)
+
+    def test_confirmed_track_is_not_re_embedded(self):
+        tracker = FaceTracker(refresh_interval=60)
+        # Same person drifting slightly over three frames
+        self.service.app.det_model.detect.side_effect = [
+            make_detections([(220, 220, 420, 420)]),
+            make_detections([(230, 225, 430, 425)]),
+            make_detections([(240, 230, 440, 430)]),
+        ]
+
+        results = [self.service.recognize_tracked(self.frame, tracker) for _ in range(3)]
+
+        self.assertEqual(self.rec_model.get_feat.call_count, 1)
+        self.assertEqual([r[0]["name"] for r in results], ["Alice"] * 3)
+        self.assertEqual(len({r[0]["track_id"] for r in results}), 1)
+        self.assertEqual(results[2][0]["bbox"], [240, 230, 440, 430])
+
+    def test_reused_identity_is_flagged_cached(self):
+        tracker = FaceTracker(refresh_interval=60, kps_threshold=1.0, best_shot_frames=1)
+        self.service.app.det_model.detect.side_effect = [
+            make_detections([(200, 270, 300, 370)]),
+            # Moved too fast for the boxes to overlap enough: associated by keypoints
+            make_detections([(280, 270, 380, 370)]),
+        ]
+
+        first, second = (self.service.recognize_tracked(self.frame, tracker) for _ in range(2))
+
+        self.assertEqual(self.rec_model.get_feat.call_count, 1)
+        self.assertEqual(first[0]["track_id"], second[0]["track_id"])
+        # Only the frame actually matched may be auto-logged
+        self.assertFalse(first[0]["cached"])
+        self.assertTrue(second[0]["cached"])
+        self.assertEqual(second[0]["employee_id"], 7)
+
+    def test_new_and_unknown_tracks_are_recognized(self):
+        tracker = FaceTracker(refresh_interval=60)
+        self.rec_model.get_feat.side_effect = lambda crops: -np.ones((len(crops), 512), dtype=np.float32)
+        self.service.app.det_model.detect.return_value = make_detections([(220, 220, 420, 420)])
+
+        self.service.recognize_tracked(self.frame, tracker)
+        self.service.recognize_tracked(self.frame, tracker)
+
+        # Unknown stays unconfirmed, so it is embedded on every frame
+        self.assertEqual(self.rec_model.get_feat.call_count, 2)
+
+    def test_stale_track_is_refreshed(self):
+        tracker = FaceTracker(refresh_interval=0)
+        self.service.app.det_model.detect.return_value = make_detections([(220, 220, 420, 420)])
+
+        self.service.recognize_tracked(self.frame, tracker)
+        self.service.recognize_tracked(self.frame, tracker)
+
+        self.assertEqual(self.rec_model.get_feat.call_count, 2)
+
+    def test_best_shot_is_embedded(self):
+        tracker = FaceTracker(refresh_interval=60, best_shot_frames=3, good_quality=1.01)
+        self.service.app.det_model.detect.return_value = make_detections([(220, 220, 420, 420)])
+        frames = [self.blurry, self.frame, self.blurry]
+        self.service.normalize_image = lambda img, max_dim=1280: img
+
+        results = [self.service.recognize_tracked(f, tracker) for f in frames]
+
+        # Nothing is shown while collecting; the sharp frame is the one embedded
+        self.assertEqual([len(r) for r in results], [0, 0, 1])
+        self.assertEqual(self.rec_model.get_feat.call_count, 1)
+        crop = self.rec_model.get_feat.call_args[0][0][0]
+        self.assertGreater(crop.std(), 10)
+
+    def test_detect_on_preview_embed_from_full_frame(self):
+        import cv2
+        tracker = FaceTracker(refresh_interval=60)
+        full = cv2.resize(self.frame, (1280, 1280), interpolation=cv2.INTER_NEAREST)
+        preview = np.zeros((640, 640, 3), dtype=np.uint8)  # Flat: a crop from it would be blank
+        self.service.app.det_model.detect.return_value = make_detections([(220, 220, 420, 420)])
+
+        results = self.service.recognize_tracked(preview, tracker, full_frame=full)
+
+        self.assertIs(self.service.app.det_model.detect.call_args[0][0], preview)
+        crop = self.rec_model.get_feat.call_args[0][0][0]
+        self.assertGreater(crop.std(), 10)
+        self.assertEqual(results[0]["name"], "Alice")
+        np.testing.assert_allclose(results[0]["bbox"], [220, 220, 420, 420])
+        np.testing.assert_allclose(results[0]["keypoints"], make_kps(220, 220, 420, 420), rtol=1e-5)
+
+    def test_full_frame_with_other_aspect_ratio(self):
+        import cv2
+        tracker = FaceTracker(refresh_interval=60)
+        # 4:3 capture (640x480) with a 16:9 preview (640x360): same width, taller full frame
+        full = cv2.resize(self.frame, (640, 480), interpolation=cv2.INTER_NEAREST)
+        preview = np.zeros((360, 640, 3), dtype=np.uint8)
+        self.service.app.det_model.detect.return_value = make_detections([(220, 90, 420, 270)])
+
+        with patch.object(self.service, 'embed', wraps=self.service.embed) as embed:
+            results = self.service.recognize_tracked(preview, tracker, full_frame=full)
+
+        # Faces are cropped from the full frame at y * 480/360; results are back in preview pixels
+        shot_frame, shot_face = embed.call_args[0][0][0]
+        self.assertEqual(shot_frame.shape[:2], (480, 640))
+        np.testing.assert_allclose(shot_face.bbox, [220, 120, 420, 360], rtol=1e-5)
+        np.testing.assert_allclose(shot_face.kps, make_kps(220, 120, 420, 360), rtol=1e-5)
+        np.testing.assert_allclose(results[0]["bbox"], [220, 90, 420, 270], rtol=1e-5)
+        np.testing.assert_allclose(results[0]["keypoints"], make_kps(220, 90, 420, 270), rtol=1e-5)
+
+        face = face_pipeline.face_from_dict({
+            "bbox": np.array([220, 90, 420, 270], dtype=np.float32), "kps": make_kps(220, 90, 420, 270)
+        })
+        scaled = face_pipeline.scale_face(face, 2.0, 480 / 360)
+        np.testing.assert_allclose(scaled.bbox, [440, 120, 840, 360], rtol=1e-5)
+        np.testing.assert_allclose(scaled.kps[:, 1], face.kps[:, 1] * 480 / 360, rtol=1e-5)
+
+    def test_face_quality_penalizes_profile(self):
+        frontal = face_pipeline.face_from_dict({
+            "bbox": np.array([220, 220, 420, 420], dtype=np.float32),
+            "kps": make_kps(220, 220, 420, 420),
+        })
+        profile = face_pipeline.face_from_dict({
+            "bbox": frontal.bbox,
+            "kps": frontal.kps.copy(),
+        })
+        profile.kps[2, 0] += 60  # Nose far toward one eye
+
+        self.assertGreater(face_pipeline.face_quality(self.frame, frontal), 0.8)
+        self.assertLess(face_pipeline.face_quality(self.frame, profile), 0.3)
+        self.assertEqual(face_pipeline.face_quality(self.blurry, frontal), 0.0)
+
+class TestLiveness(unittest.TestCase):
+    def test_vectorized_liveness_matches_opencv(self):
+        import cv2
+        rng = np.random.RandomState(1)
+        crops = np.stack([
+            cv2.GaussianBlur(rng.randint(0, 256, (112, 112, 3)).astype(np.uint8), (k, k), 0)
+            for k in (1, 3, 7)
+        ])
+
+        scores = face_pipeline.texture_liveness(crops)
+
+        for crop, score in zip(crops, scores):
+            lap_var = cv2.Laplacian(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), cv2.CV_64F)[1:-1, 1:-1].var()
+            sat_std = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)[..., 1].std()
+            low, high = face_pipeline.LIVENESS_SHARPNESS_LOW, face_pipeline.LIVENESS_SHARPNESS_HIGH
+            sharp = (lap_var - low) / (high - low) if lap_var > low else lap_var / low
+            expected = 0.7 * min(1.0, sharp) + 0.3 * min(1.0, sat_std / face_pipeline.LIVENESS_SATURATION_STD)
+            self.assertAlmostEqual(float(score), min(1.0, expected), delta=0.02)
+
+    def test_blurred_close_up_scores_below_sharp_faces(self):
+        import cv2
+        # 1/f texture: natural-image spectrum, same statistics at every face size
+        rng = np.random.RandomState(2)
+        freq = np.sqrt(np.fft.fftfreq(800)[:, None] ** 2 + np.fft.fftfreq(800)[None, :] ** 2)
+        freq[0, 0] = 1
+        texture = np.real(np.fft.ifft2(np.fft.fft2(rng.normal(size=(800, 800))) / freq))
+        texture = (texture - texture.mean()) / texture.std()
+        frame = np.clip(150 + 30 * texture[..., None] + rng.normal(0, 4, (800, 800, 3)), 0, 255).astype(np.uint8)
+        # Same frame as a print / screen replay: blurred at capture resolution
+        blurred = cv2.GaussianBlur(frame, (0, 0), 1.5)
+
+        def face(width):
+            kps = (face_align.arcface_dst - 56) * (width / 95) + 400
+            return face_pipeline.Face(bbox=np.array([400 - width / 2, 400 - width / 2, 400 + width / 2,
+                                                     400 + width / 2], dtype=np.float32), kps=kps)
+
+        small, close_up = face(100), face(360)
+        sharp_scores = face_pipeline.liveness_scores(frame, [small, close_up])
+        blurred_scores = face_pipeline.liveness_scores(blurred, [small, close_up])
+
+        # Shrinking the close-up must not hide its blur
+        self.assertLess(blurred_scores[1], 0.5)  # Strict matching threshold, no adaptive update
+        self.assertLess(blurred_scores.max(), sharp_scores.min())
+        self.assertAlmostEqual(float(sharp_scores[0]), float(sharp_scores[1]), delta=0.1)
+
+    def test_grayscale_crop_gets_neutral_color_score(self):
+        with patch('insightface.app.FaceAnalysis'):
+            service = FaceService()
+        flat = np.full((200, 200), 128, dtype=np.uint8)
+        self.assertAlmostEqual(service.calculate_texture_liveness(flat), 0.15, places=5)
+
+    def test_liveness_without_faces(self):
+        frame = np.zeros((360, 640, 3), dtype=np.uint8)
+        self.assertEqual(face_pipeline.liveness_scores(frame, []).shape, (0,))
+
+class TestMotionGate(unittest.TestCase):
+    def setUp(self):
+        self.scene = np.full((360, 640, 3), 90, dtype=np.uint8)
+        self.person = self.scene.copy()
+        self.person[100:300, 250:400] = 220
+
+    def test_static_scene_is_skipped(self):
+        gate = MotionGate(sensitivity=50, idle_refresh=60)
+        self.assertTrue(gate.should_run(self.scene, now=0))
+        self.assertFalse(gate.should_run(self.scene, now=0.4))
+        self.assertFalse(gate.should_run(self.scene + 3, now=0.8))  # Sensor noise / light drift
+
+    def test_motion_tracking_and_idle_refresh_open_the_gate(self):
+        gate = MotionGate(sensitivity=50, idle_refresh=60)
+        gate.should_run(self.scene, now=0)
+        self.assertTrue(gate.should_run(self.person, now=0.4))
+        self.assertFalse(gate.should_run(self.person, now=0.8))
+        self.assertTrue(gate.should_run(self.person, tracking=True, now=1.2))
+        self.assertTrue(gate.should_run(self.person, now=61.3))
+
+    def test_sensitivity_zero_disables_gate(self):
+        gate = MotionGate(sensitivity=0, idle_refresh=60)
+        self.assertTrue(all(gate.should_run(self.scene, now=t) for t in range(5)))
+
+class TestModelPool(unittest.TestCase):
+    def test_checkout_hands_out_distinct_instances(self):
+        pool = FaceAnalysisPool(["a", "b"])
+        with pool.checkout() as first:
+            with pool.checkout() as second:
+                self.assertEqual({first, second}, {"a", "b"})
+                self.assertTrue(pool._free.empty())
+        self.assertEqual(pool._free.qsize(), 2)
+
+    def test_models_load_on_first_use(self):
+        with patch.object(FaceAnalysisPool, 'create', return_value=FaceAnalysisPool([MagicMock()])) as create:
+            service = FaceService()
+            create.assert_not_called()
+            self.assertIs(service.load_models(), service.pool)
+            service.pool
+        create.assert_called_once()
+
+    def test_recognition_uses_pooled_instance(self):
+        with patch('insightface.app.FaceAnalysis'):
+            service = FaceService()
+        busy, free = MagicMock(), MagicMock()
+        free.det_model.detect.return_value = make_detections([])
+        service.pool = FaceAnalysisPool([busy, free])
+
+        with service.pool.checkout():
+            service.recognize_faces(np.zeros((640, 640, 3), dtype=np.uint8))
+
+        busy.det_model.detect.assert_not_called()
+        free.det_model.detect.assert_called_once()
+
+class TestInferenceWorkers(unittest.TestCase):
+    """InferenceWorkerPool served by a worker thread instead of a spawned process"""
+    def setUp(self):
+        # Stub models: one face per frame, embedding = mean pixel value of the crop
+        self.app = MagicMock()
+        self.app.det_model.detect.side_effect = lambda img, **kw: make_detections([(100, 100, 300, 300)])
+        rec_model = MagicMock()
+        rec_model.input_size = (112, 112)
+        rec_model.get_feat.side_effect = lambda crops: np.array(
+            [np.full(512, crop.mean(), dtype=np.float32) for crop in crops])
+        self.app.models = {'recognition': rec_model}
+
+        self.pool = InferenceWorkerPool(0, n_slots=2, slot_bytes=640 * 640 * 3, timeout=0.5)
+        self.worker = None
+
+    def tearDown(self):
+        if self.worker is not None:
+            self.pool.tasks.put(None)
+            self.worker.join(timeout=5)
+        self.pool.stop()
+
+    def start_worker(self):
+        self.worker = threading.Thread(
+            target=face_pipeline.serve_tasks,
+            args=(self.app, self.pool.slots, self.pool.tasks, self.pool.results),
+            daemon=True
+        )
+        self.worker.start()
+
+    def test_run_task_ops(self):
+        frame = np.full((640, 640, 3), 7, dtype=np.uint8)
+
+        detected = face_pipeline.run_task(self.app, "detect", [frame])
+        self.assertEqual(len(detected), 1)
+        self.assertIsNone(detected[0][0]["embedding"])
+
+        embedded = face_pipeline.run_task(self.app, "detect_and_embed", [frame, frame])
+        self.assertEqual([len(faces) for faces in embedded], [1, 1])
+        self.assertEqual(embedded[0][0]["embedding"].shape, (512,))
+
+        kps = make_kps(100, 100, 300, 300)
+        self.assertEqual(face_pipeline.run_task(self.app, "embed", [frame], [(0, kps), (0, kps)]).shape, (2, 512))
+
+        crops = [np.full((112, 112, 3), v, dtype=np.uint8) for v in (10, 20)]
+        np.testing.assert_allclose(face_pipeline.run_task(self.app, "embed_aligned", crops)[:, 0], [10, 20])
+
+        with self.assertRaises(ValueError):
+            face_pipeline.run_task(self.app, "unknown", [frame])
+
+    def test_submit_round_trip_frees_slots(self):
+        self.start_worker()
+        crops = [np.full((112, 112, 3), v, dtype=np.uint8) for v in (10, 20, 30)]
+
+        # 3 frames over 2 slots: split into two tasks
+        faces = self.pool.detect(crops)
+        self.assertEqual(len(faces), 3)
+        np.testing.assert_allclose(self.pool.embed_aligned(crops[:2])[:, 0], [10, 20])
+        self.assertEqual(self.pool._free_slots.qsize(), 2)
+
+        with self.assertRaises(RuntimeError):
+            self.pool._submit("unknown", crops[:1])
+        self.assertEqual(self.pool._free_slots.qsize(), 2)
+
+    def test_expired_task_is_skipped_and_its_slots_released(self):
+        crop = np.full((112, 112, 3), 10, dtype=np.uint8)
+        with self.assertRaises(FutureTimeoutError):
+            self.pool.embed_aligned([crop])
+        # Still queued: the slot stays reserved until a worker has answered
+        self.assertEqual(self.pool._free_slots.qsize(), 1)
+
+        time.sleep(0.1)
+        self.start_worker()
+        deadline = time.time() + 5
+        while self.pool._free_slots.qsize() < 2 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.pool._free_slots.qsize(), 2)
+        self.app.models['recognition'].get_feat.assert_not_called()
+        # Later requests are not stuck behind it
+        np.testing.assert_allclose(self.pool.embed_aligned([crop])[:, 0], [10])
+
+    def test_unanswered_request_expires(self):
+        # No worker at all, as after a crash: the request must not hold its slot forever
+        crop = np.full((112, 112, 3), 10, dtype=np.uint8)
+        with self.assertRaises(FutureTimeoutError):
+            self.pool.embed_aligned([crop])
+        self.assertEqual(self.pool._free_slots.qsize(), 1)
+
+        self.pool._expire_pending(now=time.time() + 2 * self.pool.timeout)
+
+        self.assertEqual(self.pool._free_slots.qsize(), 2)
+        self.assertEqual(self.pool._pending, {})
+
+    def test_slot_acquisition_times_out(self):
+        held = self.pool._acquire_slots(2)
+        started = time.time()
+        with self.assertRaises(TimeoutError):
+            self.pool._acquire_slots(1)
+        self.assertLess(time.time() - started, 2 * self.pool.timeout)
+        self.pool._release_slots(held)
+        self.assertEqual(self.pool._free_slots.qsize(), 2)
+
+    def test_dead_worker_is_restarted(self):
+        dead = MagicMock()
+        dead.is_alive.return_value = False
+        with patch.object(self.pool, '_start_worker', return_value=MagicMock()) as start:
+            self.pool._started = [0.0]
+            self.pool.processes = [dead]
+            self.pool._check_workers()
+            start.assert_called_with(0)
+            self.assertIs(self.pool.processes[0], start.return_value)
+            self.pool.processes = []
+
+class TestMetrics(unittest.TestCase):
+    def test_stage_histogram_and_camera_counters_render(self):
+        registry = MetricsRegistry(window=10)
+        registry.observe("detection", 0.02)
+        registry.observe("detection", 3.0)
+        registry.count(1, "captured", 5)
+        registry.count(1, "dropped", -1)  # Same frame as last time: nothing to count
+
+        text = registry.render()
+
+        self.assertIn('face_stage_duration_seconds_bucket{pipeline="api",stage="detection",le="0.025"} 1', text)
+        self.assertIn('face_stage_duration_seconds_bucket{pipeline="api",stage="detection",le="+Inf"} 2', text)
+        self.assertIn('face_stage_duration_seconds_count{pipeline="api",stage="detection"} 2', text)
+        self.assertIn('face_stage_recent_seconds_count{pipeline="api",stage="detection"} 2', text)
+        self.assertIn('camera_frames_captured_total{camera="1"} 5', text)
+        self.assertIn('camera_frames_dropped_total{camera="1"} 0', text)
+
+    def test_pipeline_label_and_rolling_window(self):
+        import contextvars
+        from app.services import metrics as metrics_module
+        registry = MetricsRegistry(window=3)
+
+        def camera_loop():
+            metrics_module.pipeline.set("camera")
+            for _ in range(5):
+                with registry.timer("total"):
+                    pass
+        contextvars.copy_context().run(camera_loop)
+
+        self.assertEqual(list(registry.histograms), [("camera", "total")])
+        self.assertEqual(registry.histograms[("camera", "total")].count, 5)
+        self.assertEqual(len(registry.histograms[("camera", "total")].recent), 3)
+
+    def test_recognize_faces_records_stages(self):
+        from app.services.metrics import metrics
+        with patch('insightface.app.FaceAnalysis'):
+            service = FaceService()
+        model = MagicMock()
+        model.det_model.detect.return_value = make_detections([])
+        service.pool = FaceAnalysisPool([model])
+        metrics.reset()
+
+        service.recognize_faces(np.zeros((640, 640, 3), dtype=np.uint8))
+
+        self.assertEqual({stage for _, stage in metrics.histograms}, {"detection"})
+
+if __name__ == '__main__':
+    unittest.main()